@@ -1,16 +1,34 @@
 # app.py
 import os
-from flask import Flask, render_template, request, jsonify
+import json
+import hmac
+import time
+import signal
+import threading
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import pandas as pd 
 import config
-from semantic_search_service import SemanticSearcher
+from semantic_search_service import SemanticSearcher, SEARCH_MODES
+from metadata_filters import FILTROS, FILTROS_DE_DATA, normalizar_filtros
+from prompt_builder import montar_contexto
 from llm_service import EnriquecedorLLM
+from llm_resilience import LLMIndisponivelError
+from batching_encoder import FilaDeEncodeCheiaError
+import metrics
+from metrics import cronometro, registrar_requisicao, FALLBACKS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 app = Flask(__name__)
 
 search_service = None
 llm_service = None
 resources_fully_loaded = False
+reload_lock = threading.Lock()
+ultimo_reload = {'status': 'nunca_executado'}
 
 def load_all_resources():
     global search_service, llm_service, resources_fully_loaded
@@ -45,10 +63,147 @@ def load_all_resources():
         resources_fully_loaded = False
 
 
+def memoria_mb():
+    """(pico de RSS do processo, RSS atual) em MB; None onde a plataforma não informa."""
+    pico = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1) if resource else None
+    atual = None
+    try:
+        with open('/proc/self/statm') as f:
+            atual = round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024.0 * 1024.0), 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    return pico, atual
+
+def recarregar_busca():
+    """
+    Monta um novo SemanticSearcher (store, campos e índice) reaproveitando o encoder e o cache de consultas
+    do atual, e só então troca a referência global. Requisições em andamento terminam no snapshot antigo.
+    Devolve o relatório do reload, ou None se já havia um em andamento.
+    """
+    global search_service, resources_fully_loaded, ultimo_reload
+    if not reload_lock.acquire(blocking=False):
+        return None
+    try:
+        antigo = search_service
+        inicio = time.perf_counter()
+        pico_antes, _ = memoria_mb()
+        ultimo_reload = {'status': 'em_andamento', 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        print("--- Reload dos recursos de busca iniciado ---")
+        try:
+            novo = SemanticSearcher(query_cache=antigo.query_cache if antigo else None,
+                                    model=antigo.model if antigo else None,
+                                    reranker=antigo.reranker if antigo else None)
+            erro = None if novo.is_ready else 'Semantic Search Service não pôde ser inicializado.'
+        except Exception as e:
+            novo, erro = None, str(e)
+        pico_depois, rss_depois = memoria_mb()
+
+        relatorio = {
+            'status': 'ok' if erro is None else 'erro',
+            'duration_s': round(time.perf_counter() - inicio, 3),
+            'maxrss_mb_before': pico_antes,
+            'maxrss_mb_after': pico_depois,
+            'rss_mb_after': rss_depois,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        if erro is None:
+            search_service = novo
+            resources_fully_loaded = True
+            if antigo:
+                antigo.parar_observador()
+            relatorio.update(rows=novo.dataset_len, revision=novo.snapshot.revision, checksum=novo.embeddings_checksum)
+            print(f" Reload concluído em {relatorio['duration_s']}s ({novo.dataset_len} linhas; pico de RSS {pico_depois} MB).")
+        else:
+            # Mantém o snapshot anterior servindo
+            if novo is not None:
+                novo.parar_observador()
+            relatorio['error'] = erro
+            print(f"‼ Reload falhou ({erro}); o snapshot anterior continua ativo.")
+        ultimo_reload = relatorio
+        return relatorio
+    finally:
+        reload_lock.release()
+
+def iniciar_reload_em_background():
+    if reload_lock.locked():
+        return False
+    threading.Thread(target=recarregar_busca, name='reload-busca', daemon=True).start()
+    return True
+
+def instalar_sinal_de_reload():
+    """
+    SIGHUP dispara um reload em background (só é possível na thread principal, fora do Windows).
+    No gunicorn o sinal deve ir aos PIDs dos workers: um HUP no master reinicia os workers em vez de trocar o snapshot.
+    """
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: iniciar_reload_em_background())
+    except ValueError:
+        print(" Sinal SIGHUP não instalado (fora da thread principal).")
+
+def admin_autorizado(headers):
+    token = headers.get(config.ADMIN_TOKEN_HEADER, '')
+    return bool(config.ADMIN_TOKEN) and hmac.compare_digest(token, config.ADMIN_TOKEN)
+
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def montar_contexto_llm(user_query, resultados_semanticos, orcamento_tokens=None):
+    """(contexto, relatório de tokens) montados por prompt_builder dentro do orçamento da requisição."""
+    return montar_contexto(user_query, resultados_semanticos, orcamento_tokens)
+
+def campos_do_prompt(relatorio):
+    # O relatório do prompt vai na linha amostrada do log da requisição (metrics.registrar_requisicao), não num print por requisição
+    return {key: relatorio[key] for key in ('prompt_tokens', 'unbudgeted_tokens', 'hits_deduplicated', 'fields_truncated')}
+
+def orcamento_do_prompt(dados):
+    """Orçamento de tokens do contexto vindo do formulário ('prompt_budget_tokens'): (valor ou None, erro ou None)."""
+    valor = dados.get('prompt_budget_tokens') if dados is not None else None
+    if valor in (None, ''):
+        return None, None
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None, ("'prompt_budget_tokens' deve ser um inteiro.", 400)
+    if valor <= 0:
+        return None, ("'prompt_budget_tokens' deve ser positivo.", 400)
+    return valor, None
+
+def montar_resposta_fallback(resultados_semanticos):
+    if not resultados_semanticos:
+        return "Nenhuma jurisprudência encontrada para esta consulta."
+    resposta_final = "O assistente LLM não está disponível. Seguem os resultados da busca simples:\n\n"
+    for i, res in enumerate(resultados_semanticos):
+        resposta_final += f"**Resultado {i+1} (Similaridade: {res.get('similaridade_busca', 0):.2f})**\n"
+        for key, value in res.items():
+            if key not in ['texto_original', 'similaridade_busca', 'id_linha', 'id_nota'] and value != "N/A" and value:
+                 resposta_final += f"  {key.replace('_', ' ').capitalize()}: {value}\n"
+        if res.get('referencia'):
+            resposta_final += f"  Referência: [{res.get('referencia')}]({res.get('referencia')})\n" 
+        resposta_final += "\n"
+    return resposta_final
+
+def argumentos_cache_llm(user_query, resultados_semanticos, headers, namespace):
+    # `namespace` é lido antes da busca: se o snapshot mudar no meio, a resposta só cai numa chave que ninguém mais consulta
+    query_embedding = None
+    if llm_service.response_cache is not None and llm_service.response_cache.near_threshold is not None:
+        query_embedding = search_service.embed_query(user_query)
+    return {
+        'consulta': user_query,
+        'ids_resultados': [res['id_linha'] for res in resultados_semanticos],
+        'query_embedding': query_embedding,
+        'usar_cache': headers.get(config.CACHE_BYPASS_HEADER, '').lower() not in ('1', 'true', 'yes'),
+        'namespace': namespace,
+    }
+
+def evento_sse(dados, evento=None):
+    linha_evento = f"event: {evento}\n" if evento else ""
+    return f"{linha_evento}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
 @app.route('/get_response', methods=['POST'])
 def get_chat_response():
     if not resources_fully_loaded or not search_service or not search_service.is_ready:
@@ -57,59 +212,287 @@ def get_chat_response():
     user_query = request.form.get('query')
     if not user_query:
         return jsonify({'error': 'Nenhuma pergunta fornecida.'}), 400
+    parametros, erro = parametros_de_busca(request.form)
+    if not erro:
+        orcamento_tokens, erro = orcamento_do_prompt(request.form)
+    if erro:
+        return jsonify({'error': erro[0]}), erro[1]
 
+    inicio, tempos = time.perf_counter(), {}
     try:
-        resultados_semanticos = search_service.search(user_query, top_k=config.TOP_K_SEMANTIC_SEARCH)
-
-        contexto_para_llm = f"Pergunta do Usuário: \"{user_query}\"\n\n"
-        if not resultados_semanticos:
-            contexto_para_llm += "Contexto das Jurisprudências Encontradas: Nenhuma jurisprudência específica foi encontrada pela busca inicial para esta pergunta."
-        else:
-            contexto_para_llm += "Contexto das Jurisprudências Encontradas (analise e use para formular sua resposta):\n"
-            for i, res in enumerate(resultados_semanticos):
-                contexto_para_llm += f"\n--- Jurisprudência {i+1} (Score de Similaridade com a pergunta: {res.get('similaridade_busca', 0):.3f}) ---\n"
-                contexto_para_llm += f"Diagnóstico: {res.get('diagnóstico', 'Não informado')}\n"
-                contexto_para_llm += f"Conclusão: {res.get('conclusão', 'Não informado')}\n"
-                contexto_para_llm += f"Justificativa: {res.get('justificativa', 'Não informado')}\n"
-                contexto_para_llm += f"CID: {res.get('cid', 'Não informado')}\n"
-                contexto_para_llm += f"Princípio Ativo: {res.get('princípio ativo', 'Não informado')}\n"
-                contexto_para_llm += f"Nome Comercial: {res.get('nome comercial', 'Não informado')}\n"
-                contexto_para_llm += f"Descrição: {res.get('descrição', 'Não informado')}\n"
-                contexto_para_llm += f"Tipo da Tecnologia: {res.get('tipo da tecnologia', 'Não informado')}\n"
-                contexto_para_llm += f"Órgão: {res.get('órgão', 'Não informado')}\n"
-                contexto_para_llm += f"Serventia: {res.get('serventia', 'Não informado')}\n"
-                if res.get('referencia'):
-                    contexto_para_llm += f"Referência da Nota Técnica: {res.get('referencia')}\n"
-        
-        print(f"\n--- CONTEXTO COMPLETO PARA LLM ---\n{contexto_para_llm}\n--------------------------------\n")
+        namespace = search_service.namespace
+        with cronometro('search', tempos):
+            resultados_semanticos = search_service.search(user_query, top_k=config.TOP_K_SEMANTIC_SEARCH, **parametros)
+        with cronometro('prompt_build', tempos):
+            contexto_para_llm, relatorio_prompt = montar_contexto_llm(user_query, resultados_semanticos, orcamento_tokens)
 
+        status_cache = None
+        resposta_final = None
+        fallback = None
         if llm_service and llm_service.model_ready:
-            resposta_final = llm_service.gerar_resposta_enriquecida(contexto_para_llm)
+            try:
+                with cronometro('answer', tempos, observar=False):
+                    resposta_final, status_cache = llm_service.responder(
+                        contexto_para_llm, **argumentos_cache_llm(user_query, resultados_semanticos, request.headers, namespace))
+            except LLMIndisponivelError as e:
+                print(f" LLM indisponível ({e}). Usando fallback.")
+                fallback = 'llm_unavailable'
         else:
             print(" LLM Service não disponível ou não pronto. Usando fallback.")
-            resposta_final = "O assistente LLM não está disponível. Seguem os resultados da busca simples:\n\n"
-            if resultados_semanticos:
-                for i, res in enumerate(resultados_semanticos):
-                    resposta_final += f"**Resultado {i+1} (Similaridade: {res.get('similaridade_busca', 0):.2f})**\n"
-                    for key, value in res.items():
-                        if key not in ['texto_original', 'similaridade_busca'] and value != "N/A" and value:
-                             resposta_final += f"  {key.replace('_', ' ').capitalize()}: {value}\n"
-                    if res.get('referencia'):
-                        resposta_final += f"  Referência: [{res.get('referencia')}]({res.get('referencia')})\n" 
-                    resposta_final += "\n"
-            else:
-                resposta_final = "Nenhuma jurisprudência encontrada para esta consulta."
-        
-        return jsonify({'response': resposta_final, 'type': 'llm_response'})
+            fallback = 'llm_not_ready'
+        if resposta_final is None:
+            FALLBACKS.inc(reason=fallback)
+            resposta_final = montar_resposta_fallback(resultados_semanticos)
+        registrar_requisicao('/get_response', inicio, tempos, user_query, contexto_para_llm, hits=len(resultados_semanticos),
+                             **campos_do_prompt(relatorio_prompt), cache=status_cache, fallback=fallback)
 
+        resposta = jsonify({'response': resposta_final, 'type': 'llm_response', 'prompt': relatorio_prompt})
+        resposta.headers['X-Prompt-Tokens'] = str(relatorio_prompt['prompt_tokens'])
+        if status_cache:
+            resposta.headers['X-Cache'] = status_cache
+        return resposta
+
+    except FilaDeEncodeCheiaError as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         print(f" Erro geral na rota /get_response: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Ocorreu um erro crítico ao processar sua solicitação: {str(e)}'}), 500
 
+@app.route('/get_response/stream', methods=['POST'])
+def get_chat_response_stream():
+    """
+    Mesmo fluxo de /get_response, mas a resposta do LLM é enviada em partes via server-sent events:
+    'meta' (status do cache e relatório de tokens do prompt), vários 'data' com {"delta": ...}, e 'done' ou 'error' ao final.
+    """
+    if not resources_fully_loaded or not search_service or not search_service.is_ready:
+        return jsonify({'error': 'Serviço temporariamente indisponível (recursos de busca não carregados).'}), 503
+
+    user_query = request.form.get('query')
+    if not user_query:
+        return jsonify({'error': 'Nenhuma pergunta fornecida.'}), 400
+    parametros, erro = parametros_de_busca(request.form)
+    if not erro:
+        orcamento_tokens, erro = orcamento_do_prompt(request.form)
+    if erro:
+        return jsonify({'error': erro[0]}), erro[1]
+
+    def gerar_eventos():
+        inicio, tempos = time.perf_counter(), {}
+        try:
+            namespace = search_service.namespace
+            with cronometro('search', tempos):
+                resultados_semanticos = search_service.search(user_query, top_k=config.TOP_K_SEMANTIC_SEARCH, **parametros)
+            with cronometro('prompt_build', tempos):
+                contexto_para_llm, relatorio_prompt = montar_contexto_llm(user_query, resultados_semanticos, orcamento_tokens)
+
+            fallback = None
+            if llm_service and llm_service.model_ready:
+                status_cache, partes = llm_service.responder_stream(
+                    contexto_para_llm, **argumentos_cache_llm(user_query, resultados_semanticos, request.headers, namespace))
+            else:
+                print(" LLM Service não disponível ou não pronto. Usando fallback.")
+                fallback = 'llm_not_ready'
+                status_cache, partes = None, [montar_resposta_fallback(resultados_semanticos)]
+
+            yield evento_sse({'cache': status_cache, 'type': 'llm_response', 'prompt': relatorio_prompt}, evento='meta')
+            try:
+                with cronometro('answer', tempos, observar=False):
+                    for parte in partes:
+                        yield evento_sse({'delta': parte})
+            except LLMIndisponivelError as e:
+                # Só acontece antes do primeiro trecho: entrega a busca simples no lugar
+                print(f" LLM indisponível ({e}). Usando fallback.")
+                fallback = 'llm_unavailable'
+                yield evento_sse({'delta': montar_resposta_fallback(resultados_semanticos)})
+            if fallback:
+                FALLBACKS.inc(reason=fallback)
+            registrar_requisicao('/get_response/stream', inicio, tempos, user_query, contexto_para_llm, hits=len(resultados_semanticos),
+                                 **campos_do_prompt(relatorio_prompt), cache=status_cache, fallback=fallback)
+            yield evento_sse({}, evento='done')
+        except FilaDeEncodeCheiaError as e:
+            yield evento_sse({'error': str(e)}, evento='error')
+        except Exception as e:
+            print(f" Erro geral na rota /get_response/stream: {e}")
+            import traceback
+            traceback.print_exc()
+            yield evento_sse({'error': f'Ocorreu um erro crítico ao processar sua solicitação: {str(e)}'}, evento='error')
+
+    return Response(stream_with_context(gerar_eventos()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def parametros_de_busca(dados):
+    """Argumentos extras de SemanticSearcher.search vindos do formulário/JSON: (kwargs, None) ou (None, (mensagem, status_http))."""
+    dados = dados if dados is not None else {}
+    parametros = {}
+    mode = dados.get('mode')
+    if mode:
+        if mode not in SEARCH_MODES:
+            return None, (f"'mode' deve ser um de: {', '.join(SEARCH_MODES)}.", 400)
+        parametros['mode'] = mode
+
+    # Rerank com cross-encoder: 'rerank' liga/desliga por requisição; 'rerank_budget_ms' troca o orçamento
+    rerank = str(dados.get('rerank', '')).lower()
+    if rerank:
+        if rerank not in ('1', 'true', 'yes', '0', 'false', 'no'):
+            return None, ("'rerank' deve ser 1/true ou 0/false.", 400)
+        parametros['rerank'] = rerank in ('1', 'true', 'yes')
+    if dados.get('rerank_budget_ms') not in (None, ''):
+        try:
+            parametros['budget_ms'] = float(dados.get('rerank_budget_ms'))
+        except (TypeError, ValueError):
+            return None, ("'rerank_budget_ms' deve ser um número.", 400)
+
+    # Filtros de metadados: campos do formulário (repetidos para vários valores) ou chaves do JSON
+    filtros = {}
+    for campo in FILTROS:
+        if campo in FILTROS_DE_DATA or not hasattr(dados, 'getlist'):
+            valor = dados.get(campo)
+        else:
+            valor = dados.getlist(campo)
+        if valor:
+            filtros[campo] = valor
+    try:
+        filtros = normalizar_filtros(filtros)
+    except ValueError as e:
+        return None, (str(e), 400)
+    if filtros:
+        parametros['filtros'] = filtros
+    return parametros, None
+
+def validar_busca_em_lote(payload):
+    """Devolve (queries, top_k, None) ou (None, None, (mensagem, status_http))."""
+    payload = payload if isinstance(payload, dict) else {}
+    queries = payload.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return None, None, ("Envie 'queries' como uma lista não vazia de textos.", 400)
+    if len(queries) > config.MAX_BATCH_QUERIES:
+        return None, None, (f'Máximo de {config.MAX_BATCH_QUERIES} consultas por requisição.', 413)
+    try:
+        top_k = int(payload.get('top_k', config.TOP_K_SEMANTIC_SEARCH))
+    except (TypeError, ValueError):
+        return None, None, ("'top_k' deve ser um inteiro.", 400)
+    if top_k < 1:
+        return None, None, ("'top_k' deve ser maior que zero.", 400)
+    if top_k > config.MAX_BATCH_TOP_K:
+        return None, None, (f"'top_k' deve ser no máximo {config.MAX_BATCH_TOP_K}.", 400)
+    return queries, top_k, None
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    if not resources_fully_loaded or not search_service or not search_service.is_ready:
+        return jsonify({'error': 'Serviço temporariamente indisponível (recursos de busca não carregados).'}), 503
+
+    payload = request.get_json(silent=True)
+    queries, top_k, erro = validar_busca_em_lote(payload)
+    if not erro:
+        parametros, erro = parametros_de_busca(payload)
+    if erro:
+        return jsonify({'error': erro[0]}), erro[1]
+
+    inicio, tempos = time.perf_counter(), {}
+    try:
+        with cronometro('search_batch', tempos, observar=False):
+            resultados = search_service.search_batch(queries, top_k=top_k, **parametros)
+        registrar_requisicao('/search/batch', inicio, tempos, queries=len(queries))
+        return jsonify({'results': [{'query': q, 'results': r} for q, r in zip(queries, resultados)]})
+    except FilaDeEncodeCheiaError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        print(f" Erro geral na rota /search/batch: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Ocorreu um erro crítico ao processar a busca em lote: {str(e)}'}), 500
+
+def coletar_cache_stats():
+    stats = {}
+    if search_service and search_service.query_cache:
+        stats['query_cache'] = search_service.query_cache.stats()
+    if llm_service and llm_service.response_cache:
+        stats['llm_response_cache'] = llm_service.response_cache.stats()
+    return stats
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(coletar_cache_stats())
+
+def coletar_encoder_stats():
+    stats = {}
+    if search_service and hasattr(search_service.model, 'stats'):
+        stats = search_service.model.stats()
+    if search_service and search_service.reranker is not None:
+        stats['reranker'] = search_service.reranker.stats()
+    return stats
+
+@app.route('/encoder/stats', methods=['GET'])
+def encoder_stats():
+    return jsonify(coletar_encoder_stats())
+
+def coletar_llm_stats():
+    return llm_service.stats() if llm_service else {}
+
+@app.route('/llm/stats', methods=['GET'])
+def llm_stats():
+    """Estado do circuit breaker, retries/hedges/timeouts e latências das chamadas ao LLM."""
+    return jsonify(coletar_llm_stats())
+
+def metricas_de_estado():
+    """Gauges e contadores lidos dos stats já existentes (caches, encoder, rerank, LLM) no momento da coleta."""
+    linhas = metrics.familia('ready', 'gauge', 'Recursos de busca carregados (1) ou não (0).', [((), int(bool(resources_fully_loaded)))])
+    if search_service and search_service.is_ready:
+        linhas += metrics.familia('index_rows', 'gauge', 'Linhas no snapshot de busca ativo.', [((), search_service.dataset_len)])
+        linhas += metrics.familia('index_revision', 'gauge', 'Revisão do embedding store no snapshot ativo.',
+                                  [((), search_service.snapshot.revision)])
+    caches = coletar_cache_stats()
+    linhas += metrics.familia('cache_entries', 'gauge', 'Entradas em cada cache.',
+                              [((nome,), stats.get('size')) for nome, stats in caches.items()], ('cache',))
+    linhas += metrics.familia('cache_evictions_total', 'counter', 'Remoções por LRU/TTL em cada cache.',
+                              [((nome,), stats.get('evictions')) for nome, stats in caches.items()], ('cache',))
+    encoder = coletar_encoder_stats()
+    if 'batches' in encoder:
+        linhas += metrics.familia('encoder_queue_depth', 'gauge', 'Consultas na fila do micro-batching do encoder.', [((), encoder['queue_depth'])])
+        linhas += metrics.familia('encoder_batches_total', 'counter', 'Lotes processados pelo encoder.', [((), encoder['batches'])])
+        linhas += metrics.familia('encoder_rejected_total', 'counter', 'Consultas recusadas com a fila do encoder cheia.', [((), encoder['rejected'])])
+    if 'reranker' in encoder:
+        linhas += metrics.familia('rerank_total', 'counter', 'Buscas reranqueadas ou puladas por orçamento.',
+                                  [(('done',), encoder['reranker']['reranked']), (('skipped_budget',), encoder['reranker']['skipped_budget'])], ('result',))
+    llm = coletar_llm_stats()
+    if 'resilience' in llm:
+        resiliencia = llm['resilience']
+        eventos = ('calls', 'attempts', 'retries', 'timeouts', 'failures', 'hedges', 'hedges_won')
+        linhas += metrics.familia('llm_events_total', 'counter', 'Chamadas, tentativas, retries, timeouts, falhas e hedges do LLM.',
+                                  [((evento,), resiliencia[evento]) for evento in eventos], ('event',))
+        estado = resiliencia['breaker']['state']
+        linhas += metrics.familia('llm_breaker_state', 'gauge', 'Estado do circuit breaker do LLM (1 no estado atual).',
+                                  [((nome,), int(nome == estado)) for nome in ('closed', 'half_open', 'open')], ('state',))
+    if 'context_cache' in llm:
+        linhas += metrics.familia('llm_context_cache_active', 'gauge', 'Context cache da system instruction ativo.',
+                                  [((), int(llm['context_cache']['active']))])
+    return linhas
+
+@app.route('/metrics', methods=['GET'])
+def metrics_prometheus():
+    return Response(metrics.exposicao(metricas_de_estado), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/admin/reload', methods=['GET', 'POST'])
+def admin_reload():
+    if not admin_autorizado(request.headers):
+        return jsonify({'error': 'Não autorizado.'}), 403
+    if request.method == 'GET':
+        return jsonify(ultimo_reload)
+    if request.args.get('wait') in ('1', 'true'):
+        relatorio = recarregar_busca()
+        if relatorio is None:
+            return jsonify({'error': 'Já existe um reload em andamento.'}), 409
+        return jsonify(relatorio), 200 if relatorio['status'] == 'ok' else 500
+    if not iniciar_reload_em_background():
+        return jsonify({'error': 'Já existe um reload em andamento.'}), 409
+    return jsonify({'status': 'iniciado'}), 202
+
 if __name__ == '__main__':
     load_all_resources() 
+    instalar_sinal_de_reload()
     if not resources_fully_loaded:
         print("‼ ATENÇÃO: APLICAÇÃO INICIADA COM FALHA NO CARREGAMENTO DE RECURSOS ESSENCIAIS.")
     else:
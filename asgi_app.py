@@ -0,0 +1,255 @@
+# asgi_app.py
+"""
+Modo de serviço assíncrono (ASGI). As rotas são as mesmas do app Flask (app.py), mas:
+  - a busca semântica (encode + FAISS, CPU) roda em um executor de threads limitado;
+  - a chamada ao Gemini usa o cliente assíncrono do Vertex (generate_content_async),
+    então a espera pela rede não prende nenhuma thread.
+
+Produção: gunicorn -c gunicorn.conf.py asgi_app:app
+"""
+import time
+import asyncio
+import functools
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse, Response
+from starlette.routing import Route
+from starlette.templating import Jinja2Templates
+import config
+import app as webapp
+from batching_encoder import FilaDeEncodeCheiaError
+from llm_resilience import LLMIndisponivelError
+import metrics
+from metrics import cronometro, registrar_requisicao, FALLBACKS
+
+templates = Jinja2Templates(directory=config.TEMPLATES_DIR)
+search_executor = ThreadPoolExecutor(max_workers=config.ASGI_SEARCH_WORKERS, thread_name_prefix='busca')
+# Limita as buscas pendentes no executor; o excedente espera aqui, sem ocupar threads
+search_slots = asyncio.Semaphore(config.ASGI_SEARCH_MAX_PENDING)
+
+
+async def em_executor(func, *args):
+    async with search_slots:
+        return await asyncio.get_running_loop().run_in_executor(search_executor, func, *args)
+
+
+def servico_indisponivel():
+    return JSONResponse({'error': 'Serviço temporariamente indisponível (recursos de busca não carregados).'}, status_code=503)
+
+
+def recursos_prontos():
+    return webapp.resources_fully_loaded and webapp.search_service and webapp.search_service.is_ready
+
+
+async def home(request):
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def buscar_e_montar_contexto(request, user_query, parametros, orcamento_tokens, tempos):
+    search_service = webapp.search_service
+    busca = functools.partial(search_service.search, user_query, config.TOP_K_SEMANTIC_SEARCH, **parametros)
+    namespace = search_service.namespace
+    # Os tempos incluem a espera por uma vaga no executor
+    with cronometro('search', tempos):
+        resultados_semanticos = await em_executor(busca)
+    # A contagem de tokens (tokenizer local) é CPU: fora do event loop
+    with cronometro('prompt_build', tempos):
+        contexto_para_llm, relatorio_prompt = await em_executor(webapp.montar_contexto_llm, user_query, resultados_semanticos, orcamento_tokens)
+    argumentos_cache = None
+    if webapp.llm_service and webapp.llm_service.model_ready:
+        argumentos_cache = await em_executor(webapp.argumentos_cache_llm, user_query, resultados_semanticos, request.headers, namespace)
+    return resultados_semanticos, contexto_para_llm, relatorio_prompt, argumentos_cache
+
+
+async def get_chat_response(request):
+    if not recursos_prontos():
+        return servico_indisponivel()
+
+    form = await request.form()
+    user_query = form.get('query')
+    if not user_query:
+        return JSONResponse({'error': 'Nenhuma pergunta fornecida.'}, status_code=400)
+    parametros, erro = webapp.parametros_de_busca(form)
+    if not erro:
+        orcamento_tokens, erro = webapp.orcamento_do_prompt(form)
+    if erro:
+        return JSONResponse({'error': erro[0]}, status_code=erro[1])
+
+    inicio, tempos = time.perf_counter(), {}
+    try:
+        resultados_semanticos, contexto_para_llm, relatorio_prompt, argumentos_cache = await buscar_e_montar_contexto(
+                request, user_query, parametros, orcamento_tokens, tempos)
+
+        headers = {'X-Prompt-Tokens': str(relatorio_prompt['prompt_tokens'])}
+        resposta_final = status_cache = fallback = None
+        if argumentos_cache is not None:
+            try:
+                with cronometro('answer', tempos, observar=False):
+                    resposta_final, status_cache = await webapp.llm_service.responder_async(contexto_para_llm, **argumentos_cache)
+                headers['X-Cache'] = status_cache
+            except LLMIndisponivelError as e:
+                print(f" LLM indisponível ({e}). Usando fallback.")
+                fallback = 'llm_unavailable'
+        else:
+            print(" LLM Service não disponível ou não pronto. Usando fallback.")
+            fallback = 'llm_not_ready'
+        if resposta_final is None:
+            FALLBACKS.inc(reason=fallback)
+            resposta_final = webapp.montar_resposta_fallback(resultados_semanticos)
+        registrar_requisicao('/get_response', inicio, tempos, user_query, contexto_para_llm, hits=len(resultados_semanticos),
+                             **webapp.campos_do_prompt(relatorio_prompt), cache=status_cache, fallback=fallback)
+
+        return JSONResponse({'response': resposta_final, 'type': 'llm_response', 'prompt': relatorio_prompt}, headers=headers)
+
+    except FilaDeEncodeCheiaError as e:
+        return JSONResponse({'error': str(e)}, status_code=503)
+    except Exception as e:
+        print(f" Erro geral na rota /get_response (ASGI): {e}")
+        traceback.print_exc()
+        return JSONResponse({'error': f'Ocorreu um erro crítico ao processar sua solicitação: {str(e)}'}, status_code=500)
+
+
+async def get_chat_response_stream(request):
+    if not recursos_prontos():
+        return servico_indisponivel()
+
+    form = await request.form()
+    user_query = form.get('query')
+    if not user_query:
+        return JSONResponse({'error': 'Nenhuma pergunta fornecida.'}, status_code=400)
+    parametros, erro = webapp.parametros_de_busca(form)
+    if not erro:
+        orcamento_tokens, erro = webapp.orcamento_do_prompt(form)
+    if erro:
+        return JSONResponse({'error': erro[0]}, status_code=erro[1])
+
+    async def gerar_eventos():
+        inicio, tempos = time.perf_counter(), {}
+        try:
+            resultados_semanticos, contexto_para_llm, relatorio_prompt, argumentos_cache = await buscar_e_montar_contexto(
+                request, user_query, parametros, orcamento_tokens, tempos)
+            fallback = None
+            if argumentos_cache is not None:
+                status_cache, partes = webapp.llm_service.responder_stream_async(contexto_para_llm, **argumentos_cache)
+            else:
+                print(" LLM Service não disponível ou não pronto. Usando fallback.")
+                status_cache, partes = None, None
+                fallback = 'llm_not_ready'
+
+            yield webapp.evento_sse({'cache': status_cache, 'type': 'llm_response', 'prompt': relatorio_prompt}, evento='meta')
+            if partes is None:
+                yield webapp.evento_sse({'delta': webapp.montar_resposta_fallback(resultados_semanticos)})
+            else:
+                try:
+                    with cronometro('answer', tempos, observar=False):
+                        async for parte in partes:
+                            yield webapp.evento_sse({'delta': parte})
+                except LLMIndisponivelError as e:
+                    print(f" LLM indisponível ({e}). Usando fallback.")
+                    fallback = 'llm_unavailable'
+                    yield webapp.evento_sse({'delta': webapp.montar_resposta_fallback(resultados_semanticos)})
+            if fallback:
+                FALLBACKS.inc(reason=fallback)
+            registrar_requisicao('/get_response/stream', inicio, tempos, user_query, contexto_para_llm, hits=len(resultados_semanticos),
+                                 **webapp.campos_do_prompt(relatorio_prompt), cache=status_cache, fallback=fallback)
+            yield webapp.evento_sse({}, evento='done')
+        except FilaDeEncodeCheiaError as e:
+            yield webapp.evento_sse({'error': str(e)}, evento='error')
+        except Exception as e:
+            print(f" Erro geral na rota /get_response/stream (ASGI): {e}")
+            traceback.print_exc()
+            yield webapp.evento_sse({'error': f'Ocorreu um erro crítico ao processar sua solicitação: {str(e)}'}, evento='error')
+
+    return StreamingResponse(gerar_eventos(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def search_batch(request):
+    if not recursos_prontos():
+        return servico_indisponivel()
+
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    queries, top_k, erro = webapp.validar_busca_em_lote(payload)
+    if not erro:
+        parametros, erro = webapp.parametros_de_busca(payload)
+    if erro:
+        return JSONResponse({'error': erro[0]}, status_code=erro[1])
+
+    inicio, tempos = time.perf_counter(), {}
+    try:
+        busca = functools.partial(webapp.search_service.search_batch, queries, top_k, **parametros)
+        with cronometro('search_batch', tempos, observar=False):
+            resultados = await em_executor(busca)
+        registrar_requisicao('/search/batch', inicio, tempos, queries=len(queries))
+        return JSONResponse({'results': [{'query': q, 'results': r} for q, r in zip(queries, resultados)]})
+    except FilaDeEncodeCheiaError as e:
+        return JSONResponse({'error': str(e)}, status_code=503)
+    except Exception as e:
+        print(f" Erro geral na rota /search/batch (ASGI): {e}")
+        traceback.print_exc()
+        return JSONResponse({'error': f'Ocorreu um erro crítico ao processar a busca em lote: {str(e)}'}, status_code=500)
+
+
+async def cache_stats(request):
+    return JSONResponse(webapp.coletar_cache_stats())
+
+
+async def encoder_stats(request):
+    return JSONResponse(webapp.coletar_encoder_stats())
+
+
+async def llm_stats(request):
+    return JSONResponse(webapp.coletar_llm_stats())
+
+
+async def metrics_prometheus(request):
+    return Response(metrics.exposicao(webapp.metricas_de_estado), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def admin_reload(request):
+    if not webapp.admin_autorizado(request.headers):
+        return JSONResponse({'error': 'Não autorizado.'}, status_code=403)
+    if request.method == 'GET':
+        return JSONResponse(webapp.ultimo_reload)
+    if request.query_params.get('wait') in ('1', 'true'):
+        relatorio = await asyncio.to_thread(webapp.recarregar_busca)
+        if relatorio is None:
+            return JSONResponse({'error': 'Já existe um reload em andamento.'}, status_code=409)
+        return JSONResponse(relatorio, status_code=200 if relatorio['status'] == 'ok' else 500)
+    if not webapp.iniciar_reload_em_background():
+        return JSONResponse({'error': 'Já existe um reload em andamento.'}, status_code=409)
+    return JSONResponse({'status': 'iniciado'}, status_code=202)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await asyncio.to_thread(webapp.load_all_resources)
+    # No gunicorn o handler fica em cada worker: o SIGHUP tem de ir aos PIDs dos workers (o master reinicia todos)
+    webapp.instalar_sinal_de_reload()
+    if not webapp.resources_fully_loaded:
+        print("‼ ATENÇÃO: APLICAÇÃO INICIADA COM FALHA NO CARREGAMENTO DE RECURSOS ESSENCIAIS.")
+    else:
+        print(" Aplicação (ASGI) pronta para receber requisições.")
+    yield
+    search_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/get_response', get_chat_response, methods=['POST']),
+        Route('/get_response/stream', get_chat_response_stream, methods=['POST']),
+        Route('/search/batch', search_batch, methods=['POST']),
+        Route('/cache/stats', cache_stats, methods=['GET']),
+        Route('/encoder/stats', encoder_stats, methods=['GET']),
+        Route('/llm/stats', llm_stats, methods=['GET']),
+        Route('/metrics', metrics_prometheus, methods=['GET']),
+        Route('/admin/reload', admin_reload, methods=['GET', 'POST']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,122 @@
+# batching_encoder.py
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+
+class FilaDeEncodeCheiaError(RuntimeError):
+    """A fila do encoder atingiu ENCODER_QUEUE_DEPTH; a requisição deve ser rejeitada (503)."""
+
+
+class _Pedido:
+    __slots__ = ('textos', 'future', 'enfileirado_em')
+
+    def __init__(self, textos):
+        self.textos = textos
+        self.future = Future()
+        self.enfileirado_em = time.monotonic()
+
+
+class MicroBatchEncoder:
+    """
+    Agrupa chamadas concorrentes de encode em um único forward pass do SentenceTransformer.
+
+    Uma thread dedicada coleta pedidos por até `max_wait_ms` (contados a partir do primeiro pedido do lote)
+    ou até somar `max_batch` textos, roda um encode e devolve a cada chamador a sua fatia do resultado.
+    Pedidos que sozinhos já enchem um lote (ex.: busca em lote) vão direto para o modelo.
+    A interface é a mesma de `SentenceTransformer.encode`, então o SemanticSearcher não muda.
+    """
+
+    def __init__(self, model, max_batch=32, max_wait_ms=5.0, queue_depth=1024, latency_window=2048):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._fila = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._esperas_ms = deque(maxlen=latency_window)
+        self.lotes = 0
+        self.textos_processados = 0
+        self.rejeitados = 0
+        self._fechado = False
+        self._thread = threading.Thread(target=self._loop, name='micro-batch-encoder', daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        # tokenizer, get_sentence_embedding_dimension etc. vêm do modelo original
+        return getattr(self.model, name)
+
+    def encode(self, sentences, normalize_embeddings=True, batch_size=None, **kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], normalize_embeddings, batch_size, **kwargs)[0]
+        if kwargs or not normalize_embeddings or len(sentences) >= self.max_batch or self._fechado:
+            return self.model.encode(sentences, normalize_embeddings=normalize_embeddings, batch_size=batch_size or 32, **kwargs)
+
+        pedido = _Pedido(list(sentences))
+        try:
+            self._fila.put_nowait(pedido)
+        except queue.Full:
+            with self._lock:
+                self.rejeitados += 1
+            raise FilaDeEncodeCheiaError("Fila do encoder cheia; tente novamente em instantes.")
+        return pedido.future.result()
+
+    def _loop(self):
+        while not self._fechado:
+            try:
+                primeiro = self._fila.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            lote = [primeiro]
+            total = len(primeiro.textos)
+            prazo = primeiro.enfileirado_em + self.max_wait
+            while total < self.max_batch:
+                # O que já está na fila entra no lote sem esperar; depois aguarda só até o prazo
+                restante = prazo - time.monotonic()
+                try:
+                    pedido = self._fila.get(timeout=restante) if restante > 0 else self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                lote.append(pedido)
+                total += len(pedido.textos)
+            self._processar(lote)
+
+    def _processar(self, lote):
+        inicio = time.monotonic()
+        textos = [texto for pedido in lote for texto in pedido.textos]
+        try:
+            embeddings = np.asarray(self.model.encode(textos, normalize_embeddings=True, batch_size=len(textos)), dtype=np.float32)
+        except Exception as e:
+            for pedido in lote:
+                pedido.future.set_exception(e)
+            return
+
+        with self._lock:
+            self.lotes += 1
+            self.textos_processados += len(textos)
+            self._esperas_ms.extend((inicio - pedido.enfileirado_em) * 1000.0 for pedido in lote)
+
+        posicao = 0
+        for pedido in lote:
+            pedido.future.set_result(embeddings[posicao:posicao + len(pedido.textos)])
+            posicao += len(pedido.textos)
+
+    def stats(self):
+        with self._lock:
+            esperas = np.array(self._esperas_ms) if self._esperas_ms else np.zeros(1)
+            return {
+                'batches': self.lotes,
+                'items': self.textos_processados,
+                'avg_batch_size': self.textos_processados / self.lotes if self.lotes else 0.0,
+                'rejected': self.rejeitados,
+                'queue_depth': self._fila.qsize(),
+                'queue_wait_ms_p50': float(np.percentile(esperas, 50)),
+                'queue_wait_ms_p99': float(np.percentile(esperas, 99)),
+                'queue_wait_ms_max': float(esperas.max()),
+            }
+
+    def close(self):
+        self._fechado = True
+        self._thread.join(timeout=2)
@@ -0,0 +1,87 @@
+# bench/ann_recall.py
+"""
+Compara os índices aproximados (IVF-Flat, HNSW, IVF-PQ) com o IndexFlat exato:
+recall@k em relação ao flat e latência p50/p99 por consulta.
+
+    python bench/ann_recall.py --k 10 --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from embedding_store import load_normalized_embeddings
+from index_factory import build_index, search_parameters
+
+
+def recall_at_k(ground_truth, found):
+    hits = sum(len(set(gt[gt >= 0]) & set(fd[fd >= 0])) for gt, fd in zip(ground_truth, found))
+    return hits / float(ground_truth.size)
+
+
+def run_queries(index, queries, k, params=None):
+    latencias = []
+    resultados = np.empty((len(queries), k), dtype=np.int64)
+    for i in range(len(queries)):
+        inicio = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k, params=params)
+        latencias.append((time.perf_counter() - inicio) * 1000.0)
+        resultados[i] = ids[0]
+    return resultados, np.array(latencias)
+
+
+def benchmark(embeddings, k, n_queries, seed=42):
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    # Pequeno ruído para que a consulta não seja idêntica a um vetor indexado
+    queries = embeddings[query_ids] + rng.normal(0, 0.01, size=(len(query_ids), embeddings.shape[1])).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    flat = build_index(embeddings, 'flat')
+    ground_truth, lat_flat = run_queries(flat, queries, k)
+    relatorio = [{'index': 'flat', 'param': None, 'recall': 1.0, 'build_s': None,
+                  'p50_ms': float(np.percentile(lat_flat, 50)), 'p99_ms': float(np.percentile(lat_flat, 99))}]
+
+    grids = {
+        'ivf_flat': ('nprobe', [1, 4, 8, 16, 32]),
+        'hnsw': ('ef_search', [16, 32, 64, 128]),
+        'ivf_pq': ('nprobe', [1, 4, 8, 16, 32]),
+    }
+    for index_type, (param_name, values) in grids.items():
+        inicio = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_s = time.perf_counter() - inicio
+        for value in values:
+            params = search_parameters(index, **{param_name: value})
+            found, lat = run_queries(index, queries, k, params=params)
+            relatorio.append({'index': index_type, 'param': f"{param_name}={value}", 'recall': recall_at_k(ground_truth, found),
+                              'build_s': build_s, 'p50_ms': float(np.percentile(lat, 50)), 'p99_ms': float(np.percentile(lat, 99))})
+    return relatorio
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, default=config.TOP_K_SEMANTIC_SEARCH)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--json', help="Grava o relatório neste arquivo JSON")
+    args = parser.parse_args()
+
+    embeddings = load_normalized_embeddings()
+    print(f" Benchmark ANN: {embeddings.shape[0]} vetores x {embeddings.shape[1]} dimensões, k={args.k}, {args.queries} consultas.")
+    relatorio = benchmark(embeddings, args.k, args.queries)
+
+    print(f"{'índice':<10} {'parâmetro':<14} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'build (s)':>10}")
+    for linha in relatorio:
+        build = f"{linha['build_s']:.2f}" if linha['build_s'] is not None else '-'
+        print(f"{linha['index']:<10} {linha['param'] or '-':<14} {linha['recall']:>9.3f} {linha['p50_ms']:>9.3f} {linha['p99_ms']:>9.3f} {build:>10}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'k': args.k, 'n_vectors': int(embeddings.shape[0]), 'results': relatorio}, f, indent=2)
+        print(f" Relatório salvo em {args.json}")
@@ -0,0 +1,103 @@
+# bench/query_corpus.py
+"""
+Gera o conjunto fixo de consultas rotuladas usado por bench/retrieval_bench.py.
+
+As consultas saem dos próprios campos do dataset, em três tipos:
+  - cid:          descrição do CID ("Doença de Alzheimer"); relevantes = notas com o mesmo código CID;
+  - diagnostico:  texto do diagnóstico; relevantes = notas com o mesmo código CID ou o mesmo diagnóstico;
+  - medicamento:  princípio ativo ("SOMATROPINA"); relevantes = notas com o mesmo princípio ativo.
+Os relevantes são guardados pelo id da nota (id_nota), que não depende da ordem das linhas.
+
+    python bench/query_corpus.py --dataset data/processed/DATASET_FINAL_TRATADO.csv --por-tipo 100
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+from collections import defaultdict
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from field_store import FieldStore
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'queries.json')
+DATASET_PADRAO = os.path.join(config.DATA_DIR, 'DATASET_FINAL_TRATADO.csv')
+TIPOS = ('cid', 'diagnostico', 'medicamento')
+VALORES_VAZIOS = {'', 'n/a', 'nan', 'não informado', 'nao informado', 'não se aplica'}
+_CID_PATTERN = re.compile(r"^\s*([A-Z]\d{2}(?:\.\d{1,2})?)\s*-\s*(.+)$")
+
+
+def _normalizar(texto):
+    return ' '.join(str(texto).split()).strip(' .;').lower()
+
+
+def _util(texto):
+    return _normalizar(texto) not in VALORES_VAZIOS
+
+
+def gerar_corpus(field_store, por_tipo=100, seed=42):
+    """Lista de consultas {'id', 'type', 'query', 'relevant'} com no máximo `por_tipo` consultas de cada tipo."""
+    ids = field_store.columns['id_nota']
+    codigo_cid, descricao_cid = [], []
+    for cid in field_store.columns['cid']:
+        encontrado = _CID_PATTERN.match(str(cid))
+        codigo_cid.append(encontrado.group(1) if encontrado else None)
+        descricao_cid.append(encontrado.group(2).strip() if encontrado else None)
+
+    por_cid, por_diagnostico, por_principio = defaultdict(set), defaultdict(set), defaultdict(set)
+    for i, id_nota in enumerate(ids):
+        if codigo_cid[i]:
+            por_cid[codigo_cid[i]].add(id_nota)
+        if _util(field_store.columns['diagnóstico'][i]):
+            por_diagnostico[_normalizar(field_store.columns['diagnóstico'][i])].add(id_nota)
+        if _util(field_store.columns['princípio ativo'][i]):
+            por_principio[_normalizar(field_store.columns['princípio ativo'][i])].add(id_nota)
+
+    candidatos = {tipo: {} for tipo in TIPOS}
+    for i in range(len(field_store)):
+        if codigo_cid[i] and descricao_cid[i]:
+            candidatos['cid'].setdefault(_normalizar(descricao_cid[i]), (descricao_cid[i], por_cid[codigo_cid[i]]))
+        diagnostico = field_store.columns['diagnóstico'][i]
+        if _util(diagnostico) and len(diagnostico.split()) >= 2 and len(diagnostico) <= 160:
+            chave = _normalizar(diagnostico)
+            relevantes = por_diagnostico[chave] | (por_cid[codigo_cid[i]] if codigo_cid[i] else set())
+            candidatos['diagnostico'].setdefault(chave, (diagnostico.strip(' .;'), relevantes))
+        principio = field_store.columns['princípio ativo'][i]
+        if _util(principio):
+            chave = _normalizar(principio)
+            candidatos['medicamento'].setdefault(chave, (principio.strip(), por_principio[chave]))
+
+    rng = random.Random(seed)
+    consultas = []
+    for tipo in TIPOS:
+        chaves = sorted(candidatos[tipo])
+        for n, chave in enumerate(sorted(rng.sample(chaves, min(por_tipo, len(chaves))))):
+            texto, relevantes = candidatos[tipo][chave]
+            consultas.append({'id': f"{tipo}-{n:03d}", 'type': tipo, 'query': texto, 'relevant': sorted(relevantes)})
+    return consultas
+
+
+def carregar_corpus(path=CORPUS_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=DATASET_PADRAO, help="CSV de onde saem as consultas e os rótulos")
+    parser.add_argument('--por-tipo', type=int, default=100, help="Máximo de consultas por tipo")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default=CORPUS_PATH)
+    args = parser.parse_args()
+
+    field_store = FieldStore.from_dataframe(pd.read_csv(args.dataset))
+    consultas = gerar_corpus(field_store, args.por_tipo, args.seed)
+    corpus = {'dataset': os.path.basename(args.dataset), 'rows': len(field_store), 'seed': args.seed, 'queries': consultas}
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f, ensure_ascii=False, indent=1)
+    por_tipo = {tipo: sum(1 for c in consultas if c['type'] == tipo) for tipo in TIPOS}
+    print(f" Corpus de consultas: {len(consultas)} consultas {por_tipo} de {len(field_store)} notas, salvo em {args.out}")
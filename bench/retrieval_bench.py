@@ -0,0 +1,275 @@
+# bench/retrieval_bench.py
+"""
+Benchmark reprodutível da recuperação: para cada configuração do SemanticSearcher (tipo de índice x modo
+de busca, opcionalmente com rerank) mede o tempo de subida, a latência por consulta (p50/p95/p99), a vazão
+em vários níveis de concorrência e a qualidade (recall@k e MRR) contra o corpus rotulado de
+bench/queries.json (gerado por bench/query_corpus.py).
+
+O cache de consultas fica desligado (mede-se o trabalho real de cada busca) e o LLM nunca é chamado: com
+--e2e, a rota /get_response completa roda com um modelo stub de latência fixa, sem rede.
+
+    python bench/retrieval_bench.py --indices flat,hnsw --modes dense,hybrid --json bench_results.json
+    python bench/retrieval_bench.py --json novo.json --baseline bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import semantic_search_service
+from semantic_search_service import SemanticSearcher, SEARCH_MODES
+from query_corpus import CORPUS_PATH, TIPOS, carregar_corpus
+
+# Sem cache de consultas nem observador do store: cada busca do benchmark faz encode + índice de verdade
+semantic_search_service.QUERY_CACHE_ENABLED = False
+semantic_search_service.EMBEDDING_STORE_WATCH_SECONDS = 0
+
+
+# --- Métricas ---
+def recall_e_rr(ids_encontrados, relevantes, k):
+    """(recall@k, reciprocal rank) de uma consulta; recall normalizado por min(k, |relevantes|)."""
+    acertos = [i for i, id_nota in enumerate(ids_encontrados[:k]) if id_nota in relevantes]
+    recall = len(acertos) / float(min(k, len(relevantes)))
+    return recall, (1.0 / (acertos[0] + 1) if acertos else 0.0)
+
+
+def percentis(latencias_ms):
+    latencias_ms = np.asarray(latencias_ms)
+    return {'p50_ms': float(np.percentile(latencias_ms, 50)), 'p95_ms': float(np.percentile(latencias_ms, 95)),
+            'p99_ms': float(np.percentile(latencias_ms, 99)), 'mean_ms': float(latencias_ms.mean())}
+
+
+# --- Configurações ---
+def configuracoes(indices, modos, com_rerank):
+    """(nome, index_type, mode, rerank); o modo 'lexical' não depende do índice FAISS e roda uma vez só."""
+    lista = []
+    for index_type in indices:
+        for mode in modos:
+            if mode == 'lexical' and index_type != indices[0]:
+                continue
+            nome = 'bm25/lexical' if mode == 'lexical' else f"{index_type}/{mode}"
+            lista.append((nome, index_type, mode, False))
+            if com_rerank:
+                lista.append((f"{nome}+rerank", index_type, mode, True))
+    return lista
+
+
+def consultas_rotuladas(corpus, searcher):
+    """Consultas do corpus com os relevantes presentes no índice atual (as demais são ignoradas)."""
+    presentes = set(searcher.field_store.columns['id_nota'])
+    consultas = []
+    for consulta in corpus['queries']:
+        relevantes = presentes.intersection(consulta['relevant'])
+        if relevantes:
+            consultas.append(dict(consulta, relevant=relevantes))
+    return consultas
+
+
+def medir_configuracao(searcher, consultas, k, mode, rerank, concorrencias, min_consultas_vazao, aquecimento=5):
+    # budget_ms=0: o rerank sempre roda no benchmark (o orçamento depende da carga, não da configuração)
+    buscar = lambda texto: searcher.search(texto, top_k=k, mode=mode, rerank=rerank, budget_ms=0)
+    for consulta in consultas[:aquecimento]:
+        buscar(consulta['query'])
+
+    latencias, recalls, rrs = [], [], []
+    por_tipo = {tipo: ([], []) for tipo in TIPOS}
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultados = buscar(consulta['query'])
+        latencias.append((time.perf_counter() - inicio) * 1000.0)
+        recall, rr = recall_e_rr([res['id_nota'] for res in resultados], consulta['relevant'], k)
+        recalls.append(recall)
+        rrs.append(rr)
+        por_tipo[consulta['type']][0].append(recall)
+        por_tipo[consulta['type']][1].append(rr)
+
+    resultado = {'queries': len(consultas), f'recall@{k}': float(np.mean(recalls)), f'mrr@{k}': float(np.mean(rrs))}
+    resultado.update(percentis(latencias))
+    resultado['by_type'] = {tipo: {'queries': len(r), f'recall@{k}': float(np.mean(r)), f'mrr@{k}': float(np.mean(m))}
+                            for tipo, (r, m) in por_tipo.items() if r}
+
+    textos = [consulta['query'] for consulta in consultas]
+    repeticoes = max(1, -(-min_consultas_vazao // len(textos)))
+    textos = (textos * repeticoes)[:max(min_consultas_vazao, len(textos))]
+    resultado['throughput'] = {}
+    for concorrencia in concorrencias:
+        with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+            inicio = time.perf_counter()
+            list(pool.map(buscar, textos))
+            duracao = time.perf_counter() - inicio
+        resultado['throughput'][str(concorrencia)] = {'qps': len(textos) / duracao, 'queries': len(textos)}
+    return resultado
+
+
+# --- Ponta a ponta com LLM stub ---
+class _ParteStub:
+    def __init__(self, texto):
+        self.text = texto
+
+
+class _RespostaStub:
+    """Imita o GenerationResponse do Vertex no que o EnriquecedorLLM lê (candidates[0].content.parts)."""
+
+    def __init__(self, texto):
+        conteudo = type('Conteudo', (), {'parts': [_ParteStub(texto)]})()
+        self.candidates = [type('Candidato', (), {'content': conteudo, 'finish_reason': None})()]
+        self.prompt_feedback = None
+
+
+class ModeloLLMStub:
+    """GenerativeModel falso: espera `latencia_ms` e devolve um texto fixo, sem rede nem credenciais."""
+
+    def __init__(self, latencia_ms=0.0):
+        self.latencia_ms = latencia_ms
+
+    def generate_content(self, conteudo, stream=False, **kwargs):
+        time.sleep(self.latencia_ms / 1000.0)
+        resposta = _RespostaStub("Resposta do benchmark.")
+        return iter([resposta]) if stream else resposta
+
+
+def medir_ponta_a_ponta(searcher, consultas, latencia_llm_ms):
+    """Latência da rota /get_response (busca + prompt + LLM stub) pelo cliente de teste do Flask."""
+    import app as webapp
+    from llm_service import EnriquecedorLLM
+    webapp.search_service = searcher
+    webapp.llm_service = EnriquecedorLLM(project_id=None, location=None, model=ModeloLLMStub(latencia_llm_ms))
+    webapp.resources_fully_loaded = True
+    cliente = webapp.app.test_client()
+    # Sem o cache de respostas: toda requisição passa pelo LLM stub
+    cabecalhos = {config.CACHE_BYPASS_HEADER: '1'}
+    latencias = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resposta = cliente.post('/get_response', data={'query': consulta['query']}, headers=cabecalhos)
+        latencias.append((time.perf_counter() - inicio) * 1000.0)
+        if resposta.status_code != 200:
+            raise RuntimeError(f"/get_response devolveu {resposta.status_code}: {resposta.get_data(as_text=True)[:200]}")
+    resultado = {'queries': len(consultas), 'llm_stub_latency_ms': latencia_llm_ms}
+    resultado.update(percentis(latencias))
+    return resultado
+
+
+# --- Relatório ---
+def ambiente(corpus_path):
+    with open(corpus_path, 'rb') as f:
+        corpus_sha1 = hashlib.sha1(f.read()).hexdigest()
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import faiss
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git_commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'faiss': faiss.__version__,
+            'numpy': np.__version__, 'model': config.MODEL_NAME_SEMANTIC, 'encoder_backend': config.ENCODER_BACKEND,
+            'corpus': os.path.basename(corpus_path), 'corpus_sha1': corpus_sha1}
+
+
+def comparar(atual, baseline, k, max_regressao_latencia, max_queda_recall):
+    """Linhas de comparação com um relatório anterior e se alguma configuração regrediu além dos limites."""
+    anteriores = {r['config']: r for r in baseline.get('results', [])}
+    linhas, regrediu = [], False
+    for resultado in atual['results']:
+        anterior = anteriores.get(resultado['config'])
+        if anterior is None or f'recall@{k}' not in anterior:
+            continue
+        delta_p95 = resultado['p95_ms'] / anterior['p95_ms'] - 1.0 if anterior['p95_ms'] else 0.0
+        delta_recall = resultado[f'recall@{k}'] - anterior[f'recall@{k}']
+        piorou = delta_p95 > max_regressao_latencia or -delta_recall > max_queda_recall
+        regrediu = regrediu or piorou
+        linhas.append(f"{resultado['config']:<22} p95 {anterior['p95_ms']:>8.2f} -> {resultado['p95_ms']:>8.2f} ms ({delta_p95:+.1%})"
+                      f"   recall@{k} {anterior[f'recall@{k}']:.3f} -> {resultado[f'recall@{k}']:.3f} ({delta_recall:+.3f})"
+                      f"{'   REGRESSÃO' if piorou else ''}")
+    return linhas, regrediu
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_PATH)
+    parser.add_argument('--k', type=int, default=config.TOP_K_SEMANTIC_SEARCH)
+    parser.add_argument('--indices', default='flat,ivf_flat,hnsw', help="Tipos de índice FAISS, separados por vírgula")
+    parser.add_argument('--modes', default=','.join(SEARCH_MODES), help="Modos de busca, separados por vírgula")
+    parser.add_argument('--rerank', action='store_true', help="Inclui as variantes com rerank (carrega o cross-encoder)")
+    parser.add_argument('--concurrency', default='1,4,8,16', help="Níveis de concorrência da medida de vazão")
+    parser.add_argument('--throughput-queries', type=int, default=500, help="Consultas por nível de concorrência")
+    parser.add_argument('--limit', type=int, help="Usa só as N primeiras consultas do corpus")
+    parser.add_argument('--e2e', action='store_true', help="Mede também /get_response com o LLM stub")
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help="Latência simulada do LLM stub")
+    parser.add_argument('--json', help="Grava o relatório neste arquivo JSON")
+    parser.add_argument('--baseline', help="Relatório JSON anterior para comparar")
+    parser.add_argument('--max-latency-regression', type=float, default=0.2, help="Aumento tolerado do p95 (fração)")
+    parser.add_argument('--max-recall-drop', type=float, default=0.01, help="Queda tolerada do recall@k (absoluta)")
+    args = parser.parse_args()
+
+    indices = [i.strip() for i in args.indices.split(',') if i.strip()]
+    modos = [m.strip() for m in args.modes.split(',') if m.strip()]
+    concorrencias = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    corpus = carregar_corpus(args.corpus)
+    relatorio = {'env': ambiente(args.corpus), 'k': args.k, 'results': []}
+
+    # Subida a frio: encoder + store + índice + BM25, no processo recém-iniciado
+    inicio = time.perf_counter()
+    searcher = SemanticSearcher(index_type=indices[0])
+    relatorio['cold_start_s'] = time.perf_counter() - inicio
+    if not searcher.is_ready:
+        sys.exit(" Benchmark: o SemanticSearcher não pôde ser inicializado.")
+    modelo, reranker = searcher.model, searcher.reranker
+    if args.rerank and reranker is None:
+        from reranker import CrossEncoderReranker
+        reranker = CrossEncoderReranker()
+    consultas = consultas_rotuladas(corpus, searcher)[:args.limit]
+    relatorio['rows'] = searcher.dataset_len
+    relatorio['queries'] = len(consultas)
+    relatorio['queries_skipped'] = len(corpus['queries']) - len(consultas) if not args.limit else None
+    print(f" Benchmark: {searcher.dataset_len} notas, {len(consultas)} consultas rotuladas, k={args.k}, "
+          f"subida a frio em {relatorio['cold_start_s']:.2f}s.")
+
+    searcher.reranker = reranker
+    index_atual = indices[0]
+    for nome, index_type, mode, rerank in configuracoes(indices, modos, args.rerank):
+        # startup_s: subida com o encoder já carregado (store + índice + BM25); None quando o searcher é reaproveitado
+        startup_s = None
+        if index_type != index_atual:
+            searcher.parar_observador()
+            inicio = time.perf_counter()
+            searcher = SemanticSearcher(index_type=index_type, model=modelo, reranker=reranker)
+            startup_s = time.perf_counter() - inicio
+            index_atual = index_type
+        resultado = {'config': nome, 'index_type': index_type, 'mode': mode, 'rerank': rerank, 'startup_s': startup_s}
+        resultado.update(medir_configuracao(searcher, consultas, args.k, mode, rerank, concorrencias, args.throughput_queries))
+        relatorio['results'].append(resultado)
+        vazao = '  '.join(f"c={c}: {v['qps']:.0f} q/s" for c, v in resultado['throughput'].items())
+        print(f" {nome:<22} recall@{args.k} {resultado[f'recall@{args.k}']:.3f}  MRR {resultado[f'mrr@{args.k}']:.3f}  "
+              f"p50 {resultado['p50_ms']:.2f}  p95 {resultado['p95_ms']:.2f}  p99 {resultado['p99_ms']:.2f} ms  {vazao}")
+
+    if args.e2e:
+        relatorio['e2e'] = medir_ponta_a_ponta(searcher, consultas, args.llm_latency_ms)
+        relatorio['e2e']['config'] = relatorio['results'][-1]['config']
+        print(f" Ponta a ponta ({relatorio['e2e']['config']}, LLM stub {args.llm_latency_ms:.0f} ms): "
+              f"p50 {relatorio['e2e']['p50_ms']:.2f}  p95 {relatorio['e2e']['p95_ms']:.2f} ms")
+    searcher.parar_observador()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f" Relatório salvo em {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        linhas, regrediu = comparar(relatorio, baseline, args.k, args.max_latency_regression, args.max_recall_drop)
+        print(f" Comparação com {args.baseline} (commit {baseline.get('env', {}).get('git_commit')}):")
+        for linha in linhas:
+            print(f"   {linha}")
+        if regrediu:
+            sys.exit(1)
@@ -0,0 +1,204 @@
+# bm25_index.py
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import tempfile
+import unicodedata
+from collections import Counter, defaultdict
+import numpy as np
+import config
+
+# Tokens alfanuméricos; códigos com ponto (CID "G30.1") geram também o prefixo ("g30")
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+
+
+def tokenizar(texto):
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(texto):
+        tokens.append(token)
+        if '.' in token:
+            tokens.append(token.split('.', 1)[0])
+    return tokens
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 com os pesos já calculados por posting: pontuar uma consulta é somar,
+    para cada termo, um vetor de pesos nas posições dos documentos da sua posting list.
+    Os ids dos documentos são as posições das linhas, como no índice FAISS.
+    """
+
+    def __init__(self, vocab, offsets, doc_ids, weights, n_docs):
+        self.vocab = vocab              # termo -> posição em offsets
+        self.offsets = offsets          # int64, len(vocab) + 1
+        self.doc_ids = doc_ids          # int32, postings concatenadas
+        self.weights = weights          # float32, peso BM25 de cada posting
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, textos, k1=None, b=None):
+        k1 = config.BM25_K1 if k1 is None else k1
+        b = config.BM25_B if b is None else b
+        postings = defaultdict(list)
+        doc_lens = np.zeros(len(textos), dtype=np.float32)
+        for doc_id, texto in enumerate(textos):
+            contagem = Counter(tokenizar(texto or ''))
+            doc_lens[doc_id] = sum(contagem.values())
+            for termo, tf in contagem.items():
+                postings[termo].append((doc_id, tf))
+
+        n_docs = len(textos)
+        avgdl = float(doc_lens.mean()) if n_docs else 0.0
+        vocab, offsets, doc_ids, weights = {}, [0], [], []
+        for termo in sorted(postings):
+            docs = np.array([d for d, _ in postings[termo]], dtype=np.int32)
+            tfs = np.array([tf for _, tf in postings[termo]], dtype=np.float32)
+            idf = np.log(1.0 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norma = k1 * (1.0 - b + b * doc_lens[docs] / max(avgdl, 1e-9))
+            vocab[termo] = len(vocab)
+            doc_ids.append(docs)
+            weights.append((idf * tfs * (k1 + 1.0) / (tfs + norma)).astype(np.float32))
+            offsets.append(offsets[-1] + len(docs))
+        return cls(vocab, np.array(offsets, dtype=np.int64),
+                   np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype=np.int32),
+                   np.concatenate(weights) if weights else np.zeros(0, dtype=np.float32), n_docs)
+
+    def scores(self, query):
+        acumulado = np.zeros(self.n_docs, dtype=np.float32)
+        for termo in set(tokenizar(query)):
+            posicao = self.vocab.get(termo)
+            if posicao is None:
+                continue
+            inicio, fim = self.offsets[posicao], self.offsets[posicao + 1]
+            # Cada documento aparece uma vez por posting list, então a soma indexada é segura
+            acumulado[self.doc_ids[inicio:fim]] += self.weights[inicio:fim]
+        return acumulado
+
+    def search(self, query, top_k, excluir=None, permitidos=None):
+        """(ids, scores) dos top_k documentos com score > 0, em ordem decrescente; `permitidos` restringe os ids."""
+        acumulado = self.scores(query)
+        if excluir is not None and len(excluir):
+            acumulado[excluir] = 0.0
+        if permitidos is not None:
+            mascara = np.zeros(self.n_docs, dtype=bool)
+            mascara[permitidos] = True
+            acumulado[~mascara] = 0.0
+        candidatos = np.flatnonzero(acumulado)
+        if len(candidatos) > top_k:
+            candidatos = candidatos[np.argpartition(-acumulado[candidatos], top_k - 1)[:top_k]]
+        ordem = candidatos[np.argsort(-acumulado[candidatos], kind='stable')]
+        return ordem, acumulado[ordem]
+
+    def save(self, path, checksum, revision):
+        """
+        Grava os arrays num arquivo versionado e só então troca o meta, que aponta para ele (como
+        index_factory.write_index_with_meta): workers que reconstroem ao mesmo tempo nunca escrevem no
+        mesmo arquivo, e quem lê o meta sempre encontra os arrays correspondentes.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        meta_path = f"{path}.meta.json"
+        versao = hashlib.sha256(f"{checksum}:{revision}:{self.n_docs}".encode('utf-8')).hexdigest()[:16]
+        data_path = f"{path}.{versao}.npz"
+        anterior = _ler_meta(meta_path) or {}
+
+        def gravar_arrays(tmp_path):
+            # Com um arquivo aberto o np.savez não acrescenta '.npz' ao nome temporário
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights)
+
+        def gravar_meta(tmp_path):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'checksum': checksum, 'revision': revision, 'n_docs': self.n_docs,
+                           'data_file': os.path.basename(data_path), 'previous_data_file': anterior.get('data_file'),
+                           'vocab': sorted(self.vocab, key=self.vocab.get)}, f, ensure_ascii=False)
+
+        _gravar_atomico(data_path, gravar_arrays)
+        _gravar_atomico(meta_path, gravar_meta)
+        _remover_versoes_antigas(path, {os.path.basename(data_path), anterior.get('data_file')})
+
+    @classmethod
+    def load_if_fresh(cls, path, checksum, revision, n_docs):
+        """O índice persistido para este checksum/revisão, ou None (desatualizado, ausente ou ilegível: quem chamou reconstrói)."""
+        meta = _ler_meta(f"{path}.meta.json")
+        if meta is None:
+            return None
+        if meta.get('checksum') != checksum or meta.get('revision') != revision or meta.get('n_docs') != n_docs:
+            return None
+        try:
+            with np.load(os.path.join(os.path.dirname(path), meta['data_file'])) as data:
+                index = cls({termo: i for i, termo in enumerate(meta['vocab'])},
+                            data['offsets'], data['doc_ids'], data['weights'], n_docs)
+        except Exception as e:
+            # Arquivo truncado ou corrompido: tratado como desatualizado, para ser reconstruído e regravado
+            print(f" BM25: Falha ao ler o índice persistido ({type(e).__name__}: {e}); será reconstruído.")
+            return None
+        if len(index.offsets) != len(index.vocab) + 1 or len(index.doc_ids) != len(index.weights) \
+                or (len(index.offsets) and index.offsets[-1] != len(index.doc_ids)):
+            print(" BM25: Índice persistido não confere com o meta; será reconstruído.")
+            return None
+        return index
+
+
+def _ler_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f" BM25: Meta do índice ilegível em {os.path.basename(meta_path)} ({e}).")
+        return None
+
+
+def _gravar_atomico(path, gravar):
+    # Nome temporário exclusivo por gravação; o arquivo final só aparece completo (os.replace)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        gravar(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _remover_versoes_antigas(path, manter):
+    # Mesma regra do índice FAISS: só versões não apontadas pelo meta e mais velhas que FAISS_INDEX_KEEP_SECONDS
+    limite = time.time() - config.FAISS_INDEX_KEEP_SECONDS
+    for caminho in glob.glob(f"{glob.escape(path)}.*npz"):
+        try:
+            if os.path.basename(caminho) not in manter and os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def carregar_ou_construir(field_store, checksum, revision, path=None):
+    """BM25 do texto de cada nota (que já inclui os campos estruturados), persistido ao lado do índice FAISS."""
+    path = path or config.BM25_INDEX_PATH
+    index = BM25Index.load_if_fresh(path, checksum, revision, len(field_store))
+    if index is not None:
+        return index, False
+    index = BM25Index.build(field_store.columns['texto_original'])
+    try:
+        index.save(path, checksum, revision)
+    except OSError as e:
+        print(f" BM25: Não foi possível gravar o índice: {e}")
+    return index, True
+
+
+def reciprocal_rank_fusion(listas, k=None, pesos=None):
+    """Funde listas de ids ordenadas: score = soma de peso / (k + posição). Devolve [(id, score)] decrescente."""
+    k = config.HYBRID_RRF_K if k is None else k
+    pesos = pesos or [1.0] * len(listas)
+    scores = defaultdict(float)
+    for lista, peso in zip(listas, pesos):
+        for posicao, doc_id in enumerate(lista):
+            scores[int(doc_id)] += peso / (k + posicao + 1)
+    return sorted(scores.items(), key=lambda item: -item[1])
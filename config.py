@@ -9,15 +9,150 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 DATA_DIR = os.path.join(BASE_DIR, 'data', 'processed')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 DATASET_FILENAME = 'embeddings.csv'
 EMBEDDINGS_FILENAME = 'embeddings.pkl'
 
 DATASET_PATH = os.path.join(DATA_DIR, DATASET_FILENAME)
 EMBEDDINGS_PATH = os.path.join(DATA_DIR, EMBEDDINGS_FILENAME)
 
+# Formato binário (embedding_store.py). Se existir, é usado no lugar do pickle + CSV acima.
+EMBEDDING_STORE_DIR = os.path.join(DATA_DIR, 'embedding_store')
+EMBEDDING_STORE_MMAP = True
+# Intervalo (s) com que o serviço verifica se um ingest (ingest.py) alterou o store; 0 desativa
+EMBEDDING_STORE_WATCH_SECONDS = float(os.environ.get('EMBEDDING_STORE_WATCH_SECONDS', '30'))
+
 
 GOOGLE_CREDENTIALS_PATH = r"/home/lucala/Residencia TJGO/tjgo/NLP/ENTREGAS FINAL/juris_natjus/SPRINT-IV/secrets/br-tjgo-cld-02-09b1b22e65b3.json" 
 GOOGLE_PROJECT_ID = "br-tjgo-cld-02"
 GOOGLE_LOCATION = "us-central1"
 
-TOP_K_SEMANTIC_SEARCH = 5 
\ No newline at end of file
+# --- Cache de respostas do LLM (response_cache.py) ---
+LLM_RESPONSE_CACHE_ENABLED = True
+LLM_RESPONSE_CACHE_MAX_SIZE = 2000
+LLM_RESPONSE_CACHE_TTL_SECONDS = 24 * 3600
+LLM_RESPONSE_CACHE_NEAR_DUPLICATE = False    # reaproveita respostas de consultas quase idênticas
+LLM_RESPONSE_CACHE_NEAR_THRESHOLD = 0.97     # similaridade de cosseno mínima entre as consultas
+CACHE_BYPASS_HEADER = 'X-Cache-Bypass'       # '1' ignora o cache de respostas na requisição
+
+TOP_K_SEMANTIC_SEARCH = 5
+
+# --- Serviço ASGI (asgi_app.py) ---
+ASGI_SEARCH_WORKERS = int(os.environ.get('ASGI_SEARCH_WORKERS', '4'))       # threads para encode + FAISS
+ASGI_SEARCH_MAX_PENDING = int(os.environ.get('ASGI_SEARCH_MAX_PENDING', '64'))
+
+# --- Administração (POST /admin/reload, SIGHUP) ---
+# Sem ADMIN_TOKEN definido, as rotas /admin/* ficam desativadas (403)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+# --- Busca em lote (POST /search/batch) ---
+MAX_BATCH_QUERIES = 5000
+MAX_BATCH_TOP_K = 100         # resultados por consulta; o FAISS aloca consultas x top_k
+ENCODE_BATCH_SIZE = 64       # batch_size do SentenceTransformer.encode
+
+# --- Micro-batching do encoder (batching_encoder.py) ---
+# Agrupa encodes de requisições concorrentes em um único forward pass
+ENCODER_MICROBATCH_ENABLED = True
+ENCODER_MAX_BATCH = 32
+ENCODER_MAX_WAIT_MS = 5.0
+ENCODER_QUEUE_DEPTH = 1024
+
+# --- Backend do encoder (encoder_backends.py) ---
+# 'torch' (padrão), 'onnx' ou 'onnx_int8'; os modelos ONNX são gerados com `python encoder_backends.py export`
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'torch')
+ENCODER_ONNX_DIR = os.path.join(BASE_DIR, 'models', 'encoder_onnx')
+ENCODER_ONNX_QUANTIZATION = os.environ.get('ENCODER_ONNX_QUANTIZATION', 'avx2')   # arm64 | avx2 | avx512 | avx512_vnni
+
+# --- Cache de consultas (query_cache.py) ---
+QUERY_CACHE_ENABLED = True
+QUERY_CACHE_MAX_SIZE = 10000
+QUERY_CACHE_TTL_SECONDS = 6 * 3600
+QUERY_CACHE_RESULTS = True          # também guarda os ids/scores do top-k
+# 'memory' (por processo) ou 'sqlite' (arquivo local compartilhado pelos workers da máquina)
+QUERY_CACHE_BACKEND = os.environ.get('QUERY_CACHE_BACKEND', 'memory')
+QUERY_CACHE_SQLITE_PATH = os.path.join(BASE_DIR, 'cache', 'query_cache.sqlite3')
+
+# --- Índice FAISS (index_factory.py) ---
+# 'flat' (busca exata), 'ivf_flat', 'hnsw' ou 'ivf_pq'
+FAISS_INDEX_TYPE = os.environ.get('FAISS_INDEX_TYPE', 'flat')
+FAISS_IVF_NLIST = 0            # 0 = automático (~4*sqrt(N), limitado pelo nº de vetores de treino)
+FAISS_IVF_NPROBE = 8           # listas visitadas por consulta (IVF)
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64      # tamanho da fila de candidatos por consulta (HNSW)
+FAISS_PQ_M = 48                # subquantizadores; precisa dividir a dimensão do modelo (768)
+FAISS_PQ_NBITS = 8
+
+# Índice pré-construído (python index_factory.py); reconstruído se o checksum dos embeddings ou os parâmetros mudarem
+FAISS_INDEX_DIR = os.path.join(DATA_DIR, 'faiss')
+FAISS_INDEX_MMAP = True
+FAISS_INDEX_SAVE_ON_REBUILD = True 
+FAISS_INDEX_KEEP_SECONDS = 600   # versões antigas do índice (não apontadas pelo meta) ficam esse tempo antes de serem apagadas
+
+# --- Busca lexical BM25 e modo híbrido (bm25_index.py) ---
+# Modo padrão de SemanticSearcher.search: 'dense', 'lexical' ou 'hybrid' (pode ser trocado por requisição)
+SEARCH_MODE = os.environ.get('SEARCH_MODE', 'dense')
+BM25_ENABLED = True
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_INDEX_PATH = os.path.join(FAISS_INDEX_DIR, 'bm25')
+HYBRID_CANDIDATES = 50       # profundidade de cada lista (densa e BM25) antes da fusão
+HYBRID_RRF_K = 60
+HYBRID_DENSE_WEIGHT = 1.0
+HYBRID_LEXICAL_WEIGHT = 1.0
+
+# --- Filtros de metadados (metadata_filters.py) ---
+# Até este nº de linhas permitidas pelos filtros, a busca densa é exata sobre elas; acima, usa o índice com IDSelector
+FILTER_EXACT_SEARCH_MAX_ROWS = 4096
+
+# --- Rerank com cross-encoder (reranker.py) ---
+# Busca RERANK_CANDIDATES candidatos no primeiro estágio e reordena com o cross-encoder antes de cortar no top_k
+RERANK_ENABLED = os.environ.get('RERANK_ENABLED', '0').lower() in ('1', 'true', 'yes')
+RERANK_MODEL_NAME = 'cross-encoder/mmarco-mMiniLMv2-L12-H384-v1'     # multilíngue (inclui português)
+RERANK_CANDIDATES = 20
+RERANK_MAX_LENGTH = 256        # tokens por par (consulta, passagem)
+RERANK_MAX_CHARS = 2000        # caracteres da passagem enviados ao tokenizer
+RERANK_BATCH_SIZE = 32         # pares por forward pass dentro do predict (limita a memória de ativações)
+RERANK_MAX_PAIRS = 1000        # acima disso (ex.: /search/batch com muitas consultas) o rerank é pulado
+# Orçamento (ms) da busca inteira: se o tempo gasto + o custo estimado do rerank passar disso, o rerank é pulado (0 = sem limite)
+RERANK_BUDGET_MS = float(os.environ.get('RERANK_BUDGET_MS', '250'))
+RERANK_MIN_SCORE = None        # descarta passagens com score do cross-encoder abaixo disso (None = mantém o top_k)
+
+# --- Montagem do contexto do LLM (prompt_builder.py) ---
+PROMPT_CONTEXT_MAX_TOKENS = int(os.environ.get('PROMPT_CONTEXT_MAX_TOKENS', '2000'))   # orçamento padrão por requisição
+# 'vertex' usa o tokenizer local do Gemini (vertexai.preview.tokenization); 'heuristic' estima por caracteres
+PROMPT_TOKENIZER = os.environ.get('PROMPT_TOKENIZER', 'vertex')
+PROMPT_CHARS_PER_TOKEN = 4.0
+PROMPT_DEDUP_JACCARD = 0.9     # notas com Jaccard de palavras >= isto em relação a uma anterior são descartadas
+
+# --- Context caching da system instruction no Vertex (context_cache.py) ---
+# O Vertex exige um mínimo de tokens por cached content; abaixo disso a criação falha e o serviço segue inline
+LLM_CONTEXT_CACHE_ENABLED = os.environ.get('LLM_CONTEXT_CACHE_ENABLED', '0').lower() in ('1', 'true', 'yes')
+LLM_CONTEXT_CACHE_TTL_SECONDS = 3600
+LLM_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300   # renova o TTL quando faltar menos do que isto
+LLM_CONTEXT_CACHE_RETRY_SECONDS = 600            # após uma falha, tempo no caminho inline antes de tentar de novo
+
+# --- Resiliência das chamadas ao LLM (llm_resilience.py) ---
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get('LLM_CALL_TIMEOUT_SECONDS', '30'))     # prazo de cada tentativa
+LLM_TOTAL_DEADLINE_SECONDS = float(os.environ.get('LLM_TOTAL_DEADLINE_SECONDS', '60'))  # prazo somando as tentativas
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BACKOFF_BASE_SECONDS = 0.5
+LLM_RETRY_BACKOFF_MAX_SECONDS = 4.0
+# Segunda requisição idêntica quando a primeira passa do percentil das latências recentes (dobra o custo dessas chamadas)
+LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', '0').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_MIN_SAMPLES = 20
+# Circuit breaker: abre com LLM_BREAKER_ERROR_RATE de erros nas últimas LLM_BREAKER_WINDOW tentativas
+LLM_BREAKER_WINDOW = 20
+LLM_BREAKER_ERROR_RATE = 0.5
+LLM_BREAKER_MIN_CALLS = 10
+LLM_BREAKER_COOLDOWN_SECONDS = 30.0
+LLM_CALL_THREADS = 16          # threads (e máximo de chamadas síncronas em voo, contando as abandonadas por prazo)
+LLM_CALL_SLOT_WAIT_SECONDS = 0.5   # espera máxima por uma vaga antes de desistir (sobrecarga) e usar o fallback
+
+# --- Métricas e log das requisições (metrics.py) ---
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get('LOG_REQUEST_SAMPLE_RATE', '0.05'))  # fração das requisições com linha de log
+LOG_PROMPT_SAMPLE_RATE = float(os.environ.get('LOG_PROMPT_SAMPLE_RATE', '0'))       # fração das linhas que levam o contexto completo
+LOG_SLOW_REQUEST_MS = float(os.environ.get('LOG_SLOW_REQUEST_MS', '5000'))          # acima disto a requisição é sempre logada
@@ -0,0 +1,116 @@
+# context_cache.py
+import time
+import datetime
+import threading
+
+
+class ClienteVertexCaching:
+    """Operações de context caching do Vertex AI usadas por CacheDeInstrucaoDoSistema (substituível por um stub)."""
+
+    def criar(self, model_name, system_instruction, ttl_seconds):
+        from vertexai.preview import caching
+        return caching.CachedContent.create(model_name=model_name, system_instruction=system_instruction,
+                                            ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def renovar(self, handle, ttl_seconds):
+        handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+        return handle
+
+    def modelo(self, handle):
+        from vertexai.preview.generative_models import GenerativeModel
+        return GenerativeModel.from_cached_content(cached_content=handle)
+
+    def nome(self, handle):
+        return getattr(handle, 'resource_name', None) or getattr(handle, 'name', None)
+
+
+class CacheDeInstrucaoDoSistema:
+    """
+    Mantém um cached content do Vertex com a system instruction fixa do EnriquecedorLLM e o
+    GenerativeModel ligado a ele, para que cada generate_content envie só o contexto da pergunta.
+
+    O TTL é renovado `margem_seconds` antes de expirar (pela thread da requisição que notar, sem
+    bloquear as demais). Se criar/renovar falhar, ou se o servidor recusar o cache numa geração
+    (`invalidar`), `modelo()` devolve None por `retry_seconds` e o chamador usa o modelo inline.
+    """
+
+    def __init__(self, model_name, system_instruction, ttl_seconds, margem_seconds, retry_seconds, cliente=None, relogio=time.monotonic):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.ttl_seconds = ttl_seconds
+        self.margem_seconds = min(margem_seconds, ttl_seconds / 2.0)
+        self.retry_seconds = retry_seconds
+        self.cliente = cliente or ClienteVertexCaching()
+        self.relogio = relogio
+        self._lock = threading.Lock()
+        self._handle = None
+        self._modelo = None
+        self._expira_em = 0.0
+        self._nova_tentativa_em = 0.0
+        self.criacoes = 0
+        self.renovacoes = 0
+        self.falhas = 0
+
+    def modelo(self):
+        """GenerativeModel ligado ao cache, ou None quando o caminho inline deve ser usado."""
+        agora = self.relogio()
+        modelo, expira_em = self._modelo, self._expira_em
+        if modelo is not None and agora < expira_em - self.margem_seconds:
+            return modelo
+        if self._handle is None and agora < self._nova_tentativa_em:
+            return None
+        if not self._lock.acquire(blocking=False):
+            # Outra requisição está criando/renovando: usa o cache atual enquanto ainda for válido
+            return modelo if modelo is not None and agora < expira_em else None
+        try:
+            return self._criar_ou_renovar(agora)
+        finally:
+            self._lock.release()
+
+    def _criar_ou_renovar(self, agora):
+        if self._modelo is not None and agora < self._expira_em - self.margem_seconds:
+            return self._modelo
+        if self._handle is not None and agora < self._expira_em:
+            try:
+                self._handle = self.cliente.renovar(self._handle, self.ttl_seconds)
+                self._expira_em = agora + self.ttl_seconds
+                self.renovacoes += 1
+                print(f" LLM Service: TTL do context cache renovado ({self.cliente.nome(self._handle)}).")
+                return self._modelo
+            except Exception as e:
+                # Expirado/removido no servidor: tenta criar outro
+                print(f" LLM Service: Falha ao renovar o context cache ({e}); criando um novo.")
+        try:
+            handle = self.cliente.criar(self.model_name, self.system_instruction, self.ttl_seconds)
+            self._modelo = self.cliente.modelo(handle)
+            self._handle = handle
+            self._expira_em = agora + self.ttl_seconds
+            self.criacoes += 1
+            print(f" LLM Service: Context cache da system instruction criado ({self.cliente.nome(handle)}, TTL {self.ttl_seconds:.0f}s).")
+            return self._modelo
+        except Exception as e:
+            self._desativar(agora, f"Não foi possível criar o context cache ({e})")
+            return None
+
+    def invalidar(self, motivo):
+        """Chamado quando uma geração com o modelo em cache falhou: volta ao inline até a próxima tentativa."""
+        with self._lock:
+            self._desativar(self.relogio(), f"Context cache recusado na geração ({motivo})")
+
+    def _desativar(self, agora, mensagem):
+        self.falhas += 1
+        self._handle = None
+        self._modelo = None
+        self._expira_em = 0.0
+        self._nova_tentativa_em = agora + self.retry_seconds
+        print(f" LLM Service: {mensagem}; usando a system instruction inline por {self.retry_seconds:.0f}s.")
+
+    def stats(self):
+        return {
+            'active': self._modelo is not None,
+            'name': self.cliente.nome(self._handle) if self._handle is not None else None,
+            'expires_in_s': round(max(self._expira_em - self.relogio(), 0.0), 1) if self._handle is not None else None,
+            'created': self.criacoes,
+            'refreshed': self.renovacoes,
+            'failures': self.falhas,
+        }
@@ -0,0 +1,178 @@
+# embedding_job.py
+"""
+Job offline que (re)gera o embedding store a partir do dataset processado.
+
+Lê o CSV em blocos, codifica cada bloco com `encode(batch_size=...)` (ou, com --processes, com o pool
+multiprocesso do SentenceTransformer) e grava as linhas float32 incrementalmente em um diretório de
+trabalho. Um checkpoint após cada bloco permite retomar uma execução interrompida. No fim, o diretório
+de trabalho substitui o store (o serviço em execução percebe o novo checksum e troca o snapshot).
+
+    python embedding_job.py
+    python embedding_job.py --processes 4 --chunk-rows 4096 --build-index
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+import config
+from field_store import FieldStore
+from embedding_store import (MATRIX_FILENAME, ROWS_FILENAME, _write_json_atomic, file_checksum,
+                             new_header, write_header)
+
+CHECKPOINT_FILENAME = 'checkpoint.json'
+PARTIAL_ROWS_FILENAME = 'rows.partial.jsonl'
+
+
+def _assinatura_dataset(dataset_path):
+    stat = os.stat(dataset_path)
+    return {'path': os.path.abspath(dataset_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _ler_checkpoint(work_dir, assinatura, model_name, backend):
+    path = os.path.join(work_dir, CHECKPOINT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    # Linhas de backends diferentes (torch x ONNX int8) não podem ficar na mesma matriz
+    if (checkpoint.get('dataset') != assinatura or checkpoint.get('model_name') != model_name
+            or checkpoint.get('backend') != backend):
+        print(" Embedding Job: checkpoint de outro dataset/modelo/backend; recomeçando do zero.")
+        return None
+    return checkpoint
+
+
+class _Encoder:
+    """encode em lote no processo atual ou, com `processes` > 1, no pool multiprocesso do SentenceTransformer."""
+
+    def __init__(self, backend, processes, batch_size):
+        from encoder_backends import carregar_encoder
+        self.model = carregar_encoder(backend)
+        self.batch_size = batch_size
+        self.pool = self.model.start_multi_process_pool(target_devices=['cpu'] * processes) if processes > 1 else None
+
+    @property
+    def dim(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, textos):
+        if self.pool is not None:
+            embeddings = self.model.encode_multi_process(textos, self.pool, batch_size=self.batch_size, normalize_embeddings=True)
+        else:
+            embeddings = self.model.encode(textos, batch_size=self.batch_size, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+
+
+def executar_job(dataset_path=None, store_dir=None, chunk_rows=2048, batch_size=None, processes=0, backend='torch', build_index=False,
+                 index_dir=None):
+    dataset_path = dataset_path or config.DATASET_PATH
+    store_dir = store_dir or config.EMBEDDING_STORE_DIR
+    batch_size = batch_size or config.ENCODE_BATCH_SIZE
+    model_name = config.MODEL_NAME_SEMANTIC
+    work_dir = f"{store_dir}.job"
+    os.makedirs(work_dir, exist_ok=True)
+    matrix_path = os.path.join(work_dir, MATRIX_FILENAME)
+    partial_rows_path = os.path.join(work_dir, PARTIAL_ROWS_FILENAME)
+
+    assinatura = _assinatura_dataset(dataset_path)
+    checkpoint = _ler_checkpoint(work_dir, assinatura, model_name, backend)
+    feitas = checkpoint['rows'] if checkpoint else 0
+
+    encoder = _Encoder(backend, processes, batch_size)
+    dim = encoder.dim
+    # Descarta o que foi gravado depois do último checkpoint
+    with open(matrix_path, 'ab') as f:
+        f.truncate(feitas * dim * 4)
+    with open(partial_rows_path, 'ab') as f:
+        f.truncate(checkpoint['rows_bytes'] if checkpoint else 0)
+    if feitas:
+        print(f" Embedding Job: retomando a partir da linha {feitas}.")
+
+    inicio = time.perf_counter()
+    codificadas = 0
+    posicao = 0
+    try:
+        for bloco in pd.read_csv(dataset_path, chunksize=chunk_rows):
+            fim_bloco = posicao + len(bloco)
+            if fim_bloco <= feitas:
+                posicao = fim_bloco
+                continue
+            bloco = bloco.iloc[max(feitas - posicao, 0):]
+            posicao = fim_bloco
+
+            campos = FieldStore.from_dataframe(bloco)
+            inicio_bloco = time.perf_counter()
+            embeddings = encoder.encode(campos.columns['texto_original'])
+            with open(matrix_path, 'ab') as f:
+                f.write(embeddings.tobytes())
+            with open(partial_rows_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(campos.columns, ensure_ascii=False) + '\n')
+
+            feitas += len(campos)
+            codificadas += len(campos)
+            _write_json_atomic(os.path.join(work_dir, CHECKPOINT_FILENAME), {
+                'dataset': assinatura, 'model_name': model_name, 'backend': backend, 'dim': dim,
+                'rows': feitas, 'rows_bytes': os.path.getsize(partial_rows_path),
+            })
+            duracao_bloco = time.perf_counter() - inicio_bloco
+            print(f" Embedding Job: {feitas} linhas ({len(campos) / max(duracao_bloco, 1e-9):.1f} linhas/s no bloco).")
+    finally:
+        encoder.close()
+
+    duracao = time.perf_counter() - inicio
+    print(f" Embedding Job: {codificadas} linhas codificadas em {duracao:.1f}s ({codificadas / max(duracao, 1e-9):.1f} linhas/s).")
+
+    # Monta rows.json a partir dos blocos e grava o cabeçalho por último
+    columns = {}
+    with open(partial_rows_path, 'r', encoding='utf-8') as f:
+        for linha in f:
+            for key, values in json.loads(linha).items():
+                columns.setdefault(key, []).extend(values)
+    _write_json_atomic(os.path.join(work_dir, ROWS_FILENAME), columns)
+    header = new_header(model_name, dim, feitas, file_checksum(matrix_path))
+    header['encoder_backend'] = backend
+    write_header(work_dir, header)
+
+    if build_index:
+        # Antes da troca, como o before_header do ingest: o serviço já encontra o índice do novo checksum
+        from index_factory import build_index as construir_indice, write_index_with_meta
+        from embedding_store import EmbeddingStore
+        index = construir_indice(EmbeddingStore.open(work_dir, mmap=False).embeddings, config.FAISS_INDEX_TYPE)
+        write_index_with_meta(index, config.FAISS_INDEX_TYPE, header['checksum'], index_dir)
+        print(f" Embedding Job: índice '{config.FAISS_INDEX_TYPE}' com {index.ntotal} vetores gravado.")
+    os.remove(partial_rows_path)
+    os.remove(os.path.join(work_dir, CHECKPOINT_FILENAME))
+
+    # Troca o diretório do store; quem mapeou os arquivos antigos continua lendo-os até reabrir
+    antigo = f"{store_dir}.old"
+    if os.path.exists(store_dir):
+        shutil.rmtree(antigo, ignore_errors=True)
+        os.replace(store_dir, antigo)
+    os.replace(work_dir, store_dir)
+    shutil.rmtree(antigo, ignore_errors=True)
+    print(f" Embedding Job: store gravado em {store_dir}: {header['rows']} linhas x {dim} dimensões (checksum {header['checksum'][:12]}).")
+    return header
+
+
+if __name__ == '__main__':
+    from encoder_backends import ENCODER_BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=config.DATASET_PATH)
+    parser.add_argument('--out', default=config.EMBEDDING_STORE_DIR)
+    parser.add_argument('--chunk-rows', type=int, default=2048, help="Linhas lidas do CSV (e gravadas no checkpoint) por bloco")
+    parser.add_argument('--batch-size', type=int, default=config.ENCODE_BATCH_SIZE)
+    parser.add_argument('--processes', type=int, default=0, help="Processos do pool multiprocesso do SentenceTransformer (0/1 = sem pool)")
+    parser.add_argument('--backend', choices=ENCODER_BACKENDS, default='torch')
+    parser.add_argument('--build-index', action='store_true', help="Também treina e grava o índice FAISS_INDEX_TYPE")
+    parser.add_argument('--index-dir', default=config.FAISS_INDEX_DIR)
+    args = parser.parse_args()
+    executar_job(args.dataset, args.out, args.chunk_rows, args.batch_size, args.processes, args.backend, args.build_index,
+                 args.index_dir)
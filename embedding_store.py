@@ -0,0 +1,257 @@
+# embedding_store.py
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import config
+from field_store import FieldStore
+
+# Formato em disco (um diretório):
+#   header.json     -> versão do formato, modelo, dimensão, nº de linhas, checksum
+#   embeddings.f32  -> matriz float32 (linhas x dimensão), row-major, já normalizada (L2)
+#   rows.json       -> metadados por linha em colunas (campos estruturados, texto, referência)
+# O ingest incremental (ingest.py) só acrescenta linhas ao fim da matriz; notas removidas ou
+# substituídas ficam em 'tombstones' no cabeçalho e 'revision' conta as alterações.
+STORE_FORMAT_VERSION = 1
+HEADER_FILENAME = 'header.json'
+MATRIX_FILENAME = 'embeddings.f32'
+ROWS_FILENAME = 'rows.json'
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def store_exists(store_dir):
+    return os.path.exists(os.path.join(store_dir, HEADER_FILENAME))
+
+
+def read_header(store_dir):
+    with open(os.path.join(store_dir, HEADER_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class EmbeddingStore:
+    def __init__(self, store_dir, header, embeddings, field_store):
+        self.store_dir = store_dir
+        self.header = header
+        self.embeddings = embeddings
+        self.field_store = field_store
+
+    @property
+    def checksum(self):
+        return self.header.get('checksum')
+
+    @property
+    def tombstones(self):
+        return self.header.get('tombstones', [])
+
+    @property
+    def revision(self):
+        return self.header.get('revision', 0)
+
+    @classmethod
+    def open(cls, store_dir, mmap=True):
+        header = read_header(store_dir)
+        if header.get('format_version') != STORE_FORMAT_VERSION:
+            raise ValueError(f"Versão de formato não suportada: {header.get('format_version')} (esperado {STORE_FORMAT_VERSION})")
+
+        rows, dim = int(header['rows']), int(header['dim'])
+        matrix_path = os.path.join(store_dir, MATRIX_FILENAME)
+        if mmap:
+            # Workers diferentes compartilham as mesmas páginas do cache do SO
+            embeddings = np.memmap(matrix_path, dtype=np.float32, mode='r', shape=(rows, dim))
+        else:
+            embeddings = np.fromfile(matrix_path, dtype=np.float32, count=rows * dim).reshape(rows, dim)
+
+        with open(os.path.join(store_dir, ROWS_FILENAME), 'r', encoding='utf-8') as f:
+            columns = json.load(f)
+        if columns and len(next(iter(columns.values()))) > rows:
+            # Um ingest em andamento já gravou as novas linhas, mas ainda não o cabeçalho
+            columns = {key: values[:rows] for key, values in columns.items()}
+        field_store = FieldStore(columns)
+        if len(field_store) != rows:
+            raise ValueError(f"Metadados com {len(field_store)} linhas, cabeçalho indica {rows}.")
+        return cls(store_dir, header, embeddings, field_store)
+
+
+def _normalizar(embeddings):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(embeddings / norms, dtype=np.float32)
+
+
+def write_embedding_store(store_dir, embeddings, field_store, model_name):
+    """
+    Grava a matriz de embeddings (normalizada em L2) e os metadados por linha no formato binário.
+    O cabeçalho é gravado por último, então um diretório sem header.json nunca é lido pela metade.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(field_store):
+        raise ValueError(f"Shape {embeddings.shape} incompatível com {len(field_store)} linhas de metadados.")
+    embeddings = _normalizar(embeddings)
+
+    os.makedirs(store_dir, exist_ok=True)
+    matrix_path = os.path.join(store_dir, MATRIX_FILENAME)
+    tmp_path = f"{matrix_path}.tmp"
+    data = embeddings.tobytes()
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, matrix_path)
+
+    _write_json_atomic(os.path.join(store_dir, ROWS_FILENAME), field_store.columns)
+
+    header = new_header(model_name, embeddings.shape[1], embeddings.shape[0], hashlib.sha256(data).hexdigest())
+    write_header(store_dir, header)
+    return header
+
+
+def new_header(model_name, dim, rows, checksum):
+    return {
+        'format_version': STORE_FORMAT_VERSION,
+        'model_name': model_name,
+        'dim': int(dim),
+        'rows': int(rows),
+        'dtype': 'float32',
+        'normalized': True,
+        'checksum': checksum,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': 0,
+        'tombstones': [],
+    }
+
+
+def write_header(store_dir, header):
+    _write_json_atomic(os.path.join(store_dir, HEADER_FILENAME), header)
+
+
+def append_to_store(store_dir, embeddings, field_store, tombstones=(), before_header=None):
+    """
+    Acrescenta linhas ao fim do store e marca `tombstones` (posições) como removidas.
+
+    As linhas existentes não mudam de posição, então os ids já indexados (e guardados em cache)
+    continuam válidos, e um processo que mapeou a matriz antiga segue lendo as mesmas páginas.
+    Como em write_embedding_store, o cabeçalho é gravado por último; `before_header(header)` roda
+    logo antes (ex.: gravar o índice do novo checksum, para o serviço já encontrá-lo pronto).
+    """
+    header = read_header(store_dir)
+    rows, dim = int(header['rows']), int(header['dim'])
+    with open(os.path.join(store_dir, ROWS_FILENAME), 'r', encoding='utf-8') as f:
+        columns = json.load(f)
+    if not set(columns) <= set(field_store.columns):
+        raise ValueError(f"Colunas novas {sorted(field_store.columns)} diferem das do store {sorted(columns)}.")
+    # Colunas que o store ainda não tinha (ex.: 'data de conclusão') ficam vazias nas linhas antigas
+    for key in set(field_store.columns) - set(columns):
+        columns[key] = [''] * rows
+
+    novas = len(field_store)
+    if novas:
+        embeddings = _normalizar(embeddings)
+        if embeddings.shape != (novas, dim):
+            raise ValueError(f"Shape {embeddings.shape} incompatível com {novas} linhas de {dim} dimensões.")
+        matrix_path = os.path.join(store_dir, MATRIX_FILENAME)
+        with open(matrix_path, 'r+b') as f:
+            # Descarta sobras de um ingest interrompido antes de gravar o cabeçalho
+            f.truncate(rows * dim * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(embeddings.tobytes())
+        columns = {key: values[:rows] + field_store.columns[key] for key, values in columns.items()}
+        _write_json_atomic(os.path.join(store_dir, ROWS_FILENAME), columns)
+        header['checksum'] = file_checksum(matrix_path)
+
+    header['rows'] = rows + novas
+    header['tombstones'] = sorted(set(header.get('tombstones', [])) | {int(t) for t in tombstones})
+    header['revision'] = header.get('revision', 0) + 1
+    header['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    if before_header is not None:
+        before_header(header)
+    write_header(store_dir, header)
+    return header
+
+
+def load_legacy_embeddings(embeddings_path, expected_rows, expected_dim=None):
+    """
+    Lê o embeddings.pkl gerado pelo notebook (tupla (embeddings, referencias, textos), lista ou ndarray)
+    e devolve uma matriz float32, ou None se o conteúdo não bater com as dimensões esperadas.
+    Sem expected_dim, a dimensão é a do primeiro vetor.
+    """
+    with open(embeddings_path, 'rb') as f: embeddings_data_from_pickle = pickle.load(f)
+
+    actual_embeddings_source = None
+    if isinstance(embeddings_data_from_pickle, tuple):
+        print(f"Dados do pickle são uma TUPLA com {len(embeddings_data_from_pickle)} elemento(s).")
+        if embeddings_data_from_pickle and isinstance(embeddings_data_from_pickle[0], (list, np.ndarray)):
+            actual_embeddings_source = embeddings_data_from_pickle[0]
+            print(f"    Usando o elemento 0 da tupla como fonte de embeddings.")
+        else: print(" Elemento 0 da tupla não é lista/array ou tupla está vazia."); return None
+    elif isinstance(embeddings_data_from_pickle, (list, np.ndarray)):
+        actual_embeddings_source = embeddings_data_from_pickle
+    else: print(f" Tipo de dados inesperado ({type(embeddings_data_from_pickle)}) no pickle."); return None
+
+    if expected_dim is None and len(actual_embeddings_source) > 0:
+        expected_dim = len(actual_embeddings_source[0])
+
+    if isinstance(actual_embeddings_source, list):
+        if len(actual_embeddings_source) != expected_rows: return None
+        if not all(isinstance(e, (list, np.ndarray)) and len(e) == expected_dim for e in actual_embeddings_source): return None
+        # np.asarray direto, sem copiar cada vetor para uma lista intermediária
+        actual_embeddings_source = np.asarray(actual_embeddings_source, dtype=np.float32)
+
+    if actual_embeddings_source.ndim == 2 and actual_embeddings_source.shape[0] == expected_rows and actual_embeddings_source.shape[1] == expected_dim:
+        return actual_embeddings_source.astype(np.float32, copy=False)
+    return None
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def source_checksum(store_dir=config.EMBEDDING_STORE_DIR, embeddings_path=config.EMBEDDINGS_PATH):
+    """Checksum dos embeddings de origem: o do cabeçalho do store ou o sha256 do pickle legado."""
+    if store_exists(store_dir):
+        return read_header(store_dir)['checksum']
+    return file_checksum(embeddings_path)
+
+
+def load_normalized_embeddings(store_dir=config.EMBEDDING_STORE_DIR, dataset_path=config.DATASET_PATH, embeddings_path=config.EMBEDDINGS_PATH):
+    """Matriz float32 normalizada em L2, do embedding store se existir ou do pickle legado."""
+    if store_exists(store_dir):
+        return np.asarray(EmbeddingStore.open(store_dir, mmap=False).embeddings)
+    n_rows = len(pd.read_csv(dataset_path))
+    embeddings = load_legacy_embeddings(embeddings_path, n_rows)
+    if embeddings is None:
+        raise ValueError("Embeddings do pickle incompatíveis com o dataset.")
+    return _normalizar(embeddings)
+
+
+def convert_legacy(dataset_path, embeddings_path, store_dir, model_name):
+    dataset = pd.read_csv(dataset_path)
+    field_store = FieldStore.from_dataframe(dataset)
+    embeddings = load_legacy_embeddings(embeddings_path, len(dataset))
+    if embeddings is None:
+        raise ValueError("Embeddings do pickle incompatíveis com o dataset.")
+    return write_embedding_store(store_dir, embeddings, field_store, model_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converte embeddings.pkl + CSV para o formato binário mapeável em memória.")
+    parser.add_argument('--dataset', default=config.DATASET_PATH)
+    parser.add_argument('--embeddings', default=config.EMBEDDINGS_PATH)
+    parser.add_argument('--out', default=config.EMBEDDING_STORE_DIR)
+    parser.add_argument('--model-name', default=config.MODEL_NAME_SEMANTIC)
+    args = parser.parse_args()
+
+    header = convert_legacy(args.dataset, args.embeddings, args.out, args.model_name)
+    print(f" Embedding store gravado em {args.out}: {header['rows']} linhas x {header['dim']} dimensões (checksum {header['checksum'][:12]}).")
@@ -0,0 +1,112 @@
+# encoder_backends.py
+"""
+Backends do encoder de consultas:
+  - 'torch'     : SentenceTransformer em PyTorch (padrão, comportamento original);
+  - 'onnx'      : o mesmo modelo exportado para ONNX Runtime;
+  - 'onnx_int8' : modelo ONNX com quantização dinâmica int8 (menor RSS e latência em CPU).
+
+    python encoder_backends.py export                       # gera os modelos ONNX em ENCODER_ONNX_DIR
+    python encoder_backends.py parity --backend onnx_int8   # cosseno contra os embeddings do dataset
+"""
+import os
+import time
+import argparse
+import numpy as np
+from sentence_transformers import SentenceTransformer
+import config
+
+ENCODER_BACKENDS = ('torch', 'onnx', 'onnx_int8')
+
+
+def _arquivo_onnx(backend, quantization):
+    return 'onnx/model.onnx' if backend == 'onnx' else f'onnx/model_qint8_{quantization}.onnx'
+
+
+def carregar_encoder(backend=None, model_name=None, onnx_dir=None, quantization=None):
+    backend = backend or config.ENCODER_BACKEND
+    model_name = model_name or config.MODEL_NAME_SEMANTIC
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Backend de encoder desconhecido: '{backend}'. Opções: {', '.join(ENCODER_BACKENDS)}")
+    if backend == 'torch':
+        return SentenceTransformer(model_name)
+
+    onnx_dir = onnx_dir or config.ENCODER_ONNX_DIR
+    file_name = _arquivo_onnx(backend, quantization or config.ENCODER_ONNX_QUANTIZATION)
+    if not os.path.exists(os.path.join(onnx_dir, file_name)):
+        raise FileNotFoundError(f"{file_name} não encontrado em {onnx_dir}. Rode 'python encoder_backends.py export'.")
+    return SentenceTransformer(onnx_dir, backend='onnx', model_kwargs={'file_name': file_name})
+
+
+def exportar_onnx(model_name=None, onnx_dir=None, quantization=None):
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    model_name = model_name or config.MODEL_NAME_SEMANTIC
+    onnx_dir = onnx_dir or config.ENCODER_ONNX_DIR
+    quantization = quantization or config.ENCODER_ONNX_QUANTIZATION
+
+    # backend='onnx' exporta o modelo na primeira carga; save_pretrained grava onnx/model.onnx
+    model = SentenceTransformer(model_name, backend='onnx')
+    model.save_pretrained(onnx_dir)
+    export_dynamic_quantized_onnx_model(model, quantization, onnx_dir)
+    return onnx_dir
+
+
+def _textos_e_embeddings_do_dataset():
+    from embedding_store import EmbeddingStore, store_exists, load_normalized_embeddings
+    import pandas as pd
+
+    if store_exists(config.EMBEDDING_STORE_DIR):
+        store = EmbeddingStore.open(config.EMBEDDING_STORE_DIR, mmap=False)
+        return store.field_store.columns['texto_original'], np.asarray(store.embeddings)
+    textos = [str(t) for t in pd.read_csv(config.DATASET_PATH)['texto'].fillna('')]
+    return textos, load_normalized_embeddings()
+
+
+def verificar_paridade(backend, limite=None, batch_size=64):
+    """
+    Codifica os textos do dataset com `backend` e compara, linha a linha, com os embeddings
+    armazenados (gerados em torch). Devolve cosseno médio/mínimo/p1 e o tempo por texto.
+    """
+    textos, referencia = _textos_e_embeddings_do_dataset()
+    if limite:
+        textos, referencia = textos[:limite], referencia[:limite]
+
+    encoder = carregar_encoder(backend)
+    inicio = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(textos, normalize_embeddings=True, batch_size=batch_size), dtype=np.float32)
+    duracao = time.perf_counter() - inicio
+
+    cossenos = np.sum(embeddings * referencia, axis=1)
+    return {
+        'backend': backend,
+        'rows': len(textos),
+        'cosine_mean': float(cossenos.mean()),
+        'cosine_min': float(cossenos.min()),
+        'cosine_p1': float(np.percentile(cossenos, 1)),
+        'ms_per_text': duracao * 1000.0 / max(len(textos), 1),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='comando', required=True)
+    p_export = sub.add_parser('export', help="Exporta o modelo para ONNX e gera a versão int8")
+    p_export.add_argument('--out', default=config.ENCODER_ONNX_DIR)
+    p_export.add_argument('--quantization', default=config.ENCODER_ONNX_QUANTIZATION,
+                          choices=['arm64', 'avx2', 'avx512', 'avx512_vnni'])
+    p_parity = sub.add_parser('parity', help="Compara o backend com os embeddings (torch) do dataset")
+    p_parity.add_argument('--backend', choices=ENCODER_BACKENDS, default='onnx_int8')
+    p_parity.add_argument('--limit', type=int, default=None)
+    p_parity.add_argument('--min-cosine', type=float, default=0.99)
+    args = parser.parse_args()
+
+    if args.comando == 'export':
+        out = exportar_onnx(onnx_dir=args.out, quantization=args.quantization)
+        print(f" Modelos ONNX (fp32 e int8/{args.quantization}) gravados em {out}.")
+    else:
+        relatorio = verificar_paridade(args.backend, limite=args.limit)
+        print(f" Paridade '{relatorio['backend']}' em {relatorio['rows']} textos: cosseno médio {relatorio['cosine_mean']:.5f}, "
+              f"mínimo {relatorio['cosine_min']:.5f}, p1 {relatorio['cosine_p1']:.5f}; {relatorio['ms_per_text']:.2f} ms/texto.")
+        if relatorio['cosine_min'] < args.min_cosine:
+            print(f" ATENÇÃO: cosseno mínimo abaixo de {args.min_cosine}.")
+            raise SystemExit(1)
@@ -0,0 +1,94 @@
+# field_store.py
+import re
+import pandas as pd
+from utils import extract_field_from_text, montar_texto_nota
+
+# Chave no resultado da busca -> rótulo do campo dentro do bloco 'texto'
+FIELD_LABELS_FOR_PARSING = {
+    'diagnóstico': 'Diagnóstico', 'conclusão': 'Conclusão',
+    'justificativa': 'Justificativa', 'cid': 'CID',
+    'princípio ativo': 'Princípio Ativo', 'nome comercial': 'Nome Comercial',
+    'descrição': 'Descrição', 'tipo da tecnologia': 'Tipo da Tecnologia',
+    'órgão': 'Órgão', 'serventia': 'Serventia'
+}
+
+# Nome da coluna equivalente no DATASET_FINAL_TRATADO, quando difere da chave
+FIELD_COLUMN_NAMES = {'justificativa': 'conclusão justificada'}
+
+
+def _texto_celula(valor):
+    return str(valor) if pd.notna(valor) else ""
+
+
+def _id_celula(valor):
+    # O pandas lê ids inteiros como float quando a coluna tem vazios (104687.0)
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return _texto_celula(valor)
+
+
+def _data_iso(valor):
+    # 'AAAA-MM-DD' (DATASET_FINAL_TRATADO) ou 'DD/MM/AAAA' (texto das notas) -> 'AAAA-MM-DD'; '' se não houver data
+    texto = _texto_celula(valor)
+    iso = re.search(r"(\d{4})-(\d{2})-(\d{2})", texto)
+    if iso:
+        return iso.group(0)
+    br = re.search(r"(\d{2})/(\d{2})/(\d{4})", texto)
+    return f"{br.group(3)}-{br.group(2)}-{br.group(1)}" if br else ""
+
+
+class FieldStore:
+    """
+    Armazenamento colunar dos campos estruturados de cada nota técnica.
+
+    A posição na lista é o id da linha (o mesmo id devolvido pelo índice FAISS), de modo que
+    montar um resultado de busca é apenas uma indexação por coluna, sem regex por requisição.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.size = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_dataframe(cls, dataset):
+        if 'texto' in dataset.columns:
+            textos = [_texto_celula(t) for t in dataset['texto']]
+            campos_do_texto = True
+        else:
+            # DATASET_FINAL_TRATADO: os campos já existem como colunas
+            textos = [montar_texto_nota(row) for _, row in dataset.iterrows()]
+            campos_do_texto = False
+
+        columns = {'texto_original': textos}
+        for key, label_in_text in FIELD_LABELS_FOR_PARSING.items():
+            coluna = FIELD_COLUMN_NAMES.get(key, key)
+            if campos_do_texto or coluna not in dataset.columns:
+                columns[key] = [extract_field_from_text(t, label_in_text) for t in textos]
+            else:
+                columns[key] = [_texto_celula(v) or "N/A" for v in dataset[coluna]]
+
+        # Data de conclusão normalizada (filtros por intervalo em metadata_filters.py)
+        if 'data de conclusão' in dataset.columns:
+            columns['data de conclusão'] = [_data_iso(v) for v in dataset['data de conclusão']]
+        else:
+            columns['data de conclusão'] = [_data_iso(extract_field_from_text(t, 'Data de Conclusão')) for t in textos]
+
+        coluna_referencia = 'referencia' if 'referencia' in dataset.columns else 'link visualização'
+        if coluna_referencia in dataset.columns:
+            columns['referencia'] = [_texto_celula(v) for v in dataset[coluna_referencia]]
+        else:
+            columns['referencia'] = [''] * len(textos)
+
+        # Identificador estável da nota (usado pelo ingest incremental); sem coluna de id, vale a referência
+        coluna_id = next((c for c in ('id', 'ID') if c in dataset.columns), None)
+        if coluna_id is not None:
+            columns['id_nota'] = [_id_celula(v) for v in dataset[coluna_id]]
+        else:
+            columns['id_nota'] = [ref or str(i) for i, ref in enumerate(columns['referencia'])]
+        return cls(columns)
+
+    def __len__(self):
+        return self.size
+
+    def row(self, idx):
+        return {key: values[idx] for key, values in self.columns.items()}
@@ -0,0 +1,15 @@
+# gunicorn.conf.py
+# Launcher de produção do modo ASGI: gunicorn -c gunicorn.conf.py asgi_app:app
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Cada worker carrega seu próprio modelo; o embedding store e o índice em mmap são compartilhados pelo cache do SO
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Troca a quente do snapshot: SIGHUP aos workers (pkill -HUP -P <pid do master>); HUP no master reinicia os workers
+# Respostas longas do LLM (stream) não devem ser derrubadas pelo timeout do worker
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '180'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,262 @@
+# index_factory.py
+import os
+import glob
+import json
+import math
+import time
+import hashlib
+import tempfile
+import faiss
+import numpy as np
+import config
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+
+def auto_nlist(n_vectors):
+    # Heurística usual (~4*sqrt(N)), garantindo ao menos ~39 vetores de treino por centróide
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def factory_string(index_type, n_vectors, dim, nlist=None, hnsw_m=None, pq_m=None, pq_nbits=None):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconhecido: '{index_type}'. Opções: {', '.join(INDEX_TYPES)}")
+    nlist = nlist or config.FAISS_IVF_NLIST or auto_nlist(n_vectors)
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'ivf_flat':
+        return f"IVF{nlist},Flat"
+    if index_type == 'hnsw':
+        return f"HNSW{hnsw_m or config.FAISS_HNSW_M},Flat"
+    pq_m = pq_m or config.FAISS_PQ_M
+    if dim % pq_m != 0:
+        raise ValueError(f"FAISS_PQ_M={pq_m} precisa dividir a dimensão {dim}.")
+    return f"IVF{nlist},PQ{pq_m}x{pq_nbits or config.FAISS_PQ_NBITS}"
+
+
+def build_index(embeddings, index_type=None, nlist=None, hnsw_m=None, ef_construction=None, pq_m=None, pq_nbits=None):
+    """
+    Treina (quando o tipo exige) e popula um índice de produto interno sobre embeddings já normalizados.
+    Os ids no índice são as posições das linhas, como no IndexFlatIP original.
+    """
+    index_type = index_type or config.FAISS_INDEX_TYPE
+    n_vectors, dim = embeddings.shape
+    description = factory_string(index_type, n_vectors, dim, nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m, pq_nbits=pq_nbits)
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+
+    if index_type == 'hnsw':
+        index.hnsw.efConstruction = ef_construction or config.FAISS_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    set_search_params(index)
+    return index
+
+
+def add_rows(index, embeddings, start_id):
+    """
+    Acrescenta vetores cujos ids são as posições `start_id`, `start_id + 1`, ... no embedding store.
+    IVF recebe os ids explicitamente (add_with_ids); Flat e HNSW só numeram em sequência, o que dá o mesmo resultado.
+    """
+    if index.ntotal != start_id:
+        raise ValueError(f"Índice com {index.ntotal} vetores; esperado {start_id} antes de acrescentar.")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if faiss.try_extract_index_ivf(index) is not None:
+        index.add_with_ids(embeddings, np.arange(start_id, start_id + len(embeddings), dtype=np.int64))
+    else:
+        index.add(embeddings)
+
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Define os parâmetros padrão de busca do índice (nprobe para IVF, efSearch para HNSW)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or config.FAISS_IVF_NPROBE, ivf.nlist)
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efSearch = ef_search or config.FAISS_HNSW_EF_SEARCH
+
+
+def search_parameters(index, nprobe=None, ef_search=None, sel=None):
+    """
+    Parâmetros por consulta (sem alterar o índice compartilhado entre threads),
+    ou None quando não há nada a sobrescrever. `sel` (um faiss.IDSelector) restringe os ids candidatos.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (nprobe or sel is not None):
+        # Sem nprobe explícito, mantém o padrão do índice (SearchParametersIVF usaria 1)
+        return faiss.SearchParametersIVF(nprobe=int(nprobe or ivf.nprobe), sel=sel)
+    if hasattr(index, 'hnsw') and (ef_search or sel is not None):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search or index.hnsw.efSearch), sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def _arquivo_temporario(path):
+    # Nome exclusivo por gravação: workers diferentes nunca escrevem no mesmo arquivo temporário
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    os.close(fd)
+    return tmp_path
+
+
+def _substituir(tmp_path, path, gravar):
+    try:
+        gravar(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def save_index(index, path):
+    _substituir(_arquivo_temporario(path), path, lambda tmp_path: faiss.write_index(index, tmp_path))
+
+
+def _write_json_atomic(path, data):
+    def gravar(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    _substituir(_arquivo_temporario(path), path, gravar)
+
+
+def load_index(path, mmap=False):
+    if mmap:
+        try:
+            # Páginas do índice compartilhadas entre workers via cache do SO
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f" Index Factory: mmap não suportado para {os.path.basename(path)} ({e}); lendo para a memória.")
+    return faiss.read_index(path)
+
+
+def index_paths(index_type, index_dir=None, version=None):
+    """Caminhos do arquivo do índice (versionado, quando `version` é dado) e do meta que aponta para ele."""
+    index_dir = index_dir or config.FAISS_INDEX_DIR
+    base = os.path.join(index_dir, index_type)
+    index_path = f"{base}.{version}.index" if version else f"{base}.index"
+    return index_path, f"{base}.meta.json"
+
+
+def build_params(index_type):
+    """Parâmetros de construção configurados para o tipo; um índice gravado com outros valores é reconstruído."""
+    if index_type == 'ivf_flat':
+        return {'nlist': config.FAISS_IVF_NLIST}
+    if index_type == 'hnsw':
+        return {'hnsw_m': config.FAISS_HNSW_M, 'ef_construction': config.FAISS_HNSW_EF_CONSTRUCTION}
+    if index_type == 'ivf_pq':
+        return {'nlist': config.FAISS_IVF_NLIST, 'pq_m': config.FAISS_PQ_M, 'pq_nbits': config.FAISS_PQ_NBITS}
+    return {}
+
+
+def _factory_do_indice(index, index_type):
+    # Descrição do índice como ele foi de fato construído (com nlist automático, o nº de listas usado no treino)
+    ivf = faiss.try_extract_index_ivf(index)
+    nlist = ivf.nlist if ivf is not None else None
+    hnsw_m = index.hnsw.nb_neighbors(1) if hasattr(index, 'hnsw') else None
+    pq_m = pq_nbits = None
+    if index_type == 'ivf_pq':
+        pq = faiss.downcast_index(ivf).pq
+        pq_m, pq_nbits = pq.M, pq.nbits
+    return factory_string(index_type, index.ntotal, index.d, nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m, pq_nbits=pq_nbits)
+
+
+def _index_meta(index, index_type, embeddings_checksum):
+    return {
+        'index_type': index_type,
+        'factory': _factory_do_indice(index, index_type),
+        'build_params': build_params(index_type),
+        'embeddings_checksum': embeddings_checksum,
+        'ntotal': int(index.ntotal),
+        'dim': int(index.d),
+    }
+
+
+def _ler_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f" Index Factory: Meta do índice ilegível em {os.path.basename(meta_path)} ({e}).")
+        return None
+
+
+def _remover_versoes_antigas(index_type, index_dir, manter):
+    # Só apaga versões não apontadas pelo meta e já antigas: a de outro worker, recém-gravada, ainda vai ser publicada
+    limite = time.time() - config.FAISS_INDEX_KEEP_SECONDS
+    padroes = (f"{index_type}.*.index", f"{index_type}.index")
+    for caminho in (c for padrao in padroes for c in glob.glob(os.path.join(index_dir, padrao))):
+        try:
+            if os.path.basename(caminho) not in manter and os.path.getmtime(caminho) < limite:
+                os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def write_index_with_meta(index, index_type, embeddings_checksum, index_dir=None):
+    """
+    Grava o índice num arquivo versionado e só então troca o meta, que aponta para ele: quem lê o meta
+    sempre encontra o índice correspondente. A versão anterior continua no disco para quem acabou de
+    ler o meta antigo; as demais são apagadas depois de FAISS_INDEX_KEEP_SECONDS.
+    """
+    meta = _index_meta(index, index_type, embeddings_checksum)
+    version = hashlib.sha256(json.dumps(meta, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    index_path, meta_path = index_paths(index_type, index_dir, version)
+    index_dir = os.path.dirname(index_path)
+    os.makedirs(index_dir, exist_ok=True)
+    anterior = _ler_meta(meta_path) or {}
+    meta['index_file'] = os.path.basename(index_path)
+    meta['previous_index_file'] = anterior.get('index_file')
+
+    save_index(index, index_path)
+    _write_json_atomic(meta_path, meta)
+    _remover_versoes_antigas(index_type, index_dir, {meta['index_file'], meta['previous_index_file']})
+    return index_path
+
+
+def load_index_if_fresh(index_type, embeddings_checksum, expected_ntotal, index_dir=None, mmap=None):
+    """
+    Lê o índice persistido se ele foi construído a partir destes embeddings e com os parâmetros atuais;
+    senão (ou se o meta/índice estiver ilegível) devolve None e quem chamou reconstrói.
+    """
+    _, meta_path = index_paths(index_type, index_dir)
+    meta = _ler_meta(meta_path)
+    if meta is None:
+        return None
+    if meta.get('embeddings_checksum') != embeddings_checksum or meta.get('ntotal') != expected_ntotal:
+        print(f" Index Factory: Índice persistido '{index_type}' desatualizado (checksum diferente).")
+        return None
+    if meta.get('build_params') != build_params(index_type) or not meta.get('index_file'):
+        print(f" Index Factory: Índice persistido '{index_type}' construído com outros parâmetros ({meta.get('factory')}).")
+        return None
+
+    index_path = os.path.join(os.path.dirname(meta_path), meta['index_file'])
+    try:
+        index = load_index(index_path, mmap=config.FAISS_INDEX_MMAP if mmap is None else mmap)
+    except (RuntimeError, OSError) as e:
+        print(f" Index Factory: Falha ao ler o índice persistido {meta['index_file']} ({e}).")
+        return None
+    if index.ntotal != expected_ntotal or index.d != meta.get('dim'):
+        print(f" Index Factory: Índice {meta['index_file']} não confere com o meta ({index.ntotal} vetores).")
+        return None
+    set_search_params(index)
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+    from embedding_store import load_normalized_embeddings, source_checksum
+
+    parser = argparse.ArgumentParser(description="Treina, popula e grava o índice FAISS pronto para consulta, junto com o checksum dos embeddings.")
+    parser.add_argument('--type', choices=INDEX_TYPES, default=config.FAISS_INDEX_TYPE)
+    parser.add_argument('--index-dir', default=config.FAISS_INDEX_DIR)
+    args = parser.parse_args()
+
+    embeddings = load_normalized_embeddings()
+    checksum = source_checksum()
+    inicio = time.perf_counter()
+    index = build_index(embeddings, args.type)
+    index_path = write_index_with_meta(index, args.type, checksum, args.index_dir)
+    print(f" Índice '{args.type}' com {index.ntotal} vetores gravado em {index_path} ({time.perf_counter() - inicio:.2f}s, checksum {checksum[:12]}).")
@@ -0,0 +1,120 @@
+# ingest.py
+"""
+Ingest incremental de notas técnicas no embedding store e no índice FAISS persistido.
+
+Só as notas novas (id_nota ainda não indexado) ou alteradas são codificadas e acrescentadas ao fim
+do store; a versão anterior de uma nota alterada, e as notas removidas, viram tombstones.
+O serviço em execução percebe a nova revisão (EMBEDDING_STORE_WATCH_SECONDS) e troca o snapshot sem reiniciar.
+
+    python ingest.py --dataset novas_notas.csv
+    python ingest.py --dataset dataset_completo.csv --remove-missing
+    python ingest.py --delete 104687 96610
+"""
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import config
+from field_store import FieldStore
+from embedding_store import EmbeddingStore, store_exists, append_to_store
+from index_factory import INDEX_TYPES, add_rows, build_index, load_index_if_fresh, write_index_with_meta
+
+
+def planejar_ingest(store_fields, tombstones, novas, remove_missing=False, ids_removidos=()):
+    """
+    Compara as notas de entrada com as linhas vivas do store pelo id_nota.
+    Devolve (posições em `novas` a acrescentar, posições do store a marcar como tombstone).
+    """
+    if 'id_nota' not in store_fields.columns:
+        raise ValueError("Store sem a coluna 'id_nota'; regenere-o com 'python embedding_store.py' antes do ingest.")
+    removidas = set(tombstones)
+    vivos = {id_nota: pos for pos, id_nota in enumerate(store_fields.columns['id_nota']) if pos not in removidas}
+
+    # Com ids repetidos na entrada, vale a última ocorrência
+    ultima_por_id = {id_nota: i for i, id_nota in enumerate(novas.columns['id_nota'])} if novas is not None else {}
+
+    acrescentar, novos_tombstones = [], set()
+    for id_nota, i in sorted(ultima_por_id.items(), key=lambda item: item[1]):
+        pos = vivos.get(id_nota)
+        if pos is not None and store_fields.row(pos) == novas.row(i):
+            continue
+        if pos is not None:
+            novos_tombstones.add(pos)
+        acrescentar.append(i)
+
+    if remove_missing:
+        novos_tombstones.update(pos for id_nota, pos in vivos.items() if id_nota not in ultima_por_id)
+    for id_nota in ids_removidos:
+        if id_nota in vivos:
+            novos_tombstones.add(vivos[id_nota])
+    return acrescentar, sorted(novos_tombstones)
+
+
+def ingest(dataset_path=None, remove_missing=False, ids_removidos=(), store_dir=None, index_type=None, index_dir=None):
+    store_dir = store_dir or config.EMBEDDING_STORE_DIR
+    index_type = index_type or config.FAISS_INDEX_TYPE
+    if not store_exists(store_dir):
+        raise FileNotFoundError(f"Embedding store não encontrado em {store_dir}; gere-o com 'python embedding_store.py'.")
+
+    store = EmbeddingStore.open(store_dir, mmap=False)
+    if store.header['model_name'] != config.MODEL_NAME_SEMANTIC:
+        raise ValueError(f"Store gerado com {store.header['model_name']}, mas MODEL_NAME_SEMANTIC é {config.MODEL_NAME_SEMANTIC}.")
+    linhas_antes = len(store.field_store)
+    # As notas novas são codificadas com o backend das linhas já gravadas (registrado pelo embedding_job),
+    # para não misturar vetores de dois encoders no mesmo índice; stores sem o campo vieram do torch
+    backend = store.header.get('encoder_backend') or 'torch'
+
+    novas = FieldStore.from_dataframe(pd.read_csv(dataset_path)) if dataset_path else None
+    acrescentar, tombstones = planejar_ingest(store.field_store, store.tombstones, novas, remove_missing, ids_removidos)
+    if not acrescentar and not tombstones:
+        print(" Ingest: nenhuma nota nova, alterada ou removida.")
+        return store.header
+
+    delta = FieldStore({key: [values[i] for i in acrescentar] for key, values in novas.columns.items()}) if acrescentar \
+        else FieldStore({key: [] for key in store.field_store.columns})
+    embeddings = np.zeros((0, int(store.header['dim'])), dtype=np.float32)
+    if acrescentar:
+        from encoder_backends import carregar_encoder
+        inicio = time.perf_counter()
+        if backend != config.ENCODER_BACKEND:
+            print(f" Ingest: store codificado com o backend '{backend}' (ENCODER_BACKEND é '{config.ENCODER_BACKEND}'); usando '{backend}'.")
+        encoder = carregar_encoder(backend)
+        embeddings = np.asarray(encoder.encode(delta.columns['texto_original'], normalize_embeddings=True,
+                                               batch_size=config.ENCODE_BATCH_SIZE), dtype=np.float32)
+        print(f" Ingest: {len(acrescentar)} notas codificadas em {time.perf_counter() - inicio:.2f}s.")
+
+    # Parte do índice persistido para o checksum atual; se não houver, reconstrói com as linhas antigas + as novas
+    index = load_index_if_fresh(index_type, store.checksum, linhas_antes, index_dir, mmap=False) if acrescentar else None
+
+    def gravar_indice(header):
+        if not acrescentar:
+            return
+        if index is not None:
+            add_rows(index, embeddings, linhas_antes)
+            novo_indice = index
+        else:
+            # O cabeçalho em disco ainda tem o nº de linhas antigo: a matriz é montada aqui, com header['rows'] linhas
+            novo_indice = build_index(np.vstack([np.asarray(store.embeddings), embeddings]), index_type)
+        write_index_with_meta(novo_indice, index_type, header['checksum'], index_dir)
+
+    header = append_to_store(store_dir, embeddings, delta, tombstones, before_header=gravar_indice)
+    print(f" Ingest: revisão {header['revision']} com {header['rows']} linhas; {len(acrescentar)} acrescentadas, "
+          f"{len(tombstones)} novos tombstones ({len(header['tombstones'])} no total).")
+    return header
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=None, help="CSV com as notas novas/atualizadas (mesmo formato do dataset)")
+    parser.add_argument('--remove-missing', action='store_true', help="Marca como removidas as notas ausentes do CSV")
+    parser.add_argument('--delete', nargs='*', default=[], metavar='ID_NOTA')
+    parser.add_argument('--store-dir', default=config.EMBEDDING_STORE_DIR)
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default=config.FAISS_INDEX_TYPE)
+    parser.add_argument('--index-dir', default=config.FAISS_INDEX_DIR)
+    args = parser.parse_args()
+    if not args.dataset and not args.delete:
+        parser.error("informe --dataset e/ou --delete")
+    if args.remove_missing and not args.dataset:
+        parser.error("--remove-missing exige --dataset")
+
+    ingest(args.dataset, args.remove_missing, args.delete, args.store_dir, args.index_type, args.index_dir)
@@ -0,0 +1,348 @@
+# llm_resilience.py
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+# Nomes das exceções (google.api_core / grpc / rede) em que uma nova tentativa faz sentido
+ERROS_RETENTAVEIS = ('ServiceUnavailable', 'ResourceExhausted', 'TooManyRequests', 'DeadlineExceeded',
+                     'InternalServerError', 'Aborted', 'GatewayTimeout', 'BadGateway',
+                     'TimeoutError', 'ConnectionError', 'PrazoDaChamadaEsgotadoError')
+
+
+class LLMIndisponivelError(RuntimeError):
+    """O LLM não respondeu (circuito aberto, prazo esgotado ou tentativas esgotadas); o chamador deve usar o fallback."""
+
+
+class PrazoDaChamadaEsgotadoError(TimeoutError):
+    """Uma tentativa passou do prazo por chamada (LLM_CALL_TIMEOUT_SECONDS)."""
+
+
+def erro_retentavel(erro):
+    return type(erro).__name__ in ERROS_RETENTAVEIS or isinstance(erro, (TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    """
+    Abre quando a taxa de erro das últimas `janela` tentativas passa de `taxa_erro` (com pelo menos
+    `min_chamadas` na janela). Aberto, recusa chamadas por `cooldown_seconds`; depois deixa passar
+    uma única chamada de teste (meio aberto), que fecha o circuito se der certo ou o reabre se falhar.
+    """
+    FECHADO, ABERTO, MEIO_ABERTO = 'closed', 'open', 'half_open'
+
+    def __init__(self, janela=20, taxa_erro=0.5, min_chamadas=10, cooldown_seconds=30.0, relogio=time.monotonic):
+        self.taxa_erro = taxa_erro
+        self.min_chamadas = min_chamadas
+        self.cooldown_seconds = cooldown_seconds
+        self.relogio = relogio
+        self._resultados = deque(maxlen=janela)
+        self._lock = threading.Lock()
+        self.estado = self.FECHADO
+        self._aberto_em = 0.0
+        self._teste_em_andamento = False
+        self.aberturas = 0
+        self.recusadas = 0
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.ABERTO and self.relogio() - self._aberto_em >= self.cooldown_seconds:
+                self.estado = self.MEIO_ABERTO
+                self._teste_em_andamento = False
+            if self.estado == self.MEIO_ABERTO and not self._teste_em_andamento:
+                self._teste_em_andamento = True
+                return True
+            self.recusadas += 1
+            return False
+
+    def registrar(self, sucesso):
+        with self._lock:
+            if self.estado == self.MEIO_ABERTO:
+                self._teste_em_andamento = False
+                if sucesso:
+                    self.estado = self.FECHADO
+                    self._resultados.clear()
+                    print(" LLM Service: Circuit breaker fechado (chamada de teste bem-sucedida).")
+                else:
+                    self._abrir()
+                return
+            self._resultados.append(bool(sucesso))
+            falhas = self._resultados.count(False)
+            if (self.estado == self.FECHADO and len(self._resultados) >= self.min_chamadas
+                    and falhas / len(self._resultados) >= self.taxa_erro):
+                self._abrir()
+
+    def _abrir(self):
+        self.estado = self.ABERTO
+        self._aberto_em = self.relogio()
+        self.aberturas += 1
+        print(f" LLM Service: Circuit breaker aberto; chamadas ao LLM suspensas por {self.cooldown_seconds:.0f}s.")
+
+    def stats(self):
+        with self._lock:
+            n = len(self._resultados)
+            return {
+                'state': self.estado,
+                'window_calls': n,
+                'window_error_rate': round(self._resultados.count(False) / n, 3) if n else 0.0,
+                'opened_total': self.aberturas,
+                'rejected_total': self.recusadas,
+            }
+
+
+class ChamadaResiliente:
+    """
+    Executa chamadas ao LLM com prazo por tentativa, novas tentativas com backoff exponencial e jitter
+    (só para erros retentáveis e dentro do prazo total), requisição "hedged" opcional e circuit breaker.
+
+    O hedge dispara uma segunda chamada idêntica se a primeira não responder até o p95 das latências
+    recentes (depois de `hedge_min_amostras` chamadas bem-sucedidas); vale a primeira que terminar.
+    Na versão síncrona as tentativas rodam em um pool de threads para que o prazo valha mesmo sem
+    suporte a timeout no cliente; uma tentativa que estoura o prazo é abandonada (não interrompida) e
+    continua ocupando a sua vaga até terminar. As vagas (`max_threads`) limitam as chamadas em voo:
+    sem vaga, a chamada espera no máximo `espera_por_vaga_seconds` (dentro do prazo total) e falha como
+    sobrecarregada, e o prazo da tentativa só corre depois que ela começa a rodar. Só erros retentáveis e estouros de prazo contam como falha para o circuit breaker.
+    """
+
+    def __init__(self, timeout_seconds, prazo_total_seconds, max_retries, backoff_base_seconds, backoff_max_seconds,
+                 breaker=None, hedge=False, hedge_percentil=95, hedge_min_amostras=20, max_threads=16, janela_latencias=256,
+                 espera_por_vaga_seconds=0.5):
+        self.timeout_seconds = timeout_seconds
+        self.prazo_total_seconds = prazo_total_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_percentil = hedge_percentil
+        self.hedge_min_amostras = hedge_min_amostras
+        self._latencias = deque(maxlen=janela_latencias)
+        self._lock = threading.Lock()
+        self.max_threads = max_threads
+        self.espera_por_vaga_seconds = espera_por_vaga_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='llm-call')
+        # Uma vaga por thread: nenhuma tentativa fica na fila do pool, mesmo com tentativas abandonadas rodando
+        self._vagas = threading.BoundedSemaphore(max_threads)
+        self.chamadas = 0
+        self.tentativas = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedges_vencedores = 0
+        self.timeouts = 0
+        self.falhas = 0
+        self.sem_vaga = 0
+        self.em_voo = 0
+
+    # --- Suporte ---
+    def _atraso_hedge(self):
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._latencias) < self.hedge_min_amostras:
+                return None
+            return float(np.percentile(self._latencias, self.hedge_percentil))
+
+    def _backoff(self, tentativa):
+        # "Full jitter": espera aleatória entre 0 e o teto exponencial
+        return random.uniform(0.0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** tentativa)))
+
+    def _registrar(self, inicio=None, erro=None, hedge_venceu=False):
+        # Erros não retentáveis (requisição inválida, permissão...) não dizem nada sobre a saúde do serviço
+        self.breaker.registrar(erro is None or not erro_retentavel(erro))
+        with self._lock:
+            self.tentativas += 1
+            if erro is None and inicio is not None:
+                self._latencias.append(time.monotonic() - inicio)
+            if isinstance(erro, PrazoDaChamadaEsgotadoError):
+                self.timeouts += 1
+            if hedge_venceu:
+                self.hedges_vencedores += 1
+
+    def _proxima_tentativa(self, erro, tentativa, limite):
+        """Segundos de espera antes da próxima tentativa, ou None se não deve haver outra."""
+        if not erro_retentavel(erro) or tentativa >= self.max_retries:
+            return None
+        espera = self._backoff(tentativa)
+        if time.monotonic() + espera + 0.1 >= limite:
+            return None
+        with self._lock:
+            self.retries += 1
+        print(f" LLM Service: Tentativa {tentativa + 1} falhou ({type(erro).__name__}); nova tentativa em {espera:.2f}s.")
+        return espera
+
+    def _falhar(self, erro):
+        with self._lock:
+            self.falhas += 1
+        raise LLMIndisponivelError(f"{type(erro).__name__}: {erro}") from erro
+
+    # --- Síncrono ---
+    def executar(self, fn, hedge=True):
+        """Chama `fn()` com a política; devolve o resultado ou levanta LLMIndisponivelError."""
+        with self._lock:
+            self.chamadas += 1
+        limite = time.monotonic() + self.prazo_total_seconds
+        tentativa = 0
+        while True:
+            # A vaga vem antes do breaker: a chamada de teste do meio aberto nunca fica sem rodar
+            espera = min(self.espera_por_vaga_seconds, max(limite - time.monotonic(), 0.0))
+            if not self._vagas.acquire(timeout=espera):
+                # Saturação local, não falha do serviço: não conta para o breaker e vai logo para o fallback
+                with self._lock:
+                    self.sem_vaga += 1
+                self._falhar(RuntimeError(f"sobrecarregado: as {self.max_threads} vagas de chamada continuaram ocupadas por {espera:.2f}s"))
+            if not self.breaker.permitir():
+                self._vagas.release()
+                self._falhar(RuntimeError("circuit breaker aberto"))
+            try:
+                resultado, inicio, hedge_venceu = self._tentativa(fn, self._submeter(fn), limite, hedge)
+            except Exception as e:
+                self._registrar(erro=e)
+                espera = self._proxima_tentativa(e, tentativa, limite)
+                if espera is None:
+                    self._falhar(e)
+                time.sleep(espera)
+                tentativa += 1
+                continue
+            self._registrar(inicio, hedge_venceu=hedge_venceu)
+            return resultado
+
+    def _submeter(self, fn):
+        """
+        Submete `fn` ao pool numa vaga já obtida, que só é devolvida quando `fn` termina (ou se a tarefa
+        for cancelada antes de rodar). Devolve (futuro, iniciou, inicio): `iniciou` é marcado e `inicio[0]`
+        preenchido quando `fn` começa a rodar.
+        """
+        iniciou, inicio = threading.Event(), []
+
+        def rodar():
+            inicio.append(time.monotonic())
+            iniciou.set()
+            try:
+                return fn()
+            finally:
+                self._liberar_vaga()
+
+        with self._lock:
+            self.em_voo += 1
+        try:
+            return self._pool.submit(rodar), iniciou, inicio
+        except BaseException:
+            self._liberar_vaga()
+            raise
+
+    def _liberar_vaga(self):
+        with self._lock:
+            self.em_voo -= 1
+        self._vagas.release()
+
+    def _cancelar(self, futuro):
+        if futuro.cancel():
+            self._liberar_vaga()
+
+    def _tentativa(self, fn, submetida, limite, hedge):
+        """(resultado, início da chamada vencedora, se o hedge venceu); o prazo corre a partir do início de `fn`."""
+        primeiro, iniciou, inicio = submetida
+        # Com a vaga garantida uma thread pega a tarefa logo; o prazo total ainda vale se não pegar
+        if not iniciou.wait(timeout=max(limite - time.monotonic(), 0.0)):
+            self._cancelar(primeiro)
+            raise RuntimeError("a chamada não começou a rodar dentro do prazo total")
+        prazo = min(inicio[0] + self.timeout_seconds, limite)
+        futuros = [primeiro]
+        inicios = {primeiro: inicio}
+        atraso = self._atraso_hedge() if hedge else None
+        if atraso is not None and inicio[0] + atraso < prazo:
+            prontos, _ = wait(futuros, timeout=max(inicio[0] + atraso - time.monotonic(), 0.0))
+            # O hedge só sai se houver vaga livre na hora; não espera por ela
+            if not prontos and self._vagas.acquire(blocking=False):
+                with self._lock:
+                    self.hedges += 1
+                segundo, _, inicio_segundo = self._submeter(fn)
+                futuros.append(segundo)
+                inicios[segundo] = inicio_segundo
+        erro = None
+        while futuros:
+            prontos, _ = wait(futuros, timeout=max(prazo - time.monotonic(), 0.0), return_when=FIRST_COMPLETED)
+            if not prontos:
+                raise PrazoDaChamadaEsgotadoError(f"sem resposta em {prazo - inicio[0]:.1f}s")
+            for futuro in prontos:
+                futuros.remove(futuro)
+                if futuro.exception() is None:
+                    for pendente in futuros:
+                        self._cancelar(pendente)
+                    return futuro.result(), inicios[futuro][0], futuro is not primeiro
+                erro = futuro.exception()
+        raise erro
+
+    # --- Assíncrono ---
+    async def executar_async(self, fabrica, hedge=True):
+        """Como `executar`, com `fabrica()` devolvendo uma corrotina nova a cada tentativa."""
+        with self._lock:
+            self.chamadas += 1
+        limite = time.monotonic() + self.prazo_total_seconds
+        tentativa = 0
+        while True:
+            if not self.breaker.permitir():
+                self._falhar(RuntimeError("circuit breaker aberto"))
+            inicio = time.monotonic()
+            try:
+                resultado, hedge_venceu = await self._tentativa_async(fabrica, min(self.timeout_seconds, limite - inicio), hedge)
+            except Exception as e:
+                self._registrar(erro=e)
+                espera = self._proxima_tentativa(e, tentativa, limite)
+                if espera is None:
+                    self._falhar(e)
+                await asyncio.sleep(espera)
+                tentativa += 1
+                continue
+            self._registrar(inicio, hedge_venceu=hedge_venceu)
+            return resultado
+
+    async def _tentativa_async(self, fabrica, timeout, hedge):
+        prazo = time.monotonic() + max(timeout, 0.0)
+        tarefas = [asyncio.ensure_future(fabrica())]
+        primeira = tarefas[0]
+        try:
+            atraso = self._atraso_hedge() if hedge else None
+            if atraso is not None and atraso < timeout:
+                prontas, _ = await asyncio.wait(tarefas, timeout=atraso)
+                if not prontas:
+                    with self._lock:
+                        self.hedges += 1
+                    tarefas.append(asyncio.ensure_future(fabrica()))
+            erro = None
+            while tarefas:
+                prontas, _ = await asyncio.wait(tarefas, timeout=max(prazo - time.monotonic(), 0.0), return_when=asyncio.FIRST_COMPLETED)
+                if not prontas:
+                    raise PrazoDaChamadaEsgotadoError(f"sem resposta em {timeout:.1f}s")
+                for tarefa in prontas:
+                    tarefas.remove(tarefa)
+                    if tarefa.exception() is None:
+                        return tarefa.result(), tarefa is not primeira
+                    erro = tarefa.exception()
+            raise erro
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    def stats(self):
+        with self._lock:
+            latencias = np.array(self._latencias) if self._latencias else None
+            stats = {
+                'calls': self.chamadas,
+                'attempts': self.tentativas,
+                'retries': self.retries,
+                'timeouts': self.timeouts,
+                'failures': self.falhas,
+                'hedges': self.hedges,
+                'hedges_won': self.hedges_vencedores,
+                'no_slot': self.sem_vaga,
+                'in_flight': self.em_voo,
+                'latency_s_p50': round(float(np.percentile(latencias, 50)), 3) if latencias is not None else None,
+                'latency_s_p95': round(float(np.percentile(latencias, 95)), 3) if latencias is not None else None,
+            }
+        stats['breaker'] = self.breaker.stats()
+        return stats
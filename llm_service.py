@@ -1,19 +1,65 @@
 import os
+import re
+import asyncio
+import itertools
 import vertexai
 from vertexai.generative_models import GenerativeModel, Part, HarmCategory, HarmBlockThreshold
-from config import GOOGLE_CREDENTIALS_PATH, MODEL_NAME_LLM 
+from config import (GOOGLE_CREDENTIALS_PATH, MODEL_NAME_LLM, LLM_RESPONSE_CACHE_ENABLED, LLM_RESPONSE_CACHE_MAX_SIZE,
+                    LLM_RESPONSE_CACHE_TTL_SECONDS, LLM_RESPONSE_CACHE_NEAR_DUPLICATE, LLM_RESPONSE_CACHE_NEAR_THRESHOLD,
+                    LLM_CONTEXT_CACHE_ENABLED, LLM_CONTEXT_CACHE_TTL_SECONDS, LLM_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS,
+                    LLM_CONTEXT_CACHE_RETRY_SECONDS,
+                    LLM_CALL_TIMEOUT_SECONDS, LLM_TOTAL_DEADLINE_SECONDS, LLM_MAX_RETRIES, LLM_RETRY_BACKOFF_BASE_SECONDS,
+                    LLM_RETRY_BACKOFF_MAX_SECONDS, LLM_HEDGE_ENABLED, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_SAMPLES,
+                    LLM_BREAKER_WINDOW, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_COOLDOWN_SECONDS,
+                    LLM_CALL_THREADS, LLM_CALL_SLOT_WAIT_SECONDS)
+from response_cache import ResponseCache, response_cache_key
+from context_cache import CacheDeInstrucaoDoSistema
+from llm_resilience import ChamadaResiliente, CircuitBreaker, LLMIndisponivelError
+from metrics import cronometro, CACHE_LOOKUPS
+
+MSG_LLM_INDISPONIVEL = "Desculpe, o assistente de enriquecimento de respostas não está disponível no momento."
+MSG_BLOQUEIO_SEGURANCA = "A resposta não pôde ser gerada devido a restrições de segurança do conteúdo."
+MSG_SEM_RESPOSTA = "Não foi possível gerar uma resposta neste momento. Tente reformular sua pergunta."
+PREFIXO_ERRO_LLM = "Erro ao consultar o modelo de linguagem"
+
+# Erros do Vertex que podem indicar cached content expirado/removido (os demais não passam para o caminho inline)
+ERROS_DE_CONTEXT_CACHE = ('NotFound', 'FailedPrecondition')
+_MENCAO_AO_CACHE = re.compile(r'cached[\s_]*contents?', re.IGNORECASE)
+
+
+def _erro_de_context_cache(erro):
+    # Um NotFound/FailedPrecondition de uma requisição comum (modelo ou recurso inexistente) não desativa
+    # o cache nem repete a chamada inline: só os que citam o cached content
+    return type(erro).__name__ in ERROS_DE_CONTEXT_CACHE and _MENCAO_AO_CACHE.search(str(erro)) is not None
+
+
+def criar_chamada_resiliente():
+    breaker = CircuitBreaker(LLM_BREAKER_WINDOW, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_COOLDOWN_SECONDS)
+    return ChamadaResiliente(LLM_CALL_TIMEOUT_SECONDS, LLM_TOTAL_DEADLINE_SECONDS, LLM_MAX_RETRIES,
+                             LLM_RETRY_BACKOFF_BASE_SECONDS, LLM_RETRY_BACKOFF_MAX_SECONDS, breaker=breaker,
+                             hedge=LLM_HEDGE_ENABLED, hedge_percentil=LLM_HEDGE_PERCENTILE,
+                             hedge_min_amostras=LLM_HEDGE_MIN_SAMPLES, max_threads=LLM_CALL_THREADS,
+                             espera_por_vaga_seconds=LLM_CALL_SLOT_WAIT_SECONDS)
 
 class EnriquecedorLLM:
-    def __init__(self, project_id, location):
+    def __init__(self, project_id, location, model=None, context_cache_client=None, resiliencia=None):
         self.model_ready = False
         self.model = None
+        self.context_cache = None
+        # Prazo, retries, hedge e circuit breaker das chamadas ao Vertex (llm_resilience.py)
+        self.resiliencia = resiliencia or criar_chamada_resiliente()
+        self.response_cache = None
+        if LLM_RESPONSE_CACHE_ENABLED:
+            near_threshold = LLM_RESPONSE_CACHE_NEAR_THRESHOLD if LLM_RESPONSE_CACHE_NEAR_DUPLICATE else None
+            self.response_cache = ResponseCache(LLM_RESPONSE_CACHE_MAX_SIZE, LLM_RESPONSE_CACHE_TTL_SECONDS, near_threshold)
         try:
             if "GOOGLE_APPLICATION_CREDENTIALS" not in os.environ and \
                GOOGLE_CREDENTIALS_PATH and os.path.exists(GOOGLE_CREDENTIALS_PATH):
                 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_CREDENTIALS_PATH
             
-            vertexai.init(project=project_id, location=location)
-            print(f" LLM Service: Vertex AI inicializado para projeto {project_id} em {location}.")
+            if model is None:
+                vertexai.init(project=project_id, location=location)
+                print(f" LLM Service: Vertex AI inicializado para projeto {project_id} em {location}.")
             
             self.system_instruction = [
                 Part.from_text("Você é um assistente jurídico especializado, respondendo em português do Brasil."),
@@ -41,13 +87,21 @@ class EnriquecedorLLM:
                 Part.from_text("O objetivo final é prover uma análise rápida, precisa e útil, que auxilie na tomada de decisão ou na pesquisa de profissionais do direito.")
             ]
             
-            self.model = GenerativeModel(
+            # `model` permite substituir o GenerativeModel por um stub local (testes/benchmarks)
+            self.model = model or GenerativeModel(
                 MODEL_NAME_LLM, 
                 system_instruction=self.system_instruction
             )
             print(f" LLM Service: Modelo LLM ({MODEL_NAME_LLM}) inicializado.")
             self.model_ready = True
 
+            # Com um stub no lugar do GenerativeModel, o context cache só é usado se o cliente também for um stub
+            if LLM_CONTEXT_CACHE_ENABLED and (model is None or context_cache_client is not None):
+                self.context_cache = CacheDeInstrucaoDoSistema(
+                    MODEL_NAME_LLM, self.system_instruction, LLM_CONTEXT_CACHE_TTL_SECONDS,
+                    LLM_CONTEXT_CACHE_REFRESH_MARGIN_SECONDS, LLM_CONTEXT_CACHE_RETRY_SECONDS, cliente=context_cache_client)
+                print(f" LLM Service: Context caching da system instruction ativo (TTL {LLM_CONTEXT_CACHE_TTL_SECONDS}s).")
+
         except Exception as e:
             print(f" LLM Service: Erro ao inicializar EnriquecedorLLM: {e}")
 
@@ -63,34 +117,318 @@ class EnriquecedorLLM:
             "top_p": 0.95,
         }
     
+    def _consultar_cache(self, consulta, ids_resultados, query_embedding, usar_cache, namespace=None):
+        """
+        Devolve (chave, resposta_em_cache, status); chave None quando o cache não se aplica.
+        `namespace` é o do snapshot de busca que produziu `ids_resultados` (posições de linha).
+        """
+        if self.response_cache is None or consulta is None or ids_resultados is None:
+            return None, None, 'disabled'
+        if not usar_cache:
+            CACHE_LOOKUPS.inc(cache='llm_response', result='bypass')
+            return None, None, 'bypass'
+        key = response_cache_key(consulta, ids_resultados, MODEL_NAME_LLM, self.generation_config, namespace)
+        resposta, status = self.response_cache.get(key, ids_resultados, query_embedding, namespace)
+        CACHE_LOOKUPS.inc(cache='llm_response', result=status)
+        if resposta is not None:
+            print(f" LLM Service: Resposta servida do cache ({status}).")
+        return key, resposta, status
+
+    def _gravar_cache(self, key, resposta, ids_resultados, query_embedding, namespace=None):
+        if key is not None and self._resposta_cacheavel(resposta):
+            self.response_cache.set(key, resposta, ids_resultados, query_embedding, namespace)
+
+    def responder(self, contexto_completo, consulta=None, ids_resultados=None, query_embedding=None, usar_cache=True, namespace=None):
+        """
+        Igual a gerar_resposta_enriquecida, passando antes pelo cache de respostas.
+        Devolve (texto, status_cache), com status_cache em 'hit', 'near_hit', 'miss', 'bypass' ou 'disabled'.
+        """
+        key, resposta, status = self._consultar_cache(consulta, ids_resultados, query_embedding, usar_cache, namespace)
+        if resposta is not None:
+            return resposta, status
+        resposta = self.gerar_resposta_enriquecida(contexto_completo)
+        self._gravar_cache(key, resposta, ids_resultados, query_embedding, namespace)
+        return resposta, status
+
+    async def responder_async(self, contexto_completo, consulta=None, ids_resultados=None, query_embedding=None, usar_cache=True, namespace=None):
+        """Versão assíncrona de `responder`, usando o cliente assíncrono do Vertex."""
+        key, resposta, status = self._consultar_cache(consulta, ids_resultados, query_embedding, usar_cache, namespace)
+        if resposta is not None:
+            return resposta, status
+        resposta = await self.gerar_resposta_enriquecida_async(contexto_completo)
+        self._gravar_cache(key, resposta, ids_resultados, query_embedding, namespace)
+        return resposta, status
+
+    @staticmethod
+    def _resposta_cacheavel(resposta):
+        # Mensagens de erro/bloqueio (inclusive no meio de um stream) não entram no cache
+        return resposta not in (MSG_LLM_INDISPONIVEL, MSG_BLOQUEIO_SEGURANCA, MSG_SEM_RESPOSTA) and PREFIXO_ERRO_LLM not in resposta
+
+    @staticmethod
+    def _motivo_sem_texto(response):
+        reason = "desconhecida"
+        if response.candidates and response.candidates[0].finish_reason:
+            reason = response.candidates[0].finish_reason.name
+        elif response.prompt_feedback and response.prompt_feedback.block_reason:
+            reason = response.prompt_feedback.block_reason.name
+        return reason
+
+    @staticmethod
+    def _texto_do_chunk(chunk):
+        if chunk.candidates and chunk.candidates[0].content.parts:
+            return chunk.candidates[0].content.parts[0].text
+        return None
+
+    def _texto_da_resposta(self, response):
+        generated_text = self._texto_do_chunk(response)
+        if generated_text is not None:
+            print(" LLM Service: Resposta do LLM recebida.")
+            return generated_text
+        reason = self._motivo_sem_texto(response)
+        print(f" LLM Service: Resposta da LLM vazia ou bloqueada. Razão: {reason}")
+        if reason == "SAFETY":
+            return MSG_BLOQUEIO_SEGURANCA
+        return MSG_SEM_RESPOSTA
+
+    def _modelo_da_requisicao(self):
+        """(modelo, usa_context_cache): o modelo ligado ao cached content quando disponível, senão o inline."""
+        if self.context_cache is not None:
+            modelo = self.context_cache.modelo()
+            if modelo is not None:
+                return modelo, True
+        return self.model, False
+
+    async def _modelo_da_requisicao_async(self):
+        # Criar/renovar o cached content são chamadas de rede bloqueantes: rodam fora do event loop
+        if self.context_cache is None:
+            return self.model, False
+        return await asyncio.to_thread(self._modelo_da_requisicao)
+
+    def _argumentos_geracao(self, stream):
+        return {'generation_config': self.generation_config, 'safety_settings': self.safety_settings, 'stream': stream}
+
+    def _gerar(self, contexto_completo):
+        modelo, usa_cache = self._modelo_da_requisicao()
+        if usa_cache:
+            try:
+                return modelo.generate_content([contexto_completo], **self._argumentos_geracao(False))
+            except Exception as e:
+                if not _erro_de_context_cache(e):
+                    raise
+                self.context_cache.invalidar(e)
+        return self.model.generate_content([contexto_completo], **self._argumentos_geracao(False))
+
+    async def _gerar_async(self, contexto_completo):
+        modelo, usa_cache = await self._modelo_da_requisicao_async()
+        if usa_cache:
+            try:
+                return await modelo.generate_content_async([contexto_completo], **self._argumentos_geracao(False))
+            except Exception as e:
+                if not _erro_de_context_cache(e):
+                    raise
+                await asyncio.to_thread(self.context_cache.invalidar, e)
+        return await self.model.generate_content_async([contexto_completo], **self._argumentos_geracao(False))
+
+    def _gerar_stream(self, contexto_completo):
+        modelo, usa_cache = self._modelo_da_requisicao()
+        if usa_cache:
+            # O erro de um cache expirado só aparece no primeiro chunk; até ali ainda dá para cair no inline
+            try:
+                chunks = iter(modelo.generate_content([contexto_completo], **self._argumentos_geracao(True)))
+                primeiro = next(chunks)
+            except StopIteration:
+                return
+            except Exception as e:
+                if not _erro_de_context_cache(e):
+                    raise
+                self.context_cache.invalidar(e)
+            else:
+                yield primeiro
+                yield from chunks
+                return
+        yield from self.model.generate_content([contexto_completo], **self._argumentos_geracao(True))
+
+    async def _gerar_stream_async(self, contexto_completo):
+        modelo, usa_cache = await self._modelo_da_requisicao_async()
+        if usa_cache:
+            try:
+                chunks = await modelo.generate_content_async([contexto_completo], **self._argumentos_geracao(True))
+                primeiro = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                if not _erro_de_context_cache(e):
+                    raise
+                await asyncio.to_thread(self.context_cache.invalidar, e)
+            else:
+                yield primeiro
+                async for chunk in chunks:
+                    yield chunk
+                return
+        async for chunk in await self.model.generate_content_async([contexto_completo], **self._argumentos_geracao(True)):
+            yield chunk
+
+    def _abrir_stream(self, contexto_completo):
+        """(primeiro chunk ou None, iterador com o restante): abrir o stream é a parte sujeita a prazo e retry."""
+        chunks = self._gerar_stream(contexto_completo)
+        return next(chunks, None), chunks
+
+    async def _abrir_stream_async(self, contexto_completo):
+        chunks = self._gerar_stream_async(contexto_completo)
+        try:
+            primeiro = await chunks.__anext__()
+        except StopAsyncIteration:
+            primeiro = None
+        return primeiro, chunks
+
+    def circuito_aberto(self):
+        return self.resiliencia.breaker.estado == CircuitBreaker.ABERTO
+
+    def stats(self):
+        stats = {'resilience': self.resiliencia.stats()}
+        if self.context_cache is not None:
+            stats['context_cache'] = self.context_cache.stats()
+        return stats
+
     def gerar_resposta_enriquecida(self, contexto_completo):
+        """
+        Texto da resposta do Gemini. Levanta LLMIndisponivelError quando o LLM não respondeu
+        (circuito aberto, prazo ou tentativas esgotados): o chamador usa a resposta de fallback.
+        """
         if not self.model_ready or not self.model:
-            return "Desculpe, o assistente de enriquecimento de respostas não está disponível no momento."
+            return MSG_LLM_INDISPONIVEL
         
         print(" LLM Service: Gerando resposta enriquecida...")
         
         try:
-            response = self.model.generate_content(
-                [contexto_completo],
-                generation_config=self.generation_config,
-                safety_settings=self.safety_settings,
-                stream=False,
-            )
-            
-            if response.candidates and response.candidates[0].content.parts:
-                generated_text = response.candidates[0].content.parts[0].text
-                print(" LLM Service: Resposta do LLM recebida.")
-                return generated_text
-            else:
-                reason = "desconhecida"
-                if response.candidates and response.candidates[0].finish_reason:
-                    reason = response.candidates[0].finish_reason.name
-                elif response.prompt_feedback and response.prompt_feedback.block_reason:
-                    reason = response.prompt_feedback.block_reason.name
-                print(f" LLM Service: Resposta da LLM vazia ou bloqueada. Razão: {reason}")
-                if reason == "SAFETY":
-                    return "A resposta não pôde ser gerada devido a restrições de segurança do conteúdo."
-                return "Não foi possível gerar uma resposta neste momento. Tente reformular sua pergunta."
-        except Exception as e:
+            with cronometro('llm'):
+                response = self.resiliencia.executar(lambda: self._gerar(contexto_completo))
+        except LLMIndisponivelError as e:
+            print(f" LLM Service: Erro durante a consulta ao LLM: {e}")
+            raise
+        return self._texto_da_resposta(response)
+
+    async def gerar_resposta_enriquecida_async(self, contexto_completo):
+        if not self.model_ready or not self.model:
+            return MSG_LLM_INDISPONIVEL
+
+        print(" LLM Service: Gerando resposta enriquecida (async)...")
+        try:
+            with cronometro('llm'):
+                response = await self.resiliencia.executar_async(lambda: self._gerar_async(contexto_completo))
+        except LLMIndisponivelError as e:
             print(f" LLM Service: Erro durante a consulta ao LLM: {e}")
-            return f"Erro ao consultar o modelo de linguagem: {type(e).__name__}"
\ No newline at end of file
+            raise
+        return self._texto_da_resposta(response)
+
+    def gerar_resposta_enriquecida_stream(self, contexto_completo):
+        """
+        Gera a resposta com stream=True, devolvendo os trechos de texto à medida que chegam.
+        Falhas até o primeiro chunk levantam LLMIndisponivelError; depois dele, viram um aviso no texto.
+        """
+        if not self.model_ready or not self.model:
+            yield MSG_LLM_INDISPONIVEL
+            return
+
+        print(" LLM Service: Gerando resposta enriquecida (stream)...")
+        try:
+            # Sem hedge no stream: duas gerações em paralelo só para o primeiro chunk não compensam
+            with cronometro('llm_first_chunk'):
+                primeiro, chunks = self.resiliencia.executar(lambda: self._abrir_stream(contexto_completo), hedge=False)
+        except LLMIndisponivelError as e:
+            print(f" LLM Service: Erro durante a consulta ao LLM (stream): {e}")
+            raise
+
+        recebeu_texto = False
+        reason = "desconhecida"
+        try:
+            for chunk in itertools.chain([primeiro] if primeiro is not None else [], chunks):
+                texto = self._texto_do_chunk(chunk)
+                if texto:
+                    recebeu_texto = True
+                    yield texto
+                elif texto is None:
+                    reason = self._motivo_sem_texto(chunk)
+        except Exception as e:
+            print(f" LLM Service: Erro durante a consulta ao LLM (stream): {e}")
+            yield f"\n\n{PREFIXO_ERRO_LLM}: {type(e).__name__}" if recebeu_texto else f"{PREFIXO_ERRO_LLM}: {type(e).__name__}"
+            return
+
+        if recebeu_texto:
+            print(" LLM Service: Resposta do LLM (stream) concluída.")
+        else:
+            print(f" LLM Service: Resposta da LLM vazia ou bloqueada. Razão: {reason}")
+            yield MSG_BLOQUEIO_SEGURANCA if reason == "SAFETY" else MSG_SEM_RESPOSTA
+
+    async def gerar_resposta_enriquecida_stream_async(self, contexto_completo):
+        if not self.model_ready or not self.model:
+            yield MSG_LLM_INDISPONIVEL
+            return
+
+        print(" LLM Service: Gerando resposta enriquecida (stream async)...")
+        try:
+            with cronometro('llm_first_chunk'):
+                primeiro, chunks = await self.resiliencia.executar_async(lambda: self._abrir_stream_async(contexto_completo), hedge=False)
+        except LLMIndisponivelError as e:
+            print(f" LLM Service: Erro durante a consulta ao LLM (stream): {e}")
+            raise
+
+        recebeu_texto = False
+        reason = "desconhecida"
+        try:
+            if primeiro is not None:
+                texto = self._texto_do_chunk(primeiro)
+                if texto:
+                    recebeu_texto = True
+                    yield texto
+                elif texto is None:
+                    reason = self._motivo_sem_texto(primeiro)
+            async for chunk in chunks:
+                texto = self._texto_do_chunk(chunk)
+                if texto:
+                    recebeu_texto = True
+                    yield texto
+                elif texto is None:
+                    reason = self._motivo_sem_texto(chunk)
+        except Exception as e:
+            print(f" LLM Service: Erro durante a consulta ao LLM (stream): {e}")
+            yield f"\n\n{PREFIXO_ERRO_LLM}: {type(e).__name__}" if recebeu_texto else f"{PREFIXO_ERRO_LLM}: {type(e).__name__}"
+            return
+
+        if not recebeu_texto:
+            print(f" LLM Service: Resposta da LLM vazia ou bloqueada. Razão: {reason}")
+            yield MSG_BLOQUEIO_SEGURANCA if reason == "SAFETY" else MSG_SEM_RESPOSTA
+
+    def responder_stream(self, contexto_completo, consulta=None, ids_resultados=None, query_embedding=None, usar_cache=True, namespace=None):
+        """
+        Versão em stream de `responder`. Devolve (status_cache, iterador de trechos); um acerto no cache
+        é entregue como um único trecho, e a resposta completa gerada em stream entra no cache ao final.
+        """
+        key, resposta, status = self._consultar_cache(consulta, ids_resultados, query_embedding, usar_cache, namespace)
+        if resposta is not None:
+            return status, iter([resposta])
+
+        def partes_com_cache():
+            partes = []
+            for parte in self.gerar_resposta_enriquecida_stream(contexto_completo):
+                partes.append(parte)
+                yield parte
+            self._gravar_cache(key, "".join(partes), ids_resultados, query_embedding, namespace)
+
+        return status, partes_com_cache()
+
+    def responder_stream_async(self, contexto_completo, consulta=None, ids_resultados=None, query_embedding=None, usar_cache=True, namespace=None):
+        """Como `responder_stream`, mas o iterador de trechos é assíncrono."""
+        key, resposta, status = self._consultar_cache(consulta, ids_resultados, query_embedding, usar_cache, namespace)
+
+        async def partes_com_cache():
+            if resposta is not None:
+                yield resposta
+                return
+            partes = []
+            async for parte in self.gerar_resposta_enriquecida_stream_async(contexto_completo):
+                partes.append(parte)
+                yield parte
+            self._gravar_cache(key, "".join(partes), ids_resultados, query_embedding, namespace)
+
+        return status, partes_com_cache()
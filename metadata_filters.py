@@ -0,0 +1,130 @@
+# metadata_filters.py
+import re
+import json
+import unicodedata
+from collections import defaultdict
+import numpy as np
+
+# Nome do filtro (API/HTTP) -> coluna do FieldStore
+FILTROS_CATEGORICOS = {
+    'cid': 'cid',
+    'orgao': 'órgão',
+    'serventia': 'serventia',
+    'conclusao': 'justificativa',            # Favorável / Não favorável
+    'tipo_tecnologia': 'tipo da tecnologia',
+}
+FILTROS_DE_DATA = ('data_inicio', 'data_fim')    # intervalo fechado sobre 'data de conclusão'
+COLUNA_DATA = 'data de conclusão'
+FILTROS = tuple(FILTROS_CATEGORICOS) + FILTROS_DE_DATA
+
+
+def normalizar_valor(valor):
+    """Minúsculas, sem acentos e com espaços colapsados: 'Justiça  Estadual' e 'justica estadual' filtram igual."""
+    valor = unicodedata.normalize('NFKD', str(valor).lower())
+    return ' '.join(''.join(c for c in valor if not unicodedata.combining(c)).split())
+
+
+def _codigo_cid(valor):
+    # 'G30.1 - Doença de Alzheimer' -> 'g30.1'
+    return normalizar_valor(re.split(r'\s+-\s+', str(valor), maxsplit=1)[0])
+
+
+def _data(valor):
+    try:
+        return np.datetime64(str(valor).strip(), 'D')
+    except ValueError:
+        raise ValueError(f"Data inválida: '{valor}' (use AAAA-MM-DD).")
+
+
+def _data_ou_nat(valor):
+    try:
+        return np.datetime64(valor, 'D') if valor else np.datetime64('NaT')
+    except ValueError:
+        return np.datetime64('NaT')
+
+
+def normalizar_filtros(filtros):
+    """
+    Valida e normaliza os filtros de uma busca: {filtro categórico: [valores]} e as datas em AAAA-MM-DD.
+    Devolve None quando não há filtro; levanta ValueError para filtros ou datas inválidos.
+    """
+    if not filtros:
+        return None
+    desconhecidos = set(filtros) - set(FILTROS)
+    if desconhecidos:
+        raise ValueError(f"Filtros desconhecidos: {', '.join(sorted(desconhecidos))}. Opções: {', '.join(FILTROS)}.")
+    normalizados = {}
+    for campo, valores in filtros.items():
+        if campo in FILTROS_DE_DATA:
+            if valores:
+                normalizados[campo] = str(_data(valores))
+            continue
+        valores = [valores] if isinstance(valores, str) else list(valores or [])
+        valores = sorted({(_codigo_cid if campo == 'cid' else normalizar_valor)(v) for v in valores if str(v).strip()})
+        if valores:
+            normalizados[campo] = valores
+    return normalizados or None
+
+
+def chave_filtros(filtros):
+    """Representação estável dos filtros normalizados, para compor chaves de cache."""
+    return json.dumps(filtros, sort_keys=True, ensure_ascii=False) if filtros else ''
+
+
+class MetadataIndex:
+    """
+    Índices pré-calculados dos campos filtráveis de um FieldStore: para cada valor categórico,
+    o array ordenado das posições das linhas que o têm; para a data de conclusão, as datas
+    ordenadas (com as posições correspondentes) para localizar um intervalo por busca binária.
+    """
+
+    def __init__(self, categorias, datas, ids_por_data, n_rows):
+        self.categorias = categorias        # filtro -> {valor normalizado: np.ndarray int64}
+        self.datas = datas                  # datetime64[D] em ordem crescente
+        self.ids_por_data = ids_por_data    # posição da linha de cada entrada de `datas`
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, field_store):
+        categorias = {}
+        for filtro, coluna in FILTROS_CATEGORICOS.items():
+            posicoes = defaultdict(list)
+            normalizar = _codigo_cid if filtro == 'cid' else normalizar_valor
+            for i, valor in enumerate(field_store.columns.get(coluna, ())):
+                if valor and valor != 'N/A':
+                    posicoes[normalizar(valor)].append(i)
+            categorias[filtro] = {valor: np.array(ids, dtype=np.int64) for valor, ids in posicoes.items()}
+
+        # Stores gerados antes da coluna de data simplesmente não têm datas (o filtro de data não casa nada)
+        datas = np.array([_data_ou_nat(valor) for valor in field_store.columns.get(COLUNA_DATA, ())], dtype='datetime64[D]')
+        validas = np.flatnonzero(~np.isnat(datas))
+        ordem = validas[np.argsort(datas[validas], kind='stable')]
+        return cls(categorias, datas[ordem], ordem.astype(np.int64), len(field_store))
+
+    def _ids_categoricos(self, filtro, valores):
+        indice = self.categorias[filtro]
+        if filtro == 'cid':
+            # Código de categoria ('g30') também casa as subcategorias ('g30.0', 'g30.1'...)
+            encontrados = [ids for codigo, ids in indice.items()
+                           if any(codigo == v or codigo.startswith(f"{v}.") for v in valores)]
+        else:
+            encontrados = [indice[v] for v in valores if v in indice]
+        return np.unique(np.concatenate(encontrados)) if encontrados else np.zeros(0, dtype=np.int64)
+
+    def ids(self, filtros):
+        """Posições (ordenadas) das linhas que atendem a todos os filtros normalizados, ou None sem filtros."""
+        if not filtros:
+            return None
+        resultado = None
+        for filtro, valores in filtros.items():
+            if filtro in FILTROS_DE_DATA:
+                continue
+            ids = self._ids_categoricos(filtro, valores)
+            resultado = ids if resultado is None else np.intersect1d(resultado, ids, assume_unique=True)
+
+        if any(filtro in filtros for filtro in FILTROS_DE_DATA):
+            inicio = np.searchsorted(self.datas, np.datetime64(filtros['data_inicio'], 'D'), 'left') if 'data_inicio' in filtros else 0
+            fim = np.searchsorted(self.datas, np.datetime64(filtros['data_fim'], 'D'), 'right') if 'data_fim' in filtros else len(self.datas)
+            ids = np.sort(self.ids_por_data[inicio:fim])
+            resultado = ids if resultado is None else np.intersect1d(resultado, ids, assume_unique=True)
+        return resultado
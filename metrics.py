@@ -0,0 +1,190 @@
+# metrics.py
+"""
+Instrumentação leve do caminho da requisição: histogramas de latência por etapa, contadores de cache e
+de fallback, exposição no formato texto do Prometheus (/metrics) e o log estruturado e amostrado das
+requisições (uma linha JSON por requisição sorteada).
+
+Cada observação custa um perf_counter, uma busca binária nos limites dos buckets e um lock; sem
+dependência do prometheus_client. Com vários workers (gunicorn) cada processo expõe os próprios valores.
+"""
+import json
+import time
+import random
+import bisect
+import hashlib
+import logging
+import threading
+import config
+
+PREFIXO = 'natjus_'
+# Limites (em segundos) dos buckets: do encode de uma consulta (ms) até a geração do LLM (dezenas de s)
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registro = []
+_log = logging.getLogger('natjus.requisicoes')
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ''
+    pares = ','.join(f'{nome}="{str(valor)}"' for nome, valor in zip(nomes, valores))
+    return '{' + pares + '}'
+
+
+def _formatar(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    def __init__(self, nome, ajuda, rotulos=()):
+        self.nome = PREFIXO + nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def inc(self, valor=1, **rotulos):
+        if not config.METRICS_ENABLED:
+            return
+        chave = tuple(rotulos.get(nome, '') for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def exposicao(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        with self._lock:
+            for chave, valor in sorted(self._valores.items()):
+                linhas.append(f"{self.nome}{_rotulos(self.rotulos, chave)} {_formatar(valor)}")
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_SEGUNDOS):
+        self.nome = PREFIXO + nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        # chave dos rótulos -> [contagem por bucket (não cumulativa, +Inf no fim), soma]
+        self._series = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def observar(self, valor, **rotulos):
+        if not config.METRICS_ENABLED:
+            return
+        chave = tuple(rotulos.get(nome, '') for nome in self.rotulos)
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+
+    def exposicao(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        with self._lock:
+            series = [(chave, list(contagens), soma) for chave, (contagens, soma) in sorted(self._series.items())]
+        for chave, contagens, soma in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float('inf'),), contagens):
+                acumulado += contagem
+                rotulos = _rotulos(self.rotulos + ('le',), chave + (_formatar(float(limite)),))
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_formatar(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+
+class cronometro:
+    """
+    `with cronometro('encode'):` observa a duração do bloco em STAGE_SECONDS; com `tempos` (dict),
+    grava também os milissegundos em tempos['<etapa>_ms'] para o log da requisição. Com
+    `observar=False` só grava em `tempos` (trechos que já são medidos por etapas mais finas).
+    """
+    __slots__ = ('etapa', 'tempos', 'observar', 'inicio', 'segundos')
+
+    def __init__(self, etapa, tempos=None, observar=True):
+        self.etapa = etapa
+        self.tempos = tempos
+        self.observar = observar
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.segundos = time.perf_counter() - self.inicio
+        if self.observar:
+            STAGE_SECONDS.observar(self.segundos, stage=self.etapa)
+        if self.tempos is not None:
+            self.tempos[f'{self.etapa}_ms'] = round(self.segundos * 1000.0, 2)
+        return False
+
+
+STAGE_SECONDS = Histograma('stage_seconds', 'Duração de cada etapa do atendimento (encode, faiss_search, bm25, rerank, '
+                                            'materialize, search, prompt_build, llm, llm_first_chunk).', rotulos=('stage',))
+REQUEST_SECONDS = Histograma('request_seconds', 'Duração total das requisições por rota.', rotulos=('route',))
+CACHE_LOOKUPS = Contador('cache_lookups_total', 'Consultas aos caches por resultado (hit, near_hit, miss, bypass).',
+                         rotulos=('cache', 'result'))
+FALLBACKS = Contador('fallbacks_total', 'Respostas entregues sem o LLM (só com os resultados da busca), por motivo.',
+                     rotulos=('reason',))
+
+
+def familia(nome, tipo, ajuda, amostras, rotulos=()):
+    """Linhas de uma métrica calculada na hora da coleta (gauges/contadores lidos dos stats existentes)."""
+    nome = PREFIXO + nome
+    linhas = [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+    for valores, valor in amostras:
+        if valor is not None:
+            linhas.append(f"{nome}{_rotulos(rotulos, valores)} {_formatar(valor)}")
+    return linhas
+
+
+def exposicao(*coletores):
+    """Texto no formato de exposição do Prometheus (0.0.4); `coletores` devolvem listas de linhas de `familia`."""
+    linhas = []
+    for metrica in _registro:
+        linhas.extend(metrica.exposicao())
+    for coletor in coletores:
+        try:
+            linhas.extend(coletor())
+        except Exception as e:
+            print(f" Metrics: Falha em um coletor de métricas ({e}).")
+    return '\n'.join(linhas) + '\n'
+
+
+# --- Log das requisições ---
+def _configurar_log():
+    if not _log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _log.addHandler(handler)
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+
+
+def registrar_requisicao(rota, inicio, tempos, user_query=None, contexto=None, **campos):
+    """
+    Observa a duração da requisição e, se ela for sorteada (LOG_REQUEST_SAMPLE_RATE), lenta
+    (LOG_SLOW_REQUEST_MS) ou tiver caído no fallback, escreve uma linha JSON com as etapas. A pergunta
+    vai só como tamanho e hash; o contexto enviado ao LLM entra numa fração ainda menor (LOG_PROMPT_SAMPLE_RATE).
+    """
+    total_ms = (time.perf_counter() - inicio) * 1000.0
+    REQUEST_SECONDS.observar(total_ms / 1000.0, route=rota)
+    sorteada = random.random() < config.LOG_REQUEST_SAMPLE_RATE
+    if not (sorteada or campos.get('fallback') or total_ms >= config.LOG_SLOW_REQUEST_MS):
+        return
+    evento = {'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'route': rota, 'total_ms': round(total_ms, 2)}
+    evento.update(tempos)
+    evento.update((chave, valor) for chave, valor in campos.items() if valor is not None)
+    if user_query is not None:
+        evento['query_chars'] = len(user_query)
+        evento['query_sha1'] = hashlib.sha1(user_query.encode('utf-8')).hexdigest()[:12]
+    if contexto is not None and random.random() < config.LOG_PROMPT_SAMPLE_RATE:
+        evento['prompt'] = contexto
+    _configurar_log()
+    _log.info(json.dumps(evento, ensure_ascii=False))
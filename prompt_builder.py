@@ -0,0 +1,165 @@
+# prompt_builder.py
+"""
+Montagem do contexto enviado ao LLM com orçamento de tokens por requisição.
+
+Em vez de concatenar todos os campos de todas as notas, os campos entram por prioridade (primeiro os
+curtos e decisivos de todas as notas, depois os textos longos), cada um limitado a um teto de tokens e
+truncado para caber no que sobra do orçamento. Campos vazios/"N/A"/"Não informado" não entram, e notas
+quase idênticas a uma anterior são descartadas.
+"""
+import re
+import math
+import threading
+import config
+
+# (chave no resultado da busca, rótulo no prompt, teto de tokens do campo), em ordem de prioridade
+CAMPOS_PROMPT = (
+    ('diagnóstico', 'Diagnóstico', 60),
+    ('justificativa', 'Justificativa', 10),
+    ('cid', 'CID', 24),
+    ('princípio ativo', 'Princípio Ativo', 30),
+    ('nome comercial', 'Nome Comercial', 20),
+    ('tipo da tecnologia', 'Tipo da Tecnologia', 8),
+    ('conclusão', 'Conclusão', 300),
+    ('descrição', 'Descrição', 80),
+    ('órgão', 'Órgão', 8),
+    ('serventia', 'Serventia', 20),
+)
+# Ordem de exibição dentro de cada nota (a mesma do contexto original)
+ORDEM_EXIBICAO = ('diagnóstico', 'conclusão', 'justificativa', 'cid', 'princípio ativo', 'nome comercial',
+                  'descrição', 'tipo da tecnologia', 'órgão', 'serventia')
+VALORES_VAZIOS = {'', 'n/a', 'nan', 'none', 'não informado', 'nao informado', 'não se aplica'}
+RETICENCIAS = ' [...]'
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def _carregar_tokenizer():
+    """Tokenizer local do Gemini (vertexai.preview.tokenization), ou False para usar a estimativa por caracteres."""
+    global _tokenizer
+    if _tokenizer is not None:
+        return _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            _tokenizer = False
+            if config.PROMPT_TOKENIZER == 'vertex':
+                try:
+                    from vertexai.preview.tokenization import get_tokenizer_for_model
+                    _tokenizer = get_tokenizer_for_model(config.MODEL_NAME_LLM)
+                except Exception as e:
+                    print(f" Prompt Builder: Tokenizer local indisponível ({e}); usando estimativa por caracteres.")
+    return _tokenizer
+
+
+def contar_tokens(texto):
+    if not texto:
+        return 0
+    tokenizer = _carregar_tokenizer()
+    if tokenizer:
+        return tokenizer.count_tokens(texto).total_tokens
+    return math.ceil(len(texto) / config.PROMPT_CHARS_PER_TOKEN)
+
+
+def _valor_util(valor):
+    if valor is None:
+        return None
+    texto = ' '.join(str(valor).split())
+    if texto.lower().rstrip('.') in VALORES_VAZIOS:
+        return None
+    return texto
+
+
+def truncar(texto, max_tokens):
+    """Corta `texto` para caber em `max_tokens` (em fronteira de palavra), ou devolve None se não couber nada útil."""
+    tokens = contar_tokens(texto)
+    if tokens <= max_tokens:
+        return texto, tokens
+    if max_tokens < 4:
+        return None, 0
+    # Corte proporcional, repetido enquanto a contagem (tokenizer real) ainda passar do limite
+    limite = len(texto) * (max_tokens - contar_tokens(RETICENCIAS)) // tokens
+    while limite > 0:
+        cortado = texto[:limite].rsplit(' ', 1)[0].rstrip(' ,;:') + RETICENCIAS
+        tokens = contar_tokens(cortado)
+        if tokens <= max_tokens:
+            return cortado, tokens
+        limite = int(limite * 0.9)
+    return None, 0
+
+
+def _assinatura(res):
+    return set(_WORD_PATTERN.findall((res.get('texto_original') or '').lower()))
+
+
+def _quase_duplicado(assinatura, vistas, limiar):
+    for outra in vistas:
+        uniao = len(assinatura | outra)
+        if uniao and len(assinatura & outra) / uniao >= limiar:
+            return True
+    return False
+
+
+def montar_contexto(user_query, resultados_semanticos, orcamento_tokens=None):
+    """
+    Devolve (contexto para o LLM, relatório) com o relatório contendo a estimativa de tokens do contexto
+    (e do contexto completo, sem orçamento), quantas notas entraram/foram descartadas como duplicadas
+    e quantos campos foram truncados/omitidos.
+    """
+    orcamento_tokens = orcamento_tokens or config.PROMPT_CONTEXT_MAX_TOKENS
+    cabecalho = f"Pergunta do Usuário: \"{user_query}\"\n\n"
+    relatorio = {'budget_tokens': orcamento_tokens, 'hits': len(resultados_semanticos), 'hits_used': 0,
+                 'hits_deduplicated': 0, 'fields_truncated': 0, 'fields_dropped': 0}
+    if not resultados_semanticos:
+        contexto = cabecalho + "Contexto das Jurisprudências Encontradas: Nenhuma jurisprudência específica foi encontrada pela busca inicial para esta pergunta."
+        relatorio['prompt_tokens'] = relatorio['unbudgeted_tokens'] = contar_tokens(contexto)
+        return contexto, relatorio
+
+    cabecalho += "Contexto das Jurisprudências Encontradas (analise e use para formular sua resposta):\n"
+    restante = orcamento_tokens - contar_tokens(cabecalho)
+    tokens_sem_orcamento = orcamento_tokens - restante
+
+    notas, vistas = [], []
+    for res in resultados_semanticos:
+        assinatura = _assinatura(res)
+        if assinatura and _quase_duplicado(assinatura, vistas, config.PROMPT_DEDUP_JACCARD):
+            relatorio['hits_deduplicated'] += 1
+            continue
+        vistas.append(assinatura)
+        numero = len(notas) + 1
+        titulo = f"\n--- Jurisprudência {numero} (Score de Similaridade com a pergunta: {res.get('similaridade_busca', 0):.3f}) ---\n"
+        referencia = f"Referência da Nota Técnica: {res['referencia']}\n" if res.get('referencia') else ''
+        # Título e referência de cada nota são sempre incluídos (o prompt de sistema pede os dois)
+        tokens_fixos = contar_tokens(titulo) + contar_tokens(referencia)
+        restante -= tokens_fixos
+        tokens_sem_orcamento += tokens_fixos
+        notas.append({'titulo': titulo, 'referencia': referencia, 'res': res, 'campos': {}})
+
+    for chave, rotulo, teto in CAMPOS_PROMPT:
+        for nota in notas:
+            valor = _valor_util(nota['res'].get(chave))
+            if valor is None:
+                continue
+            prefixo = f"{rotulo}: "
+            tokens_sem_orcamento += contar_tokens(prefixo) + contar_tokens(valor)
+            disponivel = min(teto, restante) - contar_tokens(prefixo)
+            texto, tokens = truncar(valor, disponivel) if disponivel > 0 else (None, 0)
+            if texto is None:
+                relatorio['fields_dropped'] += 1
+                continue
+            if texto != valor:
+                relatorio['fields_truncated'] += 1
+            nota['campos'][chave] = f"{prefixo}{texto}\n"
+            restante -= tokens + contar_tokens(prefixo)
+
+    partes = [cabecalho]
+    for nota in notas:
+        partes.append(nota['titulo'])
+        partes.extend(nota['campos'][chave] for chave in ORDEM_EXIBICAO if chave in nota['campos'])
+        partes.append(nota['referencia'])
+    contexto = ''.join(partes)
+    relatorio['hits_used'] = len(notas)
+    relatorio['prompt_tokens'] = contar_tokens(contexto)
+    relatorio['unbudgeted_tokens'] = tokens_sem_orcamento
+    return contexto, relatorio
@@ -0,0 +1,152 @@
+# query_cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_query(query):
+    return ' '.join(unicodedata.normalize('NFC', query).lower().split())
+
+
+class TTLCache:
+    """LRU limitado por tamanho, com expiração por TTL e contadores de acerto/erro."""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, count=True):
+        # count=False: quem chama contabiliza a consulta (ex.: ResponseCache, que pode tentar várias chaves)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += count
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += count
+                return None
+            self._data.move_to_end(key)
+            self.hits += count
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._data), 'max_size': self.max_size}
+
+
+class SqliteCache:
+    """
+    Cache em arquivo SQLite local, compartilhado pelos workers da mesma máquina.
+    Valores são bytes; a expiração usa o horário de gravação.
+    """
+
+    def __init__(self, path, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, created REAL)")
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] + self.ttl_seconds < time.time():
+            return None
+        return row[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)", (key, value, time.time()))
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._trim()
+
+    def _trim(self):
+        self._conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.max_size,))
+
+
+class QueryCache:
+    """
+    Cache de embeddings de consulta (e, opcionalmente, dos ids/scores do top-k) pelo texto normalizado.
+
+    Cada get/put recebe o namespace de quem consulta: o do encoder para embeddings e o do snapshot que
+    fez a busca para o top-k. O cache não guarda namespace próprio, então pode ser compartilhado por
+    searchers de revisões diferentes (reload) sem que uma busca no snapshot antigo grave sob o novo.
+    """
+
+    def __init__(self, max_size, ttl_seconds, cache_results=True, sqlite_path=None):
+        self.cache_results = cache_results
+        self._memory = TTLCache(max_size, ttl_seconds)
+        self._shared = SqliteCache(sqlite_path, max_size, ttl_seconds) if sqlite_path else None
+        self.shared_hits = 0
+
+    @staticmethod
+    def _key(namespace, kind, query, extra=''):
+        return f"{namespace}|{kind}|{extra}|{normalize_query(query)}"
+
+    def _get(self, key):
+        value = self._memory.get(key)
+        if value is None and self._shared is not None:
+            value = self._shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self._memory.set(key, value)
+        return value
+
+    def _set(self, key, value):
+        self._memory.set(key, value)
+        if self._shared is not None:
+            self._shared.set(key, value)
+
+    def get_embedding(self, namespace, query):
+        value = self._get(self._key(namespace, 'emb', query))
+        return np.frombuffer(value, dtype=np.float32) if value is not None else None
+
+    def put_embedding(self, namespace, query, embedding):
+        self._set(self._key(namespace, 'emb', query), np.asarray(embedding, dtype=np.float32).tobytes())
+
+    def get_results(self, namespace, query, search_key):
+        if not self.cache_results:
+            return None
+        value = self._get(self._key(namespace, 'topk', query, search_key))
+        return json.loads(value) if value is not None else None
+
+    def put_results(self, namespace, query, search_key, ids, scores):
+        if self.cache_results:
+            self._set(self._key(namespace, 'topk', query, search_key), json.dumps([[int(i) for i in ids], [float(s) for s in scores]]).encode())
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats['shared_hits'] = self.shared_hits
+        stats['backend'] = 'sqlite' if self._shared is not None else 'memory'
+        return stats
@@ -0,0 +1,61 @@
+# reranker.py
+import time
+import threading
+import numpy as np
+import config
+
+
+class CrossEncoderReranker:
+    """
+    Segundo estágio da busca: reordena os candidatos do FAISS/BM25 com um cross-encoder pequeno
+    rodando em CPU. Todos os pares (consulta, passagem) de uma requisição vão em um único predict,
+    que os processa em lotes de até RERANK_BATCH_SIZE pares.
+
+    Guarda uma média móvel do custo por par para que o chamador possa pular o rerank quando
+    o tempo já gasto somado ao custo estimado estourar o orçamento da requisição.
+    """
+
+    def __init__(self, model_name=None, max_length=None, max_chars=None, batch_size=None):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name or config.RERANK_MODEL_NAME
+        self.model = CrossEncoder(self.model_name, max_length=max_length or config.RERANK_MAX_LENGTH, device='cpu')
+        # O texto completo da nota passa de max_length tokens; cortar antes evita tokenizar o que será truncado
+        self.max_chars = max_chars or config.RERANK_MAX_CHARS
+        self.batch_size = batch_size or config.RERANK_BATCH_SIZE
+        self._lock = threading.Lock()
+        self._ms_por_par = None
+        self.executados = 0
+        self.pulados = 0
+        self.pares = 0
+
+    def estimar_ms(self, n_pares):
+        return 0.0 if self._ms_por_par is None else self._ms_por_par * n_pares
+
+    def pular(self):
+        with self._lock:
+            self.pulados += 1
+
+    def scores(self, pares):
+        """Score de relevância de cada par (consulta, passagem), em uma única chamada ao predict."""
+        if not pares:
+            return np.zeros(0, dtype=np.float32)
+        inicio = time.perf_counter()
+        pares = [(consulta, passagem[:self.max_chars]) for consulta, passagem in pares]
+        batch_size = min(len(pares), self.batch_size)
+        scores = np.asarray(self.model.predict(pares, batch_size=batch_size, show_progress_bar=False), dtype=np.float32)
+        ms_por_par = (time.perf_counter() - inicio) * 1000.0 / len(pares)
+        with self._lock:
+            self._ms_por_par = ms_por_par if self._ms_por_par is None else 0.8 * self._ms_por_par + 0.2 * ms_por_par
+            self.executados += 1
+            self.pares += len(pares)
+        return scores.reshape(-1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'model': self.model_name,
+                'reranked': self.executados,
+                'skipped_budget': self.pulados,
+                'pairs': self.pares,
+                'ms_per_pair_ewma': round(self._ms_por_par, 3) if self._ms_por_par is not None else None,
+            }
@@ -0,0 +1,93 @@
+# response_cache.py
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from query_cache import TTLCache, normalize_query
+
+
+def response_cache_key(query, row_ids, model_name, generation_config, namespace=None):
+    # Os ids são posições no snapshot de busca: `namespace` (SnapshotDeBusca.namespace) separa as versões do store
+    payload = json.dumps([normalize_query(query), [int(i) for i in row_ids], model_name, generation_config, namespace],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache das respostas do LLM pela chave (consulta normalizada, ids recuperados em ordem, modelo, generation_config,
+    namespace do snapshot de busca).
+
+    No modo de quase-duplicata, uma consulta cujo embedding tem similaridade de cosseno >= `near_threshold`
+    com uma consulta já respondida reaproveita a resposta, desde que o conjunto de jurisprudências (no mesmo
+    snapshot) seja o mesmo. Cada consulta conta uma única vez: hit, near_hit ou miss.
+    """
+
+    def __init__(self, max_size, ttl_seconds, near_threshold=None):
+        self._cache = TTLCache(max_size, ttl_seconds)
+        self.near_threshold = near_threshold
+        # (namespace, ids em ordem) -> {chave: embedding normalizado da consulta}
+        self._por_conjunto = {}
+        # chave -> conjunto, da gravação mais antiga para a mais recente: limita o total de embeddings
+        # guardados (somando todos os conjuntos) ao tamanho do cache principal
+        self._conjunto_da_chave = OrderedDict()
+        self._lock = threading.Lock()
+        self._contagens = {'hit': 0, 'near_hit': 0, 'miss': 0}
+
+    def _contar(self, status):
+        with self._lock:
+            self._contagens[status] += 1
+
+    def get(self, key, row_ids=None, query_embedding=None, namespace=None):
+        """Devolve (resposta, 'hit' | 'near_hit') ou (None, 'miss')."""
+        value = self._cache.get(key, count=False)
+        if value is not None:
+            self._contar('hit')
+            return value, 'hit'
+        if self.near_threshold is None or query_embedding is None or row_ids is None:
+            self._contar('miss')
+            return None, 'miss'
+
+        query_embedding = np.asarray(query_embedding, dtype=np.float32)
+        with self._lock:
+            candidatos = list(self._por_conjunto.get((namespace, tuple(row_ids)), {}).items())
+        for candidate_key, embedding in candidatos:
+            if float(np.dot(embedding, query_embedding)) >= self.near_threshold:
+                value = self._cache.get(candidate_key, count=False)
+                if value is not None:
+                    self._contar('near_hit')
+                    return value, 'near_hit'
+                # Resposta expirada ou despejada do cache principal: o embedding também sai
+                with self._lock:
+                    if self._conjunto_da_chave.pop(candidate_key, None) is not None:
+                        self._remover(candidate_key, (namespace, tuple(row_ids)))
+        self._contar('miss')
+        return None, 'miss'
+
+    def set(self, key, value, row_ids=None, query_embedding=None, namespace=None):
+        self._cache.set(key, value)
+        if self.near_threshold is None or query_embedding is None or row_ids is None:
+            return
+        conjunto_id = (namespace, tuple(row_ids))
+        with self._lock:
+            anterior = self._conjunto_da_chave.pop(key, None)
+            if anterior is not None:
+                self._remover(key, anterior)
+            self._por_conjunto.setdefault(conjunto_id, {})[key] = np.asarray(query_embedding, dtype=np.float32)
+            self._conjunto_da_chave[key] = conjunto_id
+            while len(self._conjunto_da_chave) > self._cache.max_size:
+                self._remover(*self._conjunto_da_chave.popitem(last=False))
+
+    def _remover(self, key, conjunto_id):
+        conjunto = self._por_conjunto.get(conjunto_id)
+        if conjunto is not None:
+            conjunto.pop(key, None)
+            if not conjunto:
+                del self._por_conjunto[conjunto_id]
+
+    def stats(self):
+        stats = self._cache.stats()
+        with self._lock:
+            stats.update(hits=self._contagens['hit'], near_hits=self._contagens['near_hit'], misses=self._contagens['miss'])
+        return stats
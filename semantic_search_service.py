@@ -1,115 +1,482 @@
 # semantic_search_service.py
 import os
-import pickle
+import time
+import threading
 import pandas as pd
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
-from config import MODEL_NAME_SEMANTIC, DATASET_PATH, EMBEDDINGS_PATH 
-from utils import extract_field_from_text 
+from config import (MODEL_NAME_SEMANTIC, DATASET_PATH, EMBEDDINGS_PATH, EMBEDDING_STORE_DIR, EMBEDDING_STORE_MMAP,
+                    FAISS_INDEX_TYPE, FAISS_INDEX_SAVE_ON_REBUILD, ENCODE_BATCH_SIZE,
+                    QUERY_CACHE_ENABLED, QUERY_CACHE_MAX_SIZE, QUERY_CACHE_TTL_SECONDS, QUERY_CACHE_RESULTS,
+                    QUERY_CACHE_BACKEND, QUERY_CACHE_SQLITE_PATH,
+                    ENCODER_MICROBATCH_ENABLED, ENCODER_MAX_BATCH, ENCODER_MAX_WAIT_MS, ENCODER_QUEUE_DEPTH,
+                    ENCODER_BACKEND, EMBEDDING_STORE_WATCH_SECONDS,
+                    BM25_ENABLED, SEARCH_MODE, HYBRID_CANDIDATES, HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT,
+                    FILTER_EXACT_SEARCH_MAX_ROWS,
+                    RERANK_ENABLED, RERANK_CANDIDATES, RERANK_BUDGET_MS, RERANK_MIN_SCORE, RERANK_MAX_PAIRS)
+from field_store import FieldStore
+from embedding_store import EmbeddingStore, store_exists, read_header, load_legacy_embeddings, file_checksum
+from index_factory import build_index, set_search_params, search_parameters, load_index_if_fresh, write_index_with_meta
+from query_cache import QueryCache
+from batching_encoder import MicroBatchEncoder
+from encoder_backends import carregar_encoder
+from bm25_index import carregar_ou_construir as carregar_bm25, reciprocal_rank_fusion
+from metadata_filters import MetadataIndex, normalizar_filtros, chave_filtros
+from reranker import CrossEncoderReranker
+from metrics import cronometro, CACHE_LOOKUPS
+
+# 'dense': só FAISS; 'lexical': só BM25; 'hybrid': fusão (RRF) das duas listas
+SEARCH_MODES = ('dense', 'lexical', 'hybrid')
+
+
+def criar_query_cache():
+    if not QUERY_CACHE_ENABLED:
+        return None
+    sqlite_path = QUERY_CACHE_SQLITE_PATH if QUERY_CACHE_BACKEND == 'sqlite' else None
+    return QueryCache(QUERY_CACHE_MAX_SIZE, QUERY_CACHE_TTL_SECONDS, cache_results=QUERY_CACHE_RESULTS, sqlite_path=sqlite_path)
+
+
+class SnapshotDeBusca:
+    """
+    Tudo o que uma busca lê (índice, campos, embeddings, tombstones, índices de metadados), trocado de uma vez.
+    Cada busca pega a referência uma única vez, então uma troca no meio dela não mistura versões.
+    """
+    __slots__ = ('field_store', 'embeddings', 'index', 'bm25', 'metadados', 'checksum', 'header', 'revision', 'tombstones',
+                 '_sel_tombstones', 'selector')
+
+    def __init__(self, field_store, embeddings, index, checksum, header=None, bm25=None):
+        self.field_store = field_store
+        self.embeddings = embeddings
+        self.index = index
+        self.bm25 = bm25
+        self.metadados = MetadataIndex.build(field_store)
+        self.checksum = checksum
+        self.header = header
+        self.revision = header.get('revision', 0) if header else 0
+        self.tombstones = np.asarray(header.get('tombstones', []) if header else [], dtype=np.int64)
+        # O IDSelectorNot só guarda um ponteiro para o IDSelectorBatch: manter os dois vivos
+        self._sel_tombstones = faiss.IDSelectorBatch(self.tombstones) if len(self.tombstones) else None
+        self.selector = faiss.IDSelectorNot(self._sel_tombstones) if self._sel_tombstones is not None else None
+
+    @property
+    def namespace(self):
+        return f"{MODEL_NAME_SEMANTIC}:{ENCODER_BACKEND}:{self.checksum}:{self.revision}"
+
+    def permitidos(self, filtros):
+        """Posições vivas (sem tombstone) que atendem aos filtros normalizados, ou None sem filtros."""
+        ids = self.metadados.ids(filtros)
+        if ids is None or not len(self.tombstones):
+            return ids
+        return np.setdiff1d(ids, self.tombstones, assume_unique=True)
+
 
 class SemanticSearcher:
-    def __init__(self):
+    def __init__(self, index_type=None, nprobe=None, ef_search=None, query_cache=None, model=None, reranker=None):
+        self.index_type = index_type or FAISS_INDEX_TYPE
+        self.query_cache = query_cache if query_cache is not None else criar_query_cache()
         self.model = None
+        self.reranker = reranker
         self.dataset = None
-        self.embeddings_global = None
-        self.index = None
+        self.snapshot = None
         self.expected_model_dim = 0
-        self.dataset_len = 0
         self.is_ready = False
+        self._nprobe = nprobe
+        self._ef_search = ef_search
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._parar_watcher = threading.Event()
 
         try:
-            print(f" Semantic Search Service: Carregando modelo SentenceTransformer ({MODEL_NAME_SEMANTIC})...")
-            self.model = SentenceTransformer(MODEL_NAME_SEMANTIC)
-            self.expected_model_dim = self.model.get_sentence_embedding_dimension()
-            print(f" Semantic Search Service: Modelo SentenceTransformer carregado. Dimensão: {self.expected_model_dim}")
-
-            print(f" Semantic Search Service: Carregando DataFrame de {DATASET_PATH}...")
-            if not os.path.exists(DATASET_PATH):
-                print(f" Semantic Search Service: Arquivo do dataset não encontrado: {DATASET_PATH}"); return
-            self.dataset = pd.read_csv(DATASET_PATH)
-            self.dataset_len = len(self.dataset)
-            print(f" Semantic Search Service: DataFrame carregado com {self.dataset_len} registros.")
-
-            print(f" Semantic Search Service: Carregando embeddings de {EMBEDDINGS_PATH}...")
-            if not os.path.exists(EMBEDDINGS_PATH):
-                print(f" Semantic Search Service: Arquivo de embeddings não encontrado: {EMBEDDINGS_PATH}"); return
-            with open(EMBEDDINGS_PATH, 'rb') as f: embeddings_data_from_pickle = pickle.load(f)
-            print(" Semantic Search Service: Embeddings carregados do pickle.")
-            
-            actual_embeddings_source = None
-            if isinstance(embeddings_data_from_pickle, tuple):
-                print(f"Dados do pickle são uma TUPLA com {len(embeddings_data_from_pickle)} elemento(s).")
-                if embeddings_data_from_pickle and isinstance(embeddings_data_from_pickle[0], (list, np.ndarray)):
-                    actual_embeddings_source = embeddings_data_from_pickle[0]
-                    print(f"    Usando o elemento 0 da tupla como fonte de embeddings.")
-                else: print(" Elemento 0 da tupla não é lista/array ou tupla está vazia."); return
-            elif isinstance(embeddings_data_from_pickle, (list, np.ndarray)):
-                actual_embeddings_source = embeddings_data_from_pickle
-            else: print(f" Tipo de dados inesperado ({type(embeddings_data_from_pickle)}) no pickle."); return
-
-            final_embeddings_array = None
-            if isinstance(actual_embeddings_source, np.ndarray):
-                if actual_embeddings_source.ndim == 2 and actual_embeddings_source.shape[0] == self.dataset_len and actual_embeddings_source.shape[1] == self.expected_model_dim:
-                    final_embeddings_array = actual_embeddings_source.astype('float32')
-            elif isinstance(actual_embeddings_source, list):
-                if len(actual_embeddings_source) == self.dataset_len:
-                    temp_valid = [list(e) for e in actual_embeddings_source if isinstance(e, (list, np.ndarray)) and len(e) == self.expected_model_dim]
-                    if len(temp_valid) == self.dataset_len: final_embeddings_array = np.array(temp_valid, dtype='float32')
-            
-            if final_embeddings_array is None or final_embeddings_array.size == 0 :
-                print(" Semantic Search Service: Falha ao processar embeddings para NumPy array ou dimensões incorretas."); return
-            self.embeddings_global = final_embeddings_array
-            print(f" Semantic Search Service: Embeddings processados para array NumPy com shape {self.embeddings_global.shape}")
-            
-            faiss.normalize_L2(self.embeddings_global)
-            print("Semantic Search Service: Embeddings normalizados.")
-            self.index = faiss.IndexFlatIP(self.embeddings_global.shape[1])
-            self.index.add(self.embeddings_global)
-            print(f" Semantic Search Service: Índice FAISS criado com {self.index.ntotal} vetores.")
+            if model is not None:
+                # Reload: reaproveita o encoder já carregado (e o micro-batching dele) do snapshot anterior
+                self.model = model
+                self.expected_model_dim = self.model.get_sentence_embedding_dimension()
+                print(f" Semantic Search Service: Reaproveitando o encoder carregado. Dimensão: {self.expected_model_dim}")
+            else:
+                print(f" Semantic Search Service: Carregando modelo SentenceTransformer ({MODEL_NAME_SEMANTIC}, backend '{ENCODER_BACKEND}')...")
+                self.model = carregar_encoder(ENCODER_BACKEND)
+                self.expected_model_dim = self.model.get_sentence_embedding_dimension()
+                print(f" Semantic Search Service: Modelo SentenceTransformer carregado. Dimensão: {self.expected_model_dim}")
+            if model is None and ENCODER_MICROBATCH_ENABLED:
+                self.model = MicroBatchEncoder(self.model, max_batch=ENCODER_MAX_BATCH,
+                                               max_wait_ms=ENCODER_MAX_WAIT_MS, queue_depth=ENCODER_QUEUE_DEPTH)
+                print(f" Semantic Search Service: Micro-batching do encoder ativo (lote até {ENCODER_MAX_BATCH}, espera até {ENCODER_MAX_WAIT_MS} ms).")
+            if self.reranker is None and RERANK_ENABLED:
+                self._carregar_reranker()
+
+            inicio = time.perf_counter()
+            if store_exists(EMBEDDING_STORE_DIR):
+                carregado = self._carregar_embedding_store()
+            else:
+                carregado = self._carregar_legado()
+            if carregado is None: return
+            print(f" Semantic Search Service: Dados carregados em {time.perf_counter() - inicio:.3f}s.")
+
+            field_store, embeddings, checksum, header = carregado
+            index = self._obter_indice(embeddings, checksum)
+            bm25 = self._obter_bm25(field_store, checksum, header)
+            self._trocar_snapshot(SnapshotDeBusca(field_store, embeddings, index, checksum, header, bm25))
             self.is_ready = True
+            if header is not None and EMBEDDING_STORE_WATCH_SECONDS > 0:
+                self._watcher = threading.Thread(target=self._observar_store, name='embedding-store-watcher', daemon=True)
+                self._watcher.start()
 
         except Exception as e:
             print(f" Semantic Search Service: Erro ao inicializar: {e}")
             import traceback; traceback.print_exc()
             self.is_ready = False
 
-    def search(self, query, top_k=5):
-        if not self.is_ready or self.model is None or self.index is None or self.dataset is None:
+    # Atalhos para o snapshot atual (leitura única por acesso)
+    @property
+    def index(self):
+        return self.snapshot.index if self.snapshot else None
+
+    @property
+    def field_store(self):
+        return self.snapshot.field_store if self.snapshot else None
+
+    @property
+    def embeddings_global(self):
+        return self.snapshot.embeddings if self.snapshot else None
+
+    @property
+    def embeddings_checksum(self):
+        return self.snapshot.checksum if self.snapshot else None
+
+    @property
+    def store_header(self):
+        return self.snapshot.header if self.snapshot else None
+
+    @property
+    def namespace(self):
+        return self.snapshot.namespace if self.snapshot else None
+
+    @property
+    def dataset_len(self):
+        return len(self.snapshot.field_store) if self.snapshot else 0
+
+    def _obter_indice(self, embeddings, checksum, indice_atual=None):
+        inicio = time.perf_counter()
+        n_vetores = embeddings.shape[0]
+        if indice_atual is not None and indice_atual.ntotal == n_vetores and self.embeddings_checksum == checksum:
+            # Só os tombstones mudaram: o mesmo índice continua válido
+            return indice_atual
+        index = load_index_if_fresh(self.index_type, checksum, n_vetores)
+        if index is not None:
+            print(f" Semantic Search Service: Índice FAISS '{self.index_type}' lido do disco com {index.ntotal} vetores em {time.perf_counter() - inicio:.3f}s.")
+        else:
+            index = build_index(embeddings, self.index_type)
+            print(f" Semantic Search Service: Índice FAISS '{self.index_type}' criado com {index.ntotal} vetores em {time.perf_counter() - inicio:.3f}s.")
+            if FAISS_INDEX_SAVE_ON_REBUILD:
+                try:
+                    write_index_with_meta(index, self.index_type, checksum)
+                except OSError as e:
+                    print(f" Semantic Search Service: Não foi possível gravar o índice FAISS: {e}")
+        set_search_params(index, nprobe=self._nprobe, ef_search=self._ef_search)
+        return index
+
+    def _carregar_reranker(self):
+        try:
+            self.reranker = CrossEncoderReranker()
+            print(f" Semantic Search Service: Cross-encoder de rerank carregado ({self.reranker.model_name}).")
+        except Exception as e:
+            # Sem o reranker a busca segue só com o primeiro estágio
+            print(f" Semantic Search Service: Não foi possível carregar o cross-encoder ({e}); rerank desativado.")
+            self.reranker = None
+
+    def _obter_bm25(self, field_store, checksum, header):
+        if not BM25_ENABLED:
+            return None
+        inicio = time.perf_counter()
+        revision = header.get('revision', 0) if header else 0
+        bm25, construido = carregar_bm25(field_store, checksum, revision)
+        print(f" Semantic Search Service: Índice BM25 {'criado' if construido else 'lido do disco'} com {len(bm25.vocab)} termos em {time.perf_counter() - inicio:.3f}s.")
+        return bm25
+
+    def _trocar_snapshot(self, snapshot):
+        # O cache de consultas não precisa ser avisado: as chaves do top-k levam o namespace do snapshot da busca
+        self.snapshot = snapshot
+
+    def recarregar_se_mudou(self):
+        """
+        Relê o embedding store se um ingest o alterou (revisão ou checksum diferentes) e troca o snapshot
+        atomicamente. As buscas em andamento terminam no snapshot antigo. Devolve True se houve troca.
+        """
+        if not store_exists(EMBEDDING_STORE_DIR) or self.snapshot is None:
+            return False
+        with self._reload_lock:
+            header = read_header(EMBEDDING_STORE_DIR)
+            atual = self.snapshot
+            if header.get('checksum') == atual.checksum and header.get('revision', 0) == atual.revision:
+                return False
+            inicio = time.perf_counter()
+            carregado = self._carregar_embedding_store()
+            if carregado is None:
+                return False
+            field_store, embeddings, checksum, header = carregado
+            index = self._obter_indice(embeddings, checksum, indice_atual=atual.index)
+            bm25 = self._obter_bm25(field_store, checksum, header)
+            self._trocar_snapshot(SnapshotDeBusca(field_store, embeddings, index, checksum, header, bm25))
+            print(f" Semantic Search Service: Snapshot trocado para a revisão {header.get('revision', 0)} "
+                  f"({len(field_store)} linhas, {len(header.get('tombstones', []))} tombstones) em {time.perf_counter() - inicio:.3f}s.")
+            return True
+
+    def parar_observador(self):
+        """Encerra a thread que observa o embedding store (o snapshot substituído num reload não observa mais nada)."""
+        self._parar_watcher.set()
+
+    def _observar_store(self):
+        while not self._parar_watcher.wait(EMBEDDING_STORE_WATCH_SECONDS):
+            try:
+                self.recarregar_se_mudou()
+            except Exception as e:
+                # Mantém o snapshot atual; tenta de novo no próximo ciclo
+                print(f" Semantic Search Service: Falha ao recarregar o embedding store: {e}")
+
+    def _carregar_embedding_store(self):
+        print(f" Semantic Search Service: Abrindo embedding store de {EMBEDDING_STORE_DIR} (mmap={EMBEDDING_STORE_MMAP})...")
+        store = EmbeddingStore.open(EMBEDDING_STORE_DIR, mmap=EMBEDDING_STORE_MMAP)
+        header = store.header
+        if header['model_name'] != MODEL_NAME_SEMANTIC or int(header['dim']) != self.expected_model_dim:
+            print(f" Semantic Search Service: Embedding store gerado com {header['model_name']} ({header['dim']}d), "
+                  f"incompatível com {MODEL_NAME_SEMANTIC} ({self.expected_model_dim}d)."); return None
+
+        # Os vetores do store já estão normalizados; não é preciso normalize_L2 (o memmap é somente leitura)
+        print(f" Semantic Search Service: Embedding store v{header['format_version']} (revisão {store.revision}) com shape {store.embeddings.shape}.")
+        return store.field_store, store.embeddings, store.checksum, header
+
+    def _carregar_legado(self):
+        print(f" Semantic Search Service: Carregando DataFrame de {DATASET_PATH}...")
+        if not os.path.exists(DATASET_PATH):
+            print(f" Semantic Search Service: Arquivo do dataset não encontrado: {DATASET_PATH}"); return None
+        self.dataset = pd.read_csv(DATASET_PATH)
+        dataset_len = len(self.dataset)
+        print(f" Semantic Search Service: DataFrame carregado com {dataset_len} registros.")
+
+        field_store = FieldStore.from_dataframe(self.dataset)
+        print(f" Semantic Search Service: Campos estruturados materializados para {len(field_store)} registros.")
+
+        print(f" Semantic Search Service: Carregando embeddings de {EMBEDDINGS_PATH}...")
+        if not os.path.exists(EMBEDDINGS_PATH):
+            print(f" Semantic Search Service: Arquivo de embeddings não encontrado: {EMBEDDINGS_PATH}"); return None
+        final_embeddings_array = load_legacy_embeddings(EMBEDDINGS_PATH, dataset_len, self.expected_model_dim)
+        checksum = file_checksum(EMBEDDINGS_PATH)
+        print(" Semantic Search Service: Embeddings carregados do pickle.")
+
+        if final_embeddings_array is None or final_embeddings_array.size == 0 :
+            print(" Semantic Search Service: Falha ao processar embeddings para NumPy array ou dimensões incorretas."); return None
+        print(f" Semantic Search Service: Embeddings processados para array NumPy com shape {final_embeddings_array.shape}")
+
+        faiss.normalize_L2(final_embeddings_array)
+        print("Semantic Search Service: Embeddings normalizados.")
+        return field_store, final_embeddings_array, checksum, None
+
+    def search(self, query, top_k=5, nprobe=None, ef_search=None, mode=None, filtros=None, rerank=None, budget_ms=None):
+        """
+        `rerank` (padrão RERANK_ENABLED) busca RERANK_CANDIDATES candidatos e reordena com o cross-encoder;
+        `budget_ms` (padrão RERANK_BUDGET_MS) é o orçamento da busca a partir do qual o rerank é pulado.
+        """
+        if not self.is_ready or self.model is None or self.index is None or self.field_store is None:
             print(" Semantic Search Service: Não está pronto ou recursos não carregados.")
             return []
 
-        print(f" Semantic Search Service: Buscando por: '{query}' com top_k={top_k}")
-        query_embedding = self.model.encode([query], normalize_embeddings=True)
-        query_embedding_np = np.array(query_embedding).astype('float32').reshape(1, -1)
+        inicio = time.perf_counter()
+        rerank = self._usar_rerank(rerank)
+        snapshot = self.snapshot
+        mode = self._modo_efetivo(snapshot, mode)
+        filtros = normalizar_filtros(filtros)
+        search_key = f"{top_k}:{nprobe}:{ef_search}:{mode}:{chave_filtros(filtros)}:{'rerank' if rerank else ''}"
+        # Namespace do snapshot que roda esta busca (não o atual do searcher, que pode ser trocado no meio dela)
+        namespace = f"{self.index_type}:{snapshot.namespace}"
+        cached = self.query_cache.get_results(namespace, query, search_key) if self.query_cache else None
+        if self.query_cache and self.query_cache.cache_results:
+            CACHE_LOOKUPS.inc(cache='query_results', result='hit' if cached is not None else 'miss')
+        if cached is not None:
+            indices_row, distances_row = cached
+        else:
+            profundidade = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+            resultados = self._buscar(snapshot, [query], profundidade, nprobe, ef_search, mode, filtros)
+            reranqueado = False
+            if rerank:
+                resultados, reranqueado = self._reranquear(snapshot, [query], resultados, top_k, inicio, budget_ms)
+            indices_row, distances_row = resultados[0]
+            # Não grava um resultado que deveria ter passado pelo rerank e não passou (orçamento estourado)
+            if self.query_cache and reranqueado == rerank:
+                self.query_cache.put_results(namespace, query, search_key, indices_row, distances_row)
+        with cronometro('materialize'):
+            resultados_extraidos = self._materializar(snapshot, distances_row, indices_row)
+        return resultados_extraidos
+
+    def search_batch(self, queries, top_k=5, nprobe=None, ef_search=None, mode=None, filtros=None, rerank=None, budget_ms=None):
+        """
+        Busca várias consultas com um único encode em lote e uma única chamada a index.search.
+        Devolve uma lista de resultados por consulta, na mesma ordem de `queries`; `filtros` vale para todas.
+        """
+        if not self.is_ready or self.model is None or self.index is None or self.field_store is None:
+            print(" Semantic Search Service: Não está pronto ou recursos não carregados.")
+            return [[] for _ in queries]
+        if not queries:
+            return []
+
+        inicio = time.perf_counter()
+        rerank = self._usar_rerank(rerank)
+        snapshot = self.snapshot
+        # Mais resultados que linhas só faria o FAISS alocar (e devolver) ids -1
+        top_k = max(1, min(top_k, len(snapshot.field_store)))
+        mode = self._modo_efetivo(snapshot, mode)
+        filtros = normalizar_filtros(filtros)
+        if rerank and len(queries) * max(top_k, RERANK_CANDIDATES) > RERANK_MAX_PAIRS:
+            # Lote grande demais para o cross-encoder no caminho da requisição (e sem estimativa na primeira vez)
+            self.reranker.pular()
+            print(f" Semantic Search Service: Rerank pulado ({len(queries)} consultas passam de RERANK_MAX_PAIRS={RERANK_MAX_PAIRS} pares).")
+            rerank = False
+        profundidade = max(top_k, RERANK_CANDIDATES) if rerank else top_k
+        resultados = self._buscar(snapshot, list(queries), profundidade, nprobe, ef_search, mode, filtros)
+        if rerank:
+            resultados, _ = self._reranquear(snapshot, list(queries), resultados, top_k, inicio, budget_ms)
+        with cronometro('materialize'):
+            return [self._materializar(snapshot, distances_row, indices_row) for indices_row, distances_row in resultados]
+
+    def embed_query(self, query):
+        """Embedding normalizado da consulta (servido do cache de consultas quando possível)."""
+        return self._encode([query])[0]
+
+    def _encode(self, queries):
+        query_embeddings = [None] * len(queries)
+        faltantes = list(range(len(queries)))
+        # Embeddings só dependem do encoder, não da revisão do store
+        namespace = f"{MODEL_NAME_SEMANTIC}:{ENCODER_BACKEND}"
+        if self.query_cache:
+            faltantes = []
+            for i, query in enumerate(queries):
+                query_embeddings[i] = self.query_cache.get_embedding(namespace, query)
+                if query_embeddings[i] is None: faltantes.append(i)
+            CACHE_LOOKUPS.inc(len(queries) - len(faltantes), cache='query_embedding', result='hit')
+            CACHE_LOOKUPS.inc(len(faltantes), cache='query_embedding', result='miss')
+
+        if faltantes:
+            with cronometro('encode'):
+                novos = self.model.encode([queries[i] for i in faltantes], normalize_embeddings=True, batch_size=ENCODE_BATCH_SIZE)
+            for j, i in enumerate(faltantes):
+                query_embeddings[i] = novos[j]
+                if self.query_cache: self.query_cache.put_embedding(namespace, queries[i], novos[j])
+        return np.asarray(np.vstack(query_embeddings), dtype='float32').reshape(len(queries), -1)
+
+    def _modo_efetivo(self, snapshot, mode):
+        mode = mode or SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Modo de busca desconhecido: '{mode}'. Opções: {', '.join(SEARCH_MODES)}")
+        # Sem índice BM25 (BM25_ENABLED = False) só há a busca densa
+        return mode if snapshot.bm25 is not None else 'dense'
+
+    def _usar_rerank(self, rerank):
+        rerank = RERANK_ENABLED if rerank is None else rerank
+        return bool(rerank) and self.reranker is not None
+
+    def _reranquear(self, snapshot, queries, resultados, top_k, inicio, budget_ms=None):
+        """
+        Reordena os candidatos de cada consulta pelo score do cross-encoder (todos os pares em um único
+        predict) e corta no top_k. Devolve (resultados, reranqueado); com o orçamento estourado ou mais de
+        RERANK_MAX_PAIRS pares, só corta.
+        Os scores devolvidos continuam os do primeiro estágio (similaridade exibida ao usuário e ao LLM).
+        """
+        budget_ms = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+        pares, origem = [], []
+        for i_query, (indices_row, _) in enumerate(resultados):
+            for posicao, idx in enumerate(indices_row):
+                if 0 <= idx < len(snapshot.field_store):
+                    pares.append((queries[i_query], snapshot.field_store.columns['texto_original'][idx]))
+                    origem.append((i_query, posicao))
+        cortados = [(np.asarray(ids)[:top_k], np.asarray(scores)[:top_k]) for ids, scores in resultados]
+        if not pares:
+            return cortados, True
+
+        gasto_ms = (time.perf_counter() - inicio) * 1000.0
+        estimado_ms = self.reranker.estimar_ms(len(pares))
+        if len(pares) > RERANK_MAX_PAIRS or (budget_ms and gasto_ms + estimado_ms > budget_ms):
+            self.reranker.pular()
+            print(f" Semantic Search Service: Rerank pulado ({gasto_ms:.1f} ms gastos + {estimado_ms:.1f} ms estimados > orçamento de {budget_ms:.0f} ms).")
+            return cortados, False
+
+        with cronometro('rerank'):
+            scores_rerank = self.reranker.scores(pares)
+        por_consulta = [[] for _ in resultados]
+        for (i_query, posicao), score in zip(origem, scores_rerank):
+            if RERANK_MIN_SCORE is None or score >= RERANK_MIN_SCORE:
+                por_consulta[i_query].append((score, posicao))
+        reordenados = []
+        for (indices_row, distances_row), candidatos in zip(resultados, por_consulta):
+            candidatos.sort(key=lambda item: -item[0])
+            posicoes = np.array([posicao for _, posicao in candidatos[:top_k]], dtype=np.int64)
+            reordenados.append((np.asarray(indices_row)[posicoes], np.asarray(distances_row)[posicoes]))
+        return reordenados, True
+
+    def _buscar(self, snapshot, queries, top_k, nprobe, ef_search, mode, filtros=None):
+        """(ids, scores) por consulta, já na ordem final. Em 'hybrid' o score devolvido é o cosseno denso."""
+        permitidos = snapshot.permitidos(filtros)
+        if permitidos is not None and not len(permitidos):
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        if mode == 'lexical':
+            with cronometro('bm25'):
+                return [snapshot.bm25.search(query, top_k, excluir=snapshot.tombstones, permitidos=permitidos) for query in queries]
+
+        query_embeddings = self._encode(queries)
+        profundidade = top_k if mode == 'dense' else max(top_k, HYBRID_CANDIDATES)
+        with cronometro('faiss_search'):
+            distances, indices = self._buscar_embeddings(snapshot, query_embeddings, profundidade, nprobe, ef_search, permitidos)
+        if mode == 'dense':
+            return list(zip(indices, distances))
+
+        resultados = []
+        for i_query, query in enumerate(queries):
+            densos = [int(idx) for idx in indices[i_query] if idx >= 0]
+            with cronometro('bm25'):
+                lexicos, _ = snapshot.bm25.search(query, profundidade, excluir=snapshot.tombstones, permitidos=permitidos)
+            fundidos = reciprocal_rank_fusion([densos, lexicos], pesos=[HYBRID_DENSE_WEIGHT, HYBRID_LEXICAL_WEIGHT])[:top_k]
+            cossenos = dict(zip(densos, distances[i_query]))
+            ids = np.array([doc_id for doc_id, _ in fundidos], dtype=np.int64)
+            # Documentos vindos só do BM25 recebem o cosseno calculado direto no vetor armazenado
+            scores = np.array([cossenos[doc_id] if doc_id in cossenos else float(np.dot(snapshot.embeddings[doc_id], query_embeddings[i_query]))
+                               for doc_id in ids], dtype=np.float32)
+            resultados.append((ids, scores))
+        return resultados
+
+    def _buscar_embeddings(self, snapshot, query_embeddings_np, top_k, nprobe=None, ef_search=None, permitidos=None):
+        if permitidos is None:
+            # Linhas com tombstone (notas removidas ou substituídas) ficam fora dos candidatos
+            params = search_parameters(snapshot.index, nprobe=nprobe, ef_search=ef_search, sel=snapshot.selector)
+            return snapshot.index.search(query_embeddings_np, top_k, params=params)
+
+        if len(permitidos) <= FILTER_EXACT_SEARCH_MAX_ROWS:
+            # Filtro seletivo: o produto interno direto com as linhas permitidas é exato e mais barato
+            # do que um IVF/HNSW que descartaria quase todos os candidatos visitados
+            scores = query_embeddings_np @ np.asarray(snapshot.embeddings[permitidos], dtype=np.float32).T
+            k = min(top_k, len(permitidos))
+            ordem = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+            distances = np.zeros((len(query_embeddings_np), top_k), dtype=np.float32)
+            indices = np.full((len(query_embeddings_np), top_k), -1, dtype=np.int64)
+            distances[:, :k] = np.take_along_axis(scores, ordem, axis=1)
+            indices[:, :k] = permitidos[ordem]
+            return distances, indices
+
+        # Bitmap das linhas permitidas (tombstones já excluídos); `bits` precisa viver até o fim da busca
+        mascara = np.zeros(len(snapshot.field_store), dtype=bool)
+        mascara[permitidos] = True
+        bits = np.packbits(mascara, bitorder='little')
+        sel = faiss.IDSelectorBitmap(len(mascara), faiss.swig_ptr(bits))
+        params = search_parameters(snapshot.index, nprobe=nprobe, ef_search=ef_search, sel=sel)
+        return snapshot.index.search(query_embeddings_np, top_k, params=params)
 
-        distances, indices = self.index.search(query_embedding_np, top_k)
+    def _materializar(self, snapshot, distances_row, indices_row):
         resultados_extraidos = []
-        
-        field_labels_for_parsing = {
-            'diagnóstico': 'Diagnóstico', 'conclusão': 'Conclusão',
-            'justificativa': 'Justificativa', 'cid': 'CID', 
-            'princípio ativo': 'Princípio Ativo', 'nome comercial': 'Nome Comercial', 
-            'descrição': 'Descrição', 'tipo da tecnologia': 'Tipo da Tecnologia', 
-            'órgão': 'Órgão', 'serventia': 'Serventia'
-        }
-
-        for i_loop in range(indices.shape[1]): 
-            idx = indices[0, i_loop]
-            score = distances[0, i_loop]
-            if idx < 0 or idx >= len(self.dataset): continue
+        field_store = snapshot.field_store
+        for idx, score in zip(indices_row, distances_row):
+            if idx < 0 or idx >= len(field_store): continue
             try:
-                row = self.dataset.iloc[idx]
-                texto_completo = str(row['texto']) if pd.notna(row['texto']) else ""
-                item = {'texto_original': texto_completo} 
-                for key, label_in_text in field_labels_for_parsing.items():
-                    item[key] = extract_field_from_text(texto_completo, label_in_text)
-                
-                item['referencia'] = str(row['referencia']) if pd.notna(row['referencia']) else ''
+                item = field_store.row(idx)
+                item['id_linha'] = int(idx)
                 item['similaridade_busca'] = float(score) if pd.notna(score) else 0.0
                 resultados_extraidos.append(item)
             except Exception as e:
                 print(f" Semantic Search Service: Erro ao processar item no índice {idx}: {e}")
-        
-        print(f" Semantic Search Service: Busca encontrou {len(resultados_extraidos)} resultados.")
-        return resultados_extraidos
\ No newline at end of file
+        return resultados_extraidos
@@ -1,5 +1,12 @@
 import os
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
 from tqdm import tqdm
 
@@ -7,39 +14,121 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 output_dir = os.path.join(base_dir, "pdfs_notas_tecnicas_goias")
 csv_path = os.path.join(base_dir, "notas_tecnicas_goias.csv")
 
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# Manifesto em JSON Lines (um registro por download concluído/falho) para retomar execuções interrompidas
+MANIFEST_FILENAME = "manifest_downloads.jsonl"
+MAX_WORKERS = 8
+MAX_TENTATIVAS = 4
+BACKOFF_BASE_SEGUNDOS = 1.0
+TIMEOUT = (10, 60)              # (conexão, leitura) em segundos
+CHUNK_SIZE = 256 * 1024
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
 
-def download_pdfs():
+
+def criar_sessao(max_workers=MAX_WORKERS):
+    """Session com pool de conexões do tamanho do número de workers (as retentativas são feitas em baixar_pdf)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def carregar_manifesto(manifest_path):
+    """Último registro de cada nota no manifesto (linhas incompletas de uma execução abortada são ignoradas)."""
+    registros = {}
+    if not os.path.exists(manifest_path):
+        return registros
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue
+            registros[str(registro["id"])] = registro
+    return registros
+
+
+def ja_baixado(registro, pdf_path):
+    return (registro is not None and registro.get("status") == "ok"
+            and os.path.exists(pdf_path) and os.path.getsize(pdf_path) == registro.get("bytes"))
+
+
+def baixar_pdf(session, pdf_url, pdf_path, max_tentativas=MAX_TENTATIVAS):
     """
-    Realiza o download dos PDFs listados no CSV de notas técnicas.
+    Baixa um PDF para `pdf_path` via arquivo temporário + os.replace, com retentativas e backoff exponencial.
+    Devolve o número de bytes gravados; levanta a última exceção se todas as tentativas falharem.
     """
-    # Lê o arquivo CSV gerado anteriormente
-    df = pd.read_csv(csv_path)
+    tmp_path = f"{pdf_path}.part"
+    for tentativa in range(1, max_tentativas + 1):
+        try:
+            with session.get(pdf_url, stream=True, timeout=TIMEOUT) as response:
+                if response.status_code in STATUS_RETENTAVEIS:
+                    raise requests.HTTPError(f"Status {response.status_code}", response=response)
+                response.raise_for_status()
+                total = 0
+                with open(tmp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        file.write(chunk)
+                        total += len(chunk)
+            os.replace(tmp_path, pdf_path)
+            return total
+        except requests.RequestException as e:
+            status = e.response.status_code if getattr(e, "response", None) is not None else None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if tentativa == max_tentativas or (status is not None and status not in STATUS_RETENTAVEIS):
+                raise
+            # Backoff exponencial com jitter
+            time.sleep(BACKOFF_BASE_SEGUNDOS * (2 ** (tentativa - 1)) * (0.5 + random.random()))
+
 
-    # Itera sobre as linhas para baixar os PDFs
-    for index, row in tqdm(df.iterrows(), total=df.shape[0], desc="Baixando PDFs"):
-        pdf_url = row["Link Download"]
-        nota_id = row["ID"]
+def download_pdfs(csv_path=csv_path, output_dir=output_dir, max_workers=MAX_WORKERS):
+    """
+    Realiza o download dos PDFs listados no CSV de notas técnicas, em paralelo.
+    Notas já registradas como baixadas no manifesto (e com o arquivo íntegro) são puladas.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifesto = carregar_manifesto(manifest_path)
 
-        # Define o caminho para salvar o PDF
+    # Lê o arquivo CSV gerado anteriormente
+    df = pd.read_csv(csv_path)
+    pendentes = []
+    for nota_id, pdf_url in zip(df["ID"].astype(str), df["Link Download"]):
         pdf_path = os.path.join(output_dir, f"{nota_id}.pdf")
-        
-        # Verifica se o arquivo já existe para não baixar novamente
-        if not os.path.exists(pdf_path):
+        if ja_baixado(manifesto.get(nota_id), pdf_path):
+            continue
+        pendentes.append((nota_id, pdf_url, pdf_path))
+    print(f" {len(df) - len(pendentes)} PDFs já baixados; {len(pendentes)} pendentes.")
+    if not pendentes:
+        return
+
+    session = criar_sessao(max_workers)
+    manifest_lock = threading.Lock()
+    falhas = 0
+    with open(manifest_path, "a", encoding="utf-8") as manifest_file, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(baixar_pdf, session, pdf_url, pdf_path): (nota_id, pdf_url)
+                   for nota_id, pdf_url, pdf_path in pendentes}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Baixando PDFs"):
+            nota_id, pdf_url = futures[future]
+            registro = {"id": nota_id, "url": pdf_url, "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
             try:
-                response = requests.get(pdf_url, stream=True)
-                if response.status_code == 200:
-                    with open(pdf_path, 'wb') as file:
-                        for chunk in response.iter_content(chunk_size=1024):
-                            file.write(chunk)
-                    print(f" Download concluído: {nota_id}.pdf")
-                else:
-                    print(f" Falha no download: {nota_id}.pdf - Status {response.status_code}")
+                registro.update(status="ok", bytes=future.result())
             except Exception as e:
+                falhas += 1
+                registro.update(status="erro", error=str(e))
                 print(f" Erro no download {nota_id}.pdf: {e}")
-        else:
-            print(f" Arquivo já existe: {nota_id}.pdf")
+            with manifest_lock:
+                manifest_file.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                manifest_file.flush()
+    print(f" Downloads concluídos: {len(pendentes) - falhas} ok, {falhas} com erro (rode novamente para retomar).")
+
 
 if __name__ == "__main__":
-    download_pdfs()
+    parser = argparse.ArgumentParser(description="Baixa em paralelo os PDFs das notas técnicas listadas no CSV.")
+    parser.add_argument("--csv", default=csv_path)
+    parser.add_argument("--out", default=output_dir)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+    download_pdfs(args.csv, args.out, args.workers)
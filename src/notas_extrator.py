@@ -1,16 +1,17 @@
 import os
-import pandas as pd
-import fitz  
 import re
+import csv
+import json
+import hashlib
+import argparse
+from multiprocessing import Pool
+import fitz
 from tqdm import tqdm
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 pdf_dir = os.path.join(base_dir, "../data/pdfs_notas_tecnicas_goias")
 output_csv = os.path.join(base_dir, "../data/processed/web_natjus_consolidado.csv")
 
-# Estrutura para armazenar os dados
-data_extracao = []
-
 # Expressões Regulares para Extração
 patterns = {
     "ID": r"Nota Técnica (\d+)",
@@ -37,36 +38,134 @@ patterns = {
     "NatJus Responsável": r"NatJus Responsável:\s*(.*)",
     "Instituição Responsável:": r"Instituição Responsável:\s*(.*)"
 }
+COLUNAS = ["Arquivo"] + list(patterns)
+
+# Padrões compilados uma vez por processo (no initializer de cada worker do pool)
+_padroes_compilados = None
+
+
+def _inicializar_worker():
+    global _padroes_compilados
+    _padroes_compilados = {key: re.compile(pattern, re.MULTILINE) for key, pattern in patterns.items()}
+
+
+def _sha256(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
 
 # Função para extrair dados do PDF
 def extrair_dados_pdf(pdf_path):
+    if _padroes_compilados is None:
+        _inicializar_worker()
     with fitz.open(pdf_path) as pdf:
-        texto = ""
-        for page in pdf:
-            texto += page.get_text()
+        texto = "".join(page.get_text() for page in pdf)
+
+    # Aplicar expressões regulares
+    extracao = {"Arquivo": os.path.basename(pdf_path)}
+    for key, pattern in _padroes_compilados.items():
+        resultado = pattern.search(texto)
+        extracao[key] = resultado.group(1) if resultado else None
+    return extracao
+
+
+def _processar_tarefa(tarefa):
+    """Roda no worker: devolve (arquivo, impressão digital, dados ou None se o conteúdo não mudou)."""
+    pdf_path, digital, hash_anterior = tarefa
+    digital = dict(digital, sha256=_sha256(pdf_path))
+    if digital["sha256"] == hash_anterior:
+        return os.path.basename(pdf_path), digital, None
+    try:
+        return os.path.basename(pdf_path), digital, extrair_dados_pdf(pdf_path)
+    except Exception as e:
+        print(f" Erro ao extrair {os.path.basename(pdf_path)}: {e}")
+        return os.path.basename(pdf_path), None, None
 
-        # Aplicar expressões regulares
-        extracao = {"Arquivo": os.path.basename(pdf_path)}
-        for key, pattern in patterns.items():
-            resultado = re.search(pattern, texto, re.MULTILINE)
-            extracao[key] = resultado.group(1) if resultado else None
 
-        return extracao
+def _carregar_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _linhas_anteriores(output_csv):
+    if not os.path.exists(output_csv):
+        return {}
+    with open(output_csv, "r", encoding="utf-8", newline="") as f:
+        return {linha["Arquivo"]: linha for linha in csv.DictReader(f)}
+
 
 # Leitura dos PDFs da pasta
-def processar_pdfs():
-    for pdf_file in tqdm(os.listdir(pdf_dir), desc="Processando PDFs"):
-        if pdf_file.endswith(".pdf"):
-            pdf_path = os.path.join(pdf_dir, pdf_file)
-            dados = extrair_dados_pdf(pdf_path)
-            data_extracao.append(dados)
-
-# Gerar o DataFrame e salvar
-def salvar_csv():
-    df = pd.DataFrame(data_extracao)
-    df.to_csv(output_csv, index=False)
+def processar_pdfs(pdf_dir=pdf_dir, output_csv=output_csv, workers=None, chunksize=8, incremental=True):
+    """
+    Extrai os campos dos PDFs em um pool de processos e grava as linhas no CSV conforme ficam prontas.
+
+    Com `incremental`, PDFs com mesmo mtime/tamanho (ou, se mudaram, com o mesmo sha256) da última
+    execução não são reprocessados: a linha anterior é copiada para o novo CSV. O mtime/tamanho/sha256
+    de cada PDF fica em um arquivo .estado.json ao lado do CSV.
+    """
+    estado_path = f"{os.path.splitext(output_csv)[0]}.estado.json"
+    estado = _carregar_json(estado_path) if incremental else {}
+    anteriores = _linhas_anteriores(output_csv) if incremental else {}
+
+    tarefas, inalterados = [], []
+    for pdf_file in sorted(os.listdir(pdf_dir)):
+        if not pdf_file.endswith(".pdf"):
+            continue
+        pdf_path = os.path.join(pdf_dir, pdf_file)
+        stat = os.stat(pdf_path)
+        digital = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        registro = estado.get(pdf_file)
+        if registro and pdf_file in anteriores and registro["mtime_ns"] == digital["mtime_ns"] and registro["size"] == digital["size"]:
+            inalterados.append(pdf_file)
+            continue
+        hash_anterior = registro.get("sha256") if registro and pdf_file in anteriores else None
+        tarefas.append((pdf_path, digital, hash_anterior))
+    print(f" {len(inalterados)} PDFs inalterados; {len(tarefas)} para processar.")
+
+    novo_estado = {arquivo: estado[arquivo] for arquivo in inalterados}
+    tmp_path = f"{output_csv}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUNAS)
+        writer.writeheader()
+        for arquivo in inalterados:
+            writer.writerow(anteriores[arquivo])
+
+        if workers == 1:
+            resultados = map(_processar_tarefa, tarefas)
+            pool = None
+        else:
+            pool = Pool(processes=workers, initializer=_inicializar_worker)
+            resultados = pool.imap_unordered(_processar_tarefa, tarefas, chunksize=chunksize)
+        try:
+            for arquivo, digital, dados in tqdm(resultados, total=len(tarefas), desc="Processando PDFs"):
+                if digital is None:
+                    continue
+                novo_estado[arquivo] = digital
+                writer.writerow(dados if dados is not None else anteriores[arquivo])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    os.replace(tmp_path, output_csv)
+    tmp_estado = f"{estado_path}.tmp"
+    with open(tmp_estado, "w", encoding="utf-8") as f:
+        json.dump(novo_estado, f)
+    os.replace(tmp_estado, estado_path)
     print(f" Arquivo CSV gerado em: {output_csv}")
 
+
 if __name__ == "__main__":
-    processar_pdfs()
-    salvar_csv()
+    parser = argparse.ArgumentParser(description="Extrai os campos das notas técnicas (PDF) para um CSV consolidado.")
+    parser.add_argument("--pdf-dir", default=pdf_dir)
+    parser.add_argument("--out", default=output_csv)
+    parser.add_argument("--workers", type=int, default=None, help="Processos do pool (padrão: nº de CPUs; 1 = serial)")
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--full", action="store_true", help="Reprocessa todos os PDFs, ignorando o estado anterior")
+    args = parser.parse_args()
+    processar_pdfs(args.pdf_dir, args.out, workers=args.workers, chunksize=args.chunksize, incremental=not args.full)
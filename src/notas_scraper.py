@@ -1,13 +1,26 @@
 import os
 import time
 import logging
+import argparse
+import threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+
+# Selenium só é necessário no modo de fallback (navegador)
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from webdriver_manager.chrome import ChromeDriverManager
+except ImportError:
+    webdriver = None
 
 # Configuração de Logs
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,9 +29,155 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 base_dir = os.path.dirname(os.path.abspath(__file__))
 output_csv = os.path.join(base_dir, "notas_tecnicas_goias.csv")
 
+URL_PESQUISA = "https://www.pje.jus.br/e-natjus/pesquisaPublica.php"
+COLUNAS_RESULTADO = ["ID", "Data", "Tecnologia", "CID", "NatJus Responsável", "Status", "Link Visualização", "Link Download"]
+
+# Campos do formulário de pesquisa (os mesmos que o navegador envia ao clicar em "Pesquisar"/"Próximo")
+CAMPO_NATJUS = "txtNatResponsavel"
+VALOR_NATJUS = "GO"
+CAMPO_PAGINA = "pagina"
+HTTP_WORKERS = 4
+HTTP_REQUISICOES_POR_SEGUNDO = 2.0
+HTTP_TIMEOUT = (10, 60)
+
+
+class _TabelaResultadosParser(HTMLParser):
+    """
+    Lê de uma vez a tabela de resultados (#tbody) e os links de paginação de uma página da pesquisa.
+    Cada linha vira (textos das células, hrefs da última célula).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.linhas = []
+        self.paginas = set()
+        self._profundidade_tbody = 0
+        self._linha = None
+        self._celula = None
+        self._hrefs = None
+        self._em_link = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "tbody" and (attrs.get("id") == "tbody" or self._profundidade_tbody):
+            self._profundidade_tbody += 1
+        elif self._profundidade_tbody and tag == "tr":
+            self._linha = []
+        elif self._linha is not None and tag == "td":
+            self._celula, self._hrefs = [], []
+        elif tag == "a":
+            if self._celula is not None and attrs.get("href"):
+                self._hrefs.append(attrs["href"])
+            # Só links fora da tabela de resultados são de paginação (um ID de nota com link não é número de página)
+            self._em_link = None if self._profundidade_tbody else []
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._em_link is not None:
+            texto = "".join(self._em_link).strip()
+            if texto.isdigit():
+                self.paginas.add(int(texto))
+            self._em_link = None
+        elif tag == "td" and self._celula is not None:
+            self._linha.append((" ".join("".join(self._celula).split()), self._hrefs))
+            self._celula = None
+        elif tag == "tr" and self._linha is not None:
+            self.linhas.append(self._linha)
+            self._linha = None
+        elif tag == "tbody" and self._profundidade_tbody:
+            self._profundidade_tbody -= 1
+
+    def handle_data(self, data):
+        if self._celula is not None:
+            self._celula.append(data)
+        if self._em_link is not None:
+            self._em_link.append(data)
+
+
+def parse_pagina_resultados(html, base_url=URL_PESQUISA):
+    """Devolve (notas técnicas de GO na página, maior número de página visto na paginação)."""
+    parser = _TabelaResultadosParser()
+    parser.feed(html)
+    notas = []
+    for linha in parser.linhas:
+        if len(linha) > 6 and "GO" in linha[4][0]:
+            hrefs = [urljoin(base_url, href) for href in linha[6][1]]
+            if len(hrefs) < 2:
+                continue
+            notas.append(dict(zip(COLUNAS_RESULTADO, [texto for texto, _ in linha[:6]] + hrefs[:2])))
+    return notas, max(parser.paginas, default=1)
+
+
+class _LimitadorDeTaxa:
+    """Espaça as requisições (somando todas as threads) em no máximo `por_segundo` por segundo."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self._proxima = 0.0
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proxima - agora
+            self._proxima = max(agora, self._proxima) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+class ENatjusHttpScraper:
+    """
+    Coleta a pesquisa pública chamando diretamente as requisições de pesquisa/paginação do
+    pesquisaPublica.php, sem navegador: a primeira página informa o total de páginas e as demais
+    são buscadas em paralelo (HTTP_WORKERS), respeitando HTTP_REQUISICOES_POR_SEGUNDO.
+    """
+
+    def __init__(self, url=URL_PESQUISA, workers=HTTP_WORKERS, por_segundo=HTTP_REQUISICOES_POR_SEGUNDO):
+        self.url = url
+        self.workers = workers
+        self.limitador = _LimitadorDeTaxa(por_segundo)
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=1.0, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.resultados = []
+
+    def buscar_pagina(self, pagina):
+        self.limitador.aguardar()
+        response = self.session.post(self.url, data={CAMPO_NATJUS: VALOR_NATJUS, CAMPO_PAGINA: pagina}, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        return parse_pagina_resultados(response.text, self.url)
+
+    def coletar_dados(self):
+        logging.info("Coletando dados via HTTP (sem navegador)...")
+        notas, maior_pagina = self.buscar_pagina(1)
+        por_pagina = {1: notas}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # A paginação pode mostrar só uma janela de páginas: repete enquanto surgirem páginas novas
+            while True:
+                pendentes = [pagina for pagina in range(2, maior_pagina + 1) if pagina not in por_pagina]
+                if not pendentes:
+                    break
+                for pagina, (notas_pagina, maior_vista) in zip(pendentes, executor.map(self.buscar_pagina, pendentes)):
+                    por_pagina[pagina] = notas_pagina
+                    maior_pagina = max(maior_pagina, maior_vista)
+                logging.info(f"{len(por_pagina)} de {maior_pagina} páginas coletadas...")
+
+        vistos = set()
+        for pagina in sorted(por_pagina):
+            for nota in por_pagina[pagina]:
+                if nota["ID"] not in vistos:
+                    vistos.add(nota["ID"])
+                    self.resultados.append(nota)
+        logging.info(f"{len(self.resultados)} notas técnicas encontradas em {len(por_pagina)} páginas.")
+        return self.resultados
+
+
 class ENatjusScraper:
     def __init__(self):
-        self.url = "https://www.pje.jus.br/e-natjus/pesquisaPublica.php"
+        if webdriver is None:
+            raise ImportError("Selenium/webdriver_manager não instalados; use o modo HTTP (--modo http).")
+        self.url = URL_PESQUISA
         self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()))
         self.resultados = []
 
@@ -92,10 +251,7 @@ class ENatjusScraper:
                 break
 
     def salvar_dados(self):
-        logging.info("Salvando dados coletados em CSV...")
-        df = pd.DataFrame(self.resultados)
-        df.to_csv(output_csv, index=False)
-        logging.info(f"Dados salvos em '{output_csv}'.")
+        salvar_dados(self.resultados)
 
     def executar(self):
         self.iniciar_navegacao()
@@ -104,6 +260,42 @@ class ENatjusScraper:
         self.driver.quit()
         logging.info("Processo finalizado com sucesso!")
         
-if __name__ == "__main__":
+def salvar_dados(resultados, caminho=output_csv):
+    logging.info("Salvando dados coletados em CSV...")
+    df = pd.DataFrame(resultados)
+    df.to_csv(caminho, index=False)
+    logging.info(f"Dados salvos em '{caminho}'.")
+
+
+def executar(modo="auto", url=URL_PESQUISA, caminho=output_csv):
+    """
+    modo 'http': só o coletor HTTP; 'selenium': só o navegador; 'auto': HTTP e, se ele falhar
+    ou não encontrar nenhuma nota, cai para o Selenium.
+    """
+    if modo in ("http", "auto"):
+        try:
+            resultados = ENatjusHttpScraper(url).coletar_dados()
+            if resultados:
+                salvar_dados(resultados, caminho)
+                logging.info("Processo finalizado com sucesso!")
+                return resultados
+            logging.warning("Coletor HTTP não encontrou notas técnicas.")
+        except requests.RequestException as e:
+            logging.warning(f"Coletor HTTP falhou: {e}")
+        if modo == "http":
+            return []
+        logging.info("Usando o navegador (Selenium) como fallback...")
+
     scraper = ENatjusScraper()
+    scraper.url = url
     scraper.executar()
+    return scraper.resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coleta a lista de notas técnicas de GO na pesquisa pública do e-NatJus.")
+    parser.add_argument("--modo", choices=["auto", "http", "selenium"], default="auto")
+    parser.add_argument("--url", default=URL_PESQUISA)
+    parser.add_argument("--out", default=output_csv)
+    args = parser.parse_args()
+    executar(args.modo, args.url, args.out)
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+
+# Os módulos do serviço ficam na raiz do repositório (mesmo layout da imagem Docker); os da coleta, em src/
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for caminho in (RAIZ, os.path.join(RAIZ, 'src')):
+    if caminho not in sys.path:
+        sys.path.insert(0, caminho)
@@ -0,0 +1,86 @@
+# tests/servidor_local.py
+"""Servidor HTTP em 127.0.0.1 (porta livre) que responde por um roteiro de respostas por caminho."""
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class Resposta:
+    def __init__(self, status=200, corpo=b'', tipo='application/octet-stream', truncar_em=None):
+        self.status = status
+        self.corpo = corpo if isinstance(corpo, bytes) else corpo.encode('utf-8')
+        self.tipo = tipo
+        # Envia Content-Length do corpo inteiro, mas fecha a conexão depois de `truncar_em` bytes
+        self.truncar_em = truncar_em
+
+
+class ServidorLocal:
+    """
+    `rotas[caminho]` é uma lista de Resposta consumida a cada requisição (a última se repete) ou uma função
+    (requisicao) -> Resposta. `requisicoes` guarda (método, caminho, campos do formulário) de cada chamada.
+    """
+
+    def __init__(self):
+        self.rotas = {}
+        self.requisicoes = []
+        self._contagem = defaultdict(int)
+        self._lock = threading.Lock()
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, metodo):
+                tamanho = int(self.headers.get('Content-Length') or 0)
+                corpo = self.rfile.read(tamanho).decode('utf-8') if tamanho else ''
+                partes = urlsplit(self.path)
+                campos = {chave: valores[-1] for chave, valores in parse_qs(corpo or partes.query).items()}
+                resposta = servidor._proxima(metodo, partes.path, campos)
+                self.send_response(resposta.status)
+                self.send_header('Content-Type', resposta.tipo)
+                self.send_header('Content-Length', str(len(resposta.corpo)))
+                self.end_headers()
+                if resposta.truncar_em is None:
+                    self.wfile.write(resposta.corpo)
+                else:
+                    self.wfile.write(resposta.corpo[:resposta.truncar_em])
+                    self.wfile.flush()
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._responder('GET')
+
+            def do_POST(self):
+                self._responder('POST')
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def _proxima(self, metodo, caminho, campos):
+        with self._lock:
+            self.requisicoes.append((metodo, caminho, campos))
+            rota = self.rotas.get(caminho)
+            if rota is None:
+                return Resposta(404, b'nao encontrado')
+            if callable(rota):
+                return rota(campos)
+            resposta = rota[min(self._contagem[caminho], len(rota) - 1)]
+            self._contagem[caminho] += 1
+            return resposta
+
+    def chamadas(self, caminho):
+        with self._lock:
+            return sum(1 for _, c, _ in self.requisicoes if c == caminho)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        return False
@@ -0,0 +1,73 @@
+# tests/test_bm25_index.py
+import os
+import json
+import threading
+import numpy as np
+from bm25_index import BM25Index, carregar_ou_construir
+from field_store import FieldStore
+
+TEXTOS = [f"Diagnóstico: doença {i} CID G30.{i % 3}\nConclusão: favorável" for i in range(30)]
+
+
+def _fields(textos=TEXTOS):
+    return FieldStore({'texto_original': list(textos)})
+
+
+def test_indice_gravado_e_relido_pontua_igual(tmp_path):
+    path = str(tmp_path / 'bm25')
+    construido, novo = carregar_ou_construir(_fields(), 'abc', 1, path)
+    relido, novo_de_novo = carregar_ou_construir(_fields(), 'abc', 1, path)
+
+    assert novo and not novo_de_novo
+    np.testing.assert_allclose(relido.scores('g30 doença 7'), construido.scores('g30 doença 7'))
+    assert BM25Index.load_if_fresh(path, 'abc', 2, len(TEXTOS)) is None
+
+
+def test_arquivo_truncado_e_reconstruido(tmp_path):
+    path = str(tmp_path / 'bm25')
+    carregar_ou_construir(_fields(), 'abc', 1, path)
+    with open(f"{path}.meta.json", 'r', encoding='utf-8') as f:
+        data_path = os.path.join(str(tmp_path), json.load(f)['data_file'])
+    with open(data_path, 'r+b') as f:
+        f.truncate(os.path.getsize(data_path) // 2)
+
+    assert BM25Index.load_if_fresh(path, 'abc', 1, len(TEXTOS)) is None
+    _, construido = carregar_ou_construir(_fields(), 'abc', 1, path)
+    assert construido
+    assert BM25Index.load_if_fresh(path, 'abc', 1, len(TEXTOS)) is not None
+
+
+def test_meta_ilegivel_e_tratado_como_desatualizado(tmp_path):
+    path = str(tmp_path / 'bm25')
+    carregar_ou_construir(_fields(), 'abc', 1, path)
+    with open(f"{path}.meta.json", 'w', encoding='utf-8') as f:
+        f.write('{"checksum": "abc", "revi')
+
+    assert BM25Index.load_if_fresh(path, 'abc', 1, len(TEXTOS)) is None
+
+
+def test_gravacoes_concorrentes_nao_misturam_arquivos(tmp_path):
+    path = str(tmp_path / 'bm25')
+    indices = {n: BM25Index.build(TEXTOS[:n]) for n in range(10, 30, 2)}
+    erros = []
+
+    def gravar(n):
+        try:
+            for _ in range(5):
+                indices[n].save(path, f"checksum-{n}", n)
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=gravar, args=(n,)) for n in indices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not erros
+    with open(f"{path}.meta.json", 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    relido = BM25Index.load_if_fresh(path, meta['checksum'], meta['revision'], meta['n_docs'])
+    assert relido is not None
+    np.testing.assert_allclose(relido.scores('doença favorável'), indices[meta['n_docs']].scores('doença favorável'))
+    assert not [nome for nome in os.listdir(tmp_path) if nome.endswith('.tmp')]
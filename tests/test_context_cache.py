@@ -0,0 +1,118 @@
+# tests/test_context_cache.py
+import pytest
+from context_cache import CacheDeInstrucaoDoSistema
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+class ClienteFalso:
+    """Stub de ClienteVertexCaching: cada criação devolve um handle novo; falhas programadas por operação."""
+
+    def __init__(self):
+        self.criados = 0
+        self.renovados = []
+        self.falhas_criar = 0
+        self.falhas_renovar = 0
+
+    def criar(self, model_name, system_instruction, ttl_seconds):
+        if self.falhas_criar:
+            self.falhas_criar -= 1
+            raise RuntimeError('quota')
+        self.criados += 1
+        return {'nome': f'cachedContents/{self.criados}', 'ttl': ttl_seconds}
+
+    def renovar(self, handle, ttl_seconds):
+        if self.falhas_renovar:
+            self.falhas_renovar -= 1
+            raise RuntimeError('NotFound')
+        self.renovados.append(handle['nome'])
+        return handle
+
+    def modelo(self, handle):
+        return ('modelo', handle['nome'])
+
+    def nome(self, handle):
+        return handle['nome']
+
+
+@pytest.fixture
+def relogio():
+    return Relogio()
+
+
+@pytest.fixture
+def cliente():
+    return ClienteFalso()
+
+
+def _cache(cliente, relogio):
+    return CacheDeInstrucaoDoSistema('gemini', ['instrução'], ttl_seconds=3600, margem_seconds=300,
+                                     retry_seconds=600, cliente=cliente, relogio=relogio)
+
+
+def test_cria_uma_vez_e_reaproveita_dentro_do_ttl(cliente, relogio):
+    cache = _cache(cliente, relogio)
+
+    assert cache.modelo() == ('modelo', 'cachedContents/1')
+    relogio.agora += 3000
+    assert cache.modelo() == ('modelo', 'cachedContents/1')
+    assert cliente.criados == 1 and cliente.renovados == []
+
+
+def test_renova_o_ttl_antes_de_expirar(cliente, relogio):
+    cache = _cache(cliente, relogio)
+    cache.modelo()
+
+    relogio.agora += 3600 - 300 + 1
+    assert cache.modelo() == ('modelo', 'cachedContents/1')
+    assert cliente.renovados == ['cachedContents/1']
+    assert cache.stats()['expires_in_s'] == 3600
+
+    # O novo TTL conta a partir da renovação
+    relogio.agora += 3000
+    assert cache.modelo() == ('modelo', 'cachedContents/1')
+    assert cliente.renovados == ['cachedContents/1'] and cliente.criados == 1
+
+
+def test_expirado_ou_renovacao_recusada_cria_outro(cliente, relogio):
+    cache = _cache(cliente, relogio)
+    cache.modelo()
+    cliente.falhas_renovar = 1
+    relogio.agora += 3500
+    assert cache.modelo() == ('modelo', 'cachedContents/2')
+
+    relogio.agora += 3600
+    assert cache.modelo() == ('modelo', 'cachedContents/3')
+    assert cache.stats()['created'] == 3
+
+
+def test_falha_na_criacao_usa_inline_ate_o_retry(cliente, relogio):
+    cliente.falhas_criar = 1
+    cache = _cache(cliente, relogio)
+
+    assert cache.modelo() is None
+    relogio.agora += 599
+    assert cache.modelo() is None
+    assert cliente.criados == 0
+
+    relogio.agora += 2
+    assert cache.modelo() == ('modelo', 'cachedContents/1')
+    assert cache.stats()['failures'] == 1
+
+
+def test_invalidar_volta_ao_inline_e_recria_depois(cliente, relogio):
+    cache = _cache(cliente, relogio)
+    cache.modelo()
+
+    cache.invalidar('NotFound')
+    assert cache.modelo() is None
+    assert cache.stats()['active'] is False
+
+    relogio.agora += 601
+    assert cache.modelo() == ('modelo', 'cachedContents/2')
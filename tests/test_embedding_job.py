@@ -0,0 +1,105 @@
+# tests/test_embedding_job.py
+import os
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+import config
+import embedding_job
+from embedding_store import EmbeddingStore, read_header
+from index_factory import load_index_if_fresh
+
+DIM = 8
+
+
+class EncoderFalso:
+    """Conta as linhas codificadas e pode falhar a partir de um bloco, simulando uma execução interrompida."""
+
+    def __init__(self, registro, falhar_no_bloco=None):
+        self.registro = registro
+        self.falhar_no_bloco = falhar_no_bloco
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, textos, batch_size=32, normalize_embeddings=True):
+        self.registro['blocos'] += 1
+        if self.falhar_no_bloco is not None and self.registro['blocos'] >= self.falhar_no_bloco:
+            raise KeyboardInterrupt
+        self.registro['linhas'] += len(textos)
+        vetores = np.random.default_rng(len(textos)).random((len(textos), DIM)).astype(np.float32)
+        return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    estado = {'blocos': 0, 'linhas': 0, 'backends': [], 'falhar_no_bloco': None}
+
+    def carregar_encoder(backend=None, *args, **kwargs):
+        estado['backends'].append(backend)
+        return EncoderFalso(estado, estado['falhar_no_bloco'])
+
+    monkeypatch.setitem(sys.modules, 'encoder_backends', types.SimpleNamespace(carregar_encoder=carregar_encoder))
+    return estado
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    caminho = tmp_path / 'dataset.csv'
+    pd.DataFrame({
+        'id': range(100),
+        'texto': [f"Diagnóstico: doença {i}\nConclusão: favorável" for i in range(100)],
+    }).to_csv(caminho, index=False)
+    return str(caminho)
+
+
+def _interromper(dataset, store_dir, encoder, backend):
+    encoder['falhar_no_bloco'] = 3
+    with pytest.raises(KeyboardInterrupt):
+        embedding_job.executar_job(dataset, store_dir, chunk_rows=20, backend=backend)
+    encoder.update(blocos=0, linhas=0, falhar_no_bloco=None)
+
+
+def test_retoma_do_checkpoint_com_o_mesmo_backend(dataset, tmp_path, encoder):
+    store_dir = str(tmp_path / 'store')
+    _interromper(dataset, store_dir, encoder, 'onnx')
+
+    header = embedding_job.executar_job(dataset, store_dir, chunk_rows=20, backend='onnx')
+
+    assert encoder['linhas'] == 60
+    assert header['rows'] == 100
+    assert header['encoder_backend'] == 'onnx'
+    assert read_header(store_dir)['encoder_backend'] == 'onnx'
+
+
+def test_checkpoint_de_outro_backend_recomeca_do_zero(dataset, tmp_path, encoder):
+    store_dir = str(tmp_path / 'store')
+    _interromper(dataset, store_dir, encoder, 'torch')
+
+    header = embedding_job.executar_job(dataset, store_dir, chunk_rows=20, backend='onnx_int8')
+
+    assert encoder['linhas'] == 100
+    assert header['rows'] == 100
+    assert len(EmbeddingStore.open(store_dir, mmap=False).field_store) == 100
+
+
+def test_indice_gravado_antes_da_troca_do_store(dataset, tmp_path, encoder, monkeypatch):
+    store_dir = str(tmp_path / 'store')
+    index_dir = str(tmp_path / 'faiss')
+    monkeypatch.setattr(config, 'FAISS_INDEX_TYPE', 'flat')
+    trocas = []
+    os_replace = os.replace
+
+    def replace(origem, destino):
+        if destino == store_dir:
+            # No momento da troca o índice do novo checksum já precisa estar publicado
+            header = read_header(origem)
+            trocas.append(load_index_if_fresh('flat', header['checksum'], header['rows'], index_dir, mmap=False))
+        return os_replace(origem, destino)
+
+    monkeypatch.setattr(embedding_job.os, 'replace', replace)
+    header = embedding_job.executar_job(dataset, store_dir, chunk_rows=50, build_index=True, index_dir=index_dir)
+
+    assert len(trocas) == 1 and trocas[0] is not None
+    assert trocas[0].ntotal == header['rows'] == 100
@@ -0,0 +1,117 @@
+# tests/test_index_factory.py
+import os
+import json
+import threading
+import numpy as np
+import pytest
+import config
+from index_factory import build_index, index_paths, load_index_if_fresh, write_index_with_meta
+
+
+def _embeddings(linhas, dim=16, seed=0):
+    vetores = np.random.default_rng(seed).random((linhas, dim)).astype(np.float32)
+    return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+
+def _meta(index_dir, index_type='flat'):
+    with open(index_paths(index_type, str(index_dir))[1], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_grava_e_le_o_indice_pelo_meta(tmp_path):
+    index = build_index(_embeddings(100), 'flat')
+    write_index_with_meta(index, 'flat', 'abc', str(tmp_path))
+
+    meta = _meta(tmp_path)
+    assert meta['factory'] == 'Flat'
+    assert os.path.exists(tmp_path / meta['index_file'])
+    assert load_index_if_fresh('flat', 'abc', 100, str(tmp_path), mmap=False).ntotal == 100
+    assert load_index_if_fresh('flat', 'outro', 100, str(tmp_path), mmap=False) is None
+    assert load_index_if_fresh('flat', 'abc', 101, str(tmp_path), mmap=False) is None
+
+
+def test_meta_ou_indice_ilegivel_devolve_none(tmp_path):
+    write_index_with_meta(build_index(_embeddings(50), 'flat'), 'flat', 'abc', str(tmp_path))
+    meta_path = index_paths('flat', str(tmp_path))[1]
+    with open(tmp_path / _meta(tmp_path)['index_file'], 'wb') as f:
+        f.write(b'corrompido')
+    assert load_index_if_fresh('flat', 'abc', 50, str(tmp_path), mmap=False) is None
+
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        f.write('{"embeddings_checksum": ')
+    assert load_index_if_fresh('flat', 'abc', 50, str(tmp_path), mmap=False) is None
+
+
+@pytest.mark.parametrize('index_type, parametro, valor', [
+    ('hnsw', 'FAISS_HNSW_M', 16),
+    ('hnsw', 'FAISS_HNSW_EF_CONSTRUCTION', 40),
+    ('ivf_flat', 'FAISS_IVF_NLIST', 3),
+    ('ivf_pq', 'FAISS_PQ_M', 8),
+])
+def test_parametros_de_construcao_diferentes_invalidam_o_indice(tmp_path, monkeypatch, index_type, parametro, valor):
+    monkeypatch.setattr(config, 'FAISS_IVF_NLIST', 2)
+    monkeypatch.setattr(config, 'FAISS_PQ_M', 4)
+    monkeypatch.setattr(config, 'FAISS_PQ_NBITS', 4)
+    write_index_with_meta(build_index(_embeddings(400), index_type), index_type, 'abc', str(tmp_path))
+    assert load_index_if_fresh(index_type, 'abc', 400, str(tmp_path), mmap=False) is not None
+
+    monkeypatch.setattr(config, parametro, valor)
+    assert load_index_if_fresh(index_type, 'abc', 400, str(tmp_path), mmap=False) is None
+
+
+def test_factory_registra_o_indice_construido(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'FAISS_IVF_NLIST', 2)
+    monkeypatch.setattr(config, 'FAISS_PQ_M', 4)
+    monkeypatch.setattr(config, 'FAISS_PQ_NBITS', 4)
+    write_index_with_meta(build_index(_embeddings(400), 'ivf_pq'), 'ivf_pq', 'abc', str(tmp_path))
+    write_index_with_meta(build_index(_embeddings(400), 'hnsw'), 'hnsw', 'abc', str(tmp_path))
+    assert _meta(tmp_path, 'ivf_pq')['factory'] == 'IVF2,PQ4x4'
+    assert _meta(tmp_path, 'hnsw')['factory'] == f"HNSW{config.FAISS_HNSW_M},Flat"
+
+
+def test_versoes_antigas_sao_removidas_depois_do_prazo(tmp_path):
+    arquivos = []
+    for seed in range(3):
+        write_index_with_meta(build_index(_embeddings(30, seed=seed), 'flat'), 'flat', f"c{seed}", str(tmp_path))
+        arquivos.append(_meta(tmp_path)['index_file'])
+        # Envelhece as versões gravadas até aqui além de FAISS_INDEX_KEEP_SECONDS
+        antigo = os.path.getmtime(tmp_path / arquivos[-1]) - config.FAISS_INDEX_KEEP_SECONDS - 1
+        os.utime(tmp_path / arquivos[-1], (antigo, antigo))
+
+    assert len(set(arquivos)) == 3
+    assert not os.path.exists(tmp_path / arquivos[0])
+    assert os.path.exists(tmp_path / arquivos[1]) and os.path.exists(tmp_path / arquivos[2])
+    assert _meta(tmp_path)['previous_index_file'] == arquivos[1]
+
+
+def test_versao_recente_nao_apontada_pelo_meta_e_mantida(tmp_path):
+    write_index_with_meta(build_index(_embeddings(30, seed=0), 'flat'), 'flat', 'c0', str(tmp_path))
+    primeiro = _meta(tmp_path)['index_file']
+    for seed in (1, 2):
+        write_index_with_meta(build_index(_embeddings(30, seed=seed), 'flat'), 'flat', f"c{seed}", str(tmp_path))
+    assert os.path.exists(tmp_path / primeiro)
+
+
+def test_gravacoes_concorrentes_nao_compartilham_arquivo_temporario(tmp_path):
+    indices = [build_index(_embeddings(200, seed=seed), 'flat') for seed in range(4)]
+    erros = []
+
+    def gravar(i):
+        try:
+            for _ in range(5):
+                write_index_with_meta(indices[i], 'flat', f"c{i}", str(tmp_path))
+        except Exception as e:
+            erros.append(e)
+
+    threads = [threading.Thread(target=gravar, args=(i,)) for i in range(len(indices))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert erros == []
+    assert not [nome for nome in os.listdir(tmp_path) if nome.endswith('.tmp')]
+    meta = _meta(tmp_path)
+    index = load_index_if_fresh('flat', meta['embeddings_checksum'], 200, str(tmp_path), mmap=False)
+    i = int(meta['embeddings_checksum'][1:])
+    np.testing.assert_array_equal(index.reconstruct_n(0, 200), indices[i].reconstruct_n(0, 200))
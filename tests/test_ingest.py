@@ -0,0 +1,91 @@
+# tests/test_ingest.py
+import sys
+import json
+import types
+import numpy as np
+import pandas as pd
+import pytest
+import config
+import ingest
+from field_store import FieldStore
+from embedding_store import EmbeddingStore, write_embedding_store, read_header, write_header
+from index_factory import index_paths, load_index_if_fresh
+
+DIM = 16
+
+
+def _vetores(textos):
+    rng = np.random.default_rng(len(textos))
+    vetores = rng.random((len(textos), DIM)).astype(np.float32)
+    return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+
+class EncoderFalso:
+    def encode(self, textos, normalize_embeddings=True, batch_size=32):
+        return _vetores(textos)
+
+
+def _notas(inicio, quantidade):
+    return pd.DataFrame({
+        'id': list(range(inicio, inicio + quantidade)),
+        'texto': [f"Diagnóstico: doença {i}\nConclusão: favorável {i}" for i in range(inicio, inicio + quantidade)],
+    })
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    fields = FieldStore.from_dataframe(_notas(0, 50))
+    write_embedding_store(str(tmp_path / 'store'), _vetores(fields.columns['texto_original']), fields, config.MODEL_NAME_SEMANTIC)
+    monkeypatch.setitem(sys.modules, 'encoder_backends', types.SimpleNamespace(carregar_encoder=lambda *a, **k: EncoderFalso()))
+    return str(tmp_path / 'store')
+
+
+def test_ingest_sem_indice_persistido_reconstroi_com_todas_as_linhas(store_dir, tmp_path):
+    csv = tmp_path / 'novas.csv'
+    _notas(50, 10).to_csv(csv, index=False)
+    index_dir = str(tmp_path / 'faiss')
+
+    header = ingest.ingest(str(csv), store_dir=store_dir, index_type='flat', index_dir=index_dir)
+
+    assert header['rows'] == 60
+    with open(index_paths('flat', index_dir)[1], 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    assert meta['ntotal'] == 60
+    assert meta['embeddings_checksum'] == header['checksum']
+    index = load_index_if_fresh('flat', header['checksum'], header['rows'], index_dir, mmap=False)
+    assert index is not None
+    store = EmbeddingStore.open(store_dir, mmap=False)
+    np.testing.assert_allclose(index.reconstruct_n(0, 60), store.embeddings, atol=1e-6)
+
+
+def test_ingest_com_indice_persistido_acrescenta_linhas(store_dir, tmp_path):
+    index_dir = str(tmp_path / 'faiss')
+    csv = tmp_path / 'novas.csv'
+    _notas(50, 10).to_csv(csv, index=False)
+    ingest.ingest(str(csv), store_dir=store_dir, index_type='flat', index_dir=index_dir)
+    _notas(60, 5).to_csv(csv, index=False)
+
+    header = ingest.ingest(str(csv), store_dir=store_dir, index_type='flat', index_dir=index_dir)
+
+    assert header['rows'] == 65
+    assert load_index_if_fresh('flat', header['checksum'], 65, index_dir, mmap=False).ntotal == 65
+
+
+def test_ingest_codifica_com_o_backend_registrado_no_store(store_dir, tmp_path, monkeypatch):
+    backends = []
+
+    def carregar_encoder(backend=None, *args, **kwargs):
+        backends.append(backend)
+        return EncoderFalso()
+    monkeypatch.setitem(sys.modules, 'encoder_backends', types.SimpleNamespace(carregar_encoder=carregar_encoder))
+    monkeypatch.setattr(config, 'ENCODER_BACKEND', 'torch')
+    header = read_header(store_dir)
+    header['encoder_backend'] = 'onnx_int8'
+    write_header(store_dir, header)
+    csv = tmp_path / 'novas.csv'
+    _notas(50, 3).to_csv(csv, index=False)
+
+    header = ingest.ingest(str(csv), store_dir=store_dir, index_type='flat', index_dir=str(tmp_path / 'faiss'))
+
+    assert backends == ['onnx_int8']
+    assert header['encoder_backend'] == 'onnx_int8'
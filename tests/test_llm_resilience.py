@@ -0,0 +1,233 @@
+# tests/test_llm_resilience.py
+import time
+import asyncio
+import threading
+import pytest
+from llm_resilience import ChamadaResiliente, CircuitBreaker, LLMIndisponivelError, PrazoDaChamadaEsgotadoError
+
+
+# Os erros são reconhecidos pelo nome da classe (como os do google.api_core)
+class ServiceUnavailable(Exception):
+    pass
+
+
+class InvalidArgument(Exception):
+    pass
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+def criar_chamada(timeout=1.0, prazo_total=5.0, max_retries=2, **kwargs):
+    kwargs.setdefault('breaker', CircuitBreaker(janela=20, taxa_erro=0.5, min_chamadas=4))
+    return ChamadaResiliente(timeout, prazo_total, max_retries, 0.0, 0.0, **kwargs)
+
+
+def falhar_antes(erros, resultado='ok'):
+    """fn que levanta os `erros` em sequência e depois devolve `resultado`; conta as chamadas."""
+    pendentes = list(erros)
+    chamadas = []
+
+    def fn():
+        chamadas.append(time.monotonic())
+        if pendentes:
+            raise pendentes.pop(0)
+        return resultado
+    fn.chamadas = chamadas
+    return fn
+
+
+def test_erro_retentavel_tenta_de_novo_ate_dar_certo():
+    chamada = criar_chamada()
+    fn = falhar_antes([ServiceUnavailable('503'), ServiceUnavailable('503')])
+
+    assert chamada.executar(fn) == 'ok'
+    assert len(fn.chamadas) == 3
+    assert chamada.stats()['retries'] == 2
+
+
+def test_tentativas_esgotadas_levantam_indisponivel():
+    chamada = criar_chamada(max_retries=1)
+    fn = falhar_antes([ServiceUnavailable('503')] * 3)
+
+    with pytest.raises(LLMIndisponivelError):
+        chamada.executar(fn)
+    assert len(fn.chamadas) == 2
+
+
+def test_erro_nao_retentavel_nao_repete_nem_conta_para_o_breaker():
+    chamada = criar_chamada()
+    for _ in range(6):
+        with pytest.raises(LLMIndisponivelError):
+            chamada.executar(falhar_antes([InvalidArgument('prompt inválido')]))
+
+    assert chamada.stats()['retries'] == 0
+    assert chamada.breaker.estado == CircuitBreaker.FECHADO
+    assert chamada.breaker.stats()['window_error_rate'] == 0.0
+
+
+def test_erros_retentaveis_abrem_o_breaker():
+    chamada = criar_chamada(max_retries=0)
+    for _ in range(4):
+        with pytest.raises(LLMIndisponivelError):
+            chamada.executar(falhar_antes([ServiceUnavailable('503')]))
+
+    assert chamada.breaker.estado == CircuitBreaker.ABERTO
+    fn = falhar_antes([])
+    with pytest.raises(LLMIndisponivelError, match='circuit breaker'):
+        chamada.executar(fn)
+    assert fn.chamadas == []
+
+
+def test_prazo_por_tentativa_abandona_a_chamada_lenta():
+    chamada = criar_chamada(timeout=0.1, prazo_total=0.3, max_retries=0)
+    inicio = time.monotonic()
+
+    with pytest.raises(LLMIndisponivelError) as erro:
+        chamada.executar(lambda: time.sleep(1.0))
+    assert isinstance(erro.value.__cause__, PrazoDaChamadaEsgotadoError)
+    assert time.monotonic() - inicio < 0.5
+    assert chamada.stats()['timeouts'] == 1
+
+
+def test_prazo_total_limita_as_novas_tentativas():
+    chamada = criar_chamada(timeout=0.1, prazo_total=0.35, max_retries=10)
+    inicio = time.monotonic()
+
+    with pytest.raises(LLMIndisponivelError):
+        chamada.executar(lambda: time.sleep(1.0))
+    assert time.monotonic() - inicio < 0.6
+    assert chamada.stats()['attempts'] <= 4
+
+
+def test_espera_por_vaga_nao_conta_no_prazo_da_tentativa():
+    chamada = criar_chamada(timeout=0.5, max_retries=0, max_threads=1)
+    ocupante = threading.Thread(target=chamada.executar, args=(lambda: time.sleep(0.3),))
+    ocupante.start()
+    time.sleep(0.05)
+
+    inicio = time.monotonic()
+    # Espera ~0.25s pela vaga e roda 0.3s: passa do prazo da tentativa só se a espera contar
+    assert chamada.executar(lambda: time.sleep(0.3) or 'ok') == 'ok'
+    assert time.monotonic() - inicio > 0.5
+    ocupante.join()
+    assert chamada.stats()['timeouts'] == 0
+
+
+def test_tentativa_abandonada_ocupa_a_vaga_ate_terminar():
+    chamada = criar_chamada(timeout=0.1, prazo_total=0.2, max_retries=0, max_threads=1)
+    liberar = threading.Event()
+    with pytest.raises(LLMIndisponivelError):
+        chamada.executar(liberar.wait)
+    assert chamada.stats()['in_flight'] == 1
+
+    with pytest.raises(LLMIndisponivelError, match='sobrecarregado'):
+        chamada.executar(lambda: 'ok')
+    stats = chamada.stats()
+    assert stats['no_slot'] == 1
+    assert stats['breaker']['window_calls'] == 1
+
+    liberar.set()
+    assert chamada.executar(lambda: 'ok') == 'ok'
+
+
+def test_sem_vaga_falha_logo_sem_esperar_o_prazo_total():
+    chamada = criar_chamada(timeout=0.05, prazo_total=10.0, max_retries=0, max_threads=1, espera_por_vaga_seconds=0.1)
+    liberar = threading.Event()
+    with pytest.raises(LLMIndisponivelError):
+        chamada.executar(liberar.wait)
+
+    inicio = time.monotonic()
+    with pytest.raises(LLMIndisponivelError, match='sobrecarregado'):
+        chamada.executar(lambda: 'ok')
+    assert time.monotonic() - inicio < 0.5
+    liberar.set()
+
+
+def test_hedge_vence_quando_a_primeira_chamada_demora():
+    chamada = criar_chamada(timeout=2.0, max_retries=0, hedge=True, hedge_min_amostras=1)
+    chamada._latencias.extend([0.05] * 5)
+    lock, chamadas = threading.Lock(), []
+
+    def fn():
+        with lock:
+            chamadas.append(None)
+            n = len(chamadas)
+        if n == 1:
+            time.sleep(1.0)
+            return 'primeira'
+        return 'hedge'
+
+    inicio = time.monotonic()
+    assert chamada.executar(fn) == 'hedge'
+    assert time.monotonic() - inicio < 0.5
+    stats = chamada.stats()
+    assert stats['hedges'] == 1
+    assert stats['hedges_won'] == 1
+
+
+def test_sem_amostras_suficientes_nao_dispara_hedge():
+    chamada = criar_chamada(max_retries=0, hedge=True, hedge_min_amostras=20)
+    fn = falhar_antes([])
+
+    assert chamada.executar(fn) == 'ok'
+    assert len(fn.chamadas) == 1
+    assert chamada.stats()['hedges'] == 0
+
+
+def test_breaker_abre_fica_meio_aberto_e_fecha():
+    relogio = Relogio()
+    breaker = CircuitBreaker(janela=4, taxa_erro=0.5, min_chamadas=4, cooldown_seconds=30.0, relogio=relogio)
+    for sucesso in (True, False, True, False):
+        breaker.registrar(sucesso)
+    assert breaker.estado == CircuitBreaker.ABERTO
+    assert not breaker.permitir()
+
+    relogio.agora += 30.0
+    assert breaker.permitir()
+    assert breaker.estado == CircuitBreaker.MEIO_ABERTO
+    # Só uma chamada de teste por vez
+    assert not breaker.permitir()
+
+    breaker.registrar(True)
+    assert breaker.estado == CircuitBreaker.FECHADO
+    assert breaker.permitir()
+
+
+def test_falha_no_meio_aberto_reabre_o_breaker():
+    relogio = Relogio()
+    breaker = CircuitBreaker(janela=4, taxa_erro=0.5, min_chamadas=2, cooldown_seconds=30.0, relogio=relogio)
+    breaker.registrar(False)
+    breaker.registrar(False)
+    relogio.agora += 30.0
+    assert breaker.permitir()
+
+    breaker.registrar(False)
+    assert breaker.estado == CircuitBreaker.ABERTO
+    assert breaker.stats()['opened_total'] == 2
+    relogio.agora += 29.0
+    assert not breaker.permitir()
+
+
+def test_executar_async_tenta_de_novo_e_respeita_o_prazo():
+    chamada = criar_chamada(timeout=0.1, prazo_total=1.0)
+    erros = [ServiceUnavailable('503')]
+
+    async def gerar():
+        if erros:
+            raise erros.pop()
+        return 'ok'
+
+    assert asyncio.run(chamada.executar_async(gerar)) == 'ok'
+    assert chamada.stats()['retries'] == 1
+
+    async def lenta():
+        await asyncio.sleep(1.0)
+
+    with pytest.raises(LLMIndisponivelError):
+        asyncio.run(criar_chamada(timeout=0.1, prazo_total=0.15, max_retries=0).executar_async(lenta))
@@ -0,0 +1,135 @@
+# tests/test_llm_service.py
+import types
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip('vertexai')
+from google.api_core import exceptions  # noqa: E402
+import llm_service  # noqa: E402
+from llm_service import EnriquecedorLLM  # noqa: E402
+from llm_resilience import ChamadaResiliente  # noqa: E402
+
+
+def _resposta(texto):
+    parte = types.SimpleNamespace(text=texto)
+    candidato = types.SimpleNamespace(content=types.SimpleNamespace(parts=[parte]), finish_reason=None)
+    return types.SimpleNamespace(candidates=[candidato], prompt_feedback=None)
+
+
+class ModeloFalso:
+    """GenerativeModel de teste: responde `texto` ou levanta `erro` (no stream, ao pedir o primeiro chunk)."""
+
+    def __init__(self, texto, erro=None):
+        self.texto = texto
+        self.erro = erro
+        self.chamadas = 0
+
+    async def generate_content_async(self, contents, generation_config=None, safety_settings=None, stream=False):
+        return self.generate_content(contents, generation_config, safety_settings, stream)
+
+    def generate_content(self, contents, generation_config=None, safety_settings=None, stream=False):
+        self.chamadas += 1
+        if not stream:
+            if self.erro is not None:
+                raise self.erro
+            return _resposta(self.texto)
+        return self._chunks()
+
+    def _chunks(self):
+        if self.erro is not None:
+            raise self.erro
+        for parte in self.texto.split(' '):
+            yield _resposta(parte + ' ')
+
+
+class ClienteFalso:
+    def __init__(self, modelo_em_cache):
+        self.modelo_em_cache = modelo_em_cache
+        self.criados = 0
+        self.threads_criar = []
+
+    def criar(self, model_name, system_instruction, ttl_seconds):
+        self.criados += 1
+        self.threads_criar.append(threading.current_thread())
+        return f'cachedContents/{self.criados}'
+
+    def renovar(self, handle, ttl_seconds):
+        return handle
+
+    def modelo(self, handle):
+        return self.modelo_em_cache
+
+    def nome(self, handle):
+        return handle
+
+
+@pytest.fixture
+def enriquecedor(monkeypatch):
+    monkeypatch.setattr(llm_service, 'LLM_CONTEXT_CACHE_ENABLED', True)
+    monkeypatch.setattr(llm_service, 'LLM_RESPONSE_CACHE_ENABLED', False)
+
+    def criar(modelo_em_cache):
+        inline = ModeloFalso('resposta inline')
+        resiliencia = ChamadaResiliente(5.0, 10.0, 0, 0.0, 0.0)
+        llm = EnriquecedorLLM('projeto', 'regiao', model=inline, context_cache_client=ClienteFalso(modelo_em_cache),
+                              resiliencia=resiliencia)
+        return llm, inline
+    return criar
+
+
+def test_usa_o_modelo_em_cache_quando_disponivel(enriquecedor):
+    em_cache = ModeloFalso('resposta do cache')
+    llm, inline = enriquecedor(em_cache)
+
+    assert llm.gerar_resposta_enriquecida('contexto') == 'resposta do cache'
+    assert (em_cache.chamadas, inline.chamadas) == (1, 0)
+
+
+@pytest.mark.parametrize('erro', [exceptions.NotFound('CachedContent not found (or permission denied)'),
+                                  exceptions.FailedPrecondition('cached content cachedContents/1 has expired')])
+def test_cache_recusado_cai_no_modelo_inline(enriquecedor, erro):
+    em_cache = ModeloFalso('não usado', erro=erro)
+    llm, inline = enriquecedor(em_cache)
+
+    assert llm.gerar_resposta_enriquecida('contexto') == 'resposta inline'
+    assert (em_cache.chamadas, inline.chamadas) == (1, 1)
+    assert llm.context_cache.stats()['active'] is False
+
+    # Até o retry do context cache, vai direto para o inline
+    assert llm.gerar_resposta_enriquecida('contexto') == 'resposta inline'
+    assert em_cache.chamadas == 1
+
+
+@pytest.mark.parametrize('erro', [exceptions.NotFound('CachedContent not found (or permission denied)'),
+                                  exceptions.FailedPrecondition('cached content cachedContents/1 has expired')])
+def test_stream_com_cache_recusado_cai_no_modelo_inline(enriquecedor, erro):
+    llm, inline = enriquecedor(ModeloFalso('não usado', erro=erro))
+
+    assert ''.join(llm.gerar_resposta_enriquecida_stream('contexto')) == 'resposta inline '
+    assert inline.chamadas == 1
+
+
+@pytest.mark.parametrize('erro', [exceptions.InternalServerError('falha'),
+                                  exceptions.InvalidArgument('The input token count exceeds the maximum'),
+                                  exceptions.PermissionDenied('Permission denied on resource project'),
+                                  exceptions.NotFound('Publisher model gemini-x was not found')])
+def test_outros_erros_nao_passam_para_o_inline(enriquecedor, erro):
+    llm, inline = enriquecedor(ModeloFalso('não usado', erro=erro))
+
+    with pytest.raises(llm_service.LLMIndisponivelError):
+        llm.gerar_resposta_enriquecida('contexto')
+    assert inline.chamadas == 0
+    # Erro da própria requisição: o context cache continua ativo
+    assert llm.context_cache.stats()['active'] is True
+
+
+def test_criacao_do_cache_no_caminho_async_roda_fora_do_event_loop(enriquecedor):
+    em_cache = ModeloFalso('resposta do cache')
+    llm, inline = enriquecedor(em_cache)
+
+    assert asyncio.run(llm.gerar_resposta_enriquecida_async('contexto')) == 'resposta do cache'
+    cliente = llm.context_cache.cliente
+    assert cliente.criados == 1
+    # asyncio.run roda o loop nesta thread; o CachedContent.create (bloqueante) tem de ir para outra
+    assert cliente.threads_criar[0] is not threading.current_thread()
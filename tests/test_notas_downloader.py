@@ -0,0 +1,103 @@
+# tests/test_notas_downloader.py
+import os
+import json
+import pandas as pd
+import pytest
+import requests
+import notas_downloader
+from notas_downloader import MANIFEST_FILENAME, baixar_pdf, carregar_manifesto, criar_sessao, download_pdfs
+from servidor_local import Resposta, ServidorLocal
+
+PDF = b'%PDF-1.4 ' + b'x' * 300_000
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(notas_downloader, 'BACKOFF_BASE_SEGUNDOS', 0)
+    monkeypatch.setattr(notas_downloader, 'TIMEOUT', (2, 5))
+
+
+@pytest.fixture
+def servidor():
+    with ServidorLocal() as servidor:
+        yield servidor
+
+
+def test_retenta_apos_503(servidor, tmp_path):
+    servidor.rotas['/nota/1'] = [Resposta(503), Resposta(503), Resposta(200, PDF)]
+    destino = tmp_path / '1.pdf'
+
+    assert baixar_pdf(criar_sessao(1), f"{servidor.url}/nota/1", str(destino)) == len(PDF)
+    assert servidor.chamadas('/nota/1') == 3
+    assert destino.read_bytes() == PDF
+    assert not os.path.exists(f"{destino}.part")
+
+
+def test_desiste_depois_do_maximo_de_tentativas(servidor, tmp_path):
+    servidor.rotas['/nota/1'] = [Resposta(503)]
+
+    with pytest.raises(requests.HTTPError):
+        baixar_pdf(criar_sessao(1), f"{servidor.url}/nota/1", str(tmp_path / '1.pdf'), max_tentativas=3)
+    assert servidor.chamadas('/nota/1') == 3
+
+
+def test_status_nao_retentavel_falha_na_primeira_tentativa(servidor, tmp_path):
+    with pytest.raises(requests.HTTPError):
+        baixar_pdf(criar_sessao(1), f"{servidor.url}/inexistente", str(tmp_path / '1.pdf'))
+    assert servidor.chamadas('/inexistente') == 1
+
+
+def test_download_interrompido_remove_o_arquivo_part(servidor, tmp_path):
+    servidor.rotas['/nota/1'] = [Resposta(200, PDF, truncar_em=1000)]
+    destino = tmp_path / '1.pdf'
+
+    with pytest.raises(requests.RequestException):
+        baixar_pdf(criar_sessao(1), f"{servidor.url}/nota/1", str(destino), max_tentativas=2)
+    assert servidor.chamadas('/nota/1') == 2
+    assert not destino.exists()
+    assert not os.path.exists(f"{destino}.part")
+
+
+def test_interrompido_e_depois_completo_grava_o_arquivo_inteiro(servidor, tmp_path):
+    servidor.rotas['/nota/1'] = [Resposta(200, PDF, truncar_em=1000), Resposta(200, PDF)]
+    destino = tmp_path / '1.pdf'
+
+    assert baixar_pdf(criar_sessao(1), f"{servidor.url}/nota/1", str(destino)) == len(PDF)
+    assert destino.read_bytes() == PDF
+
+
+def _csv(tmp_path, servidor, ids):
+    caminho = tmp_path / 'notas.csv'
+    pd.DataFrame({'ID': ids, 'Link Download': [f"{servidor.url}/nota/{i}" for i in ids]}).to_csv(caminho, index=False)
+    return str(caminho)
+
+
+def test_retoma_pelo_manifesto(servidor, tmp_path):
+    saida = tmp_path / 'pdfs'
+    csv = _csv(tmp_path, servidor, [1, 2, 3, 4])
+    for i in (1, 2, 3):
+        servidor.rotas[f'/nota/{i}'] = [Resposta(200, PDF + str(i).encode())]
+
+    download_pdfs(csv, str(saida), max_workers=2)
+
+    manifesto = carregar_manifesto(str(saida / MANIFEST_FILENAME))
+    assert {nota: registro['status'] for nota, registro in manifesto.items()} == {'1': 'ok', '2': 'ok', '3': 'ok', '4': 'erro'}
+    assert manifesto['1']['bytes'] == len(PDF) + 1
+
+    # Segunda execução: a nota 4 passa a existir e o PDF da nota 2 foi truncado no disco
+    servidor.rotas['/nota/4'] = [Resposta(200, PDF + b'4')]
+    with open(saida / '2.pdf', 'r+b') as f:
+        f.truncate(100)
+    download_pdfs(csv, str(saida), max_workers=2)
+
+    assert [servidor.chamadas(f'/nota/{i}') for i in (1, 2, 3, 4)] == [1, 2, 1, 2]
+    assert (saida / '2.pdf').read_bytes() == PDF + b'2'
+    assert (saida / '4.pdf').read_bytes() == PDF + b'4'
+    manifesto = carregar_manifesto(str(saida / MANIFEST_FILENAME))
+    assert all(registro['status'] == 'ok' for registro in manifesto.values())
+
+
+def test_manifesto_ignora_linha_incompleta(tmp_path):
+    caminho = tmp_path / MANIFEST_FILENAME
+    caminho.write_text(json.dumps({'id': '1', 'status': 'ok', 'bytes': 10}) + '\n{"id": "2", "sta', encoding='utf-8')
+    assert list(carregar_manifesto(str(caminho))) == ['1']
@@ -0,0 +1,103 @@
+# tests/test_notas_scraper.py
+import os
+import re
+import pandas as pd
+import pytest
+import notas_scraper
+from notas_scraper import COLUNAS_RESULTADO, ENatjusHttpScraper, parse_pagina_resultados
+from servidor_local import Resposta, ServidorLocal
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CAMINHO = '/e-natjus/pesquisaPublica.php'
+TOTAL_PAGINAS = 7
+
+
+def _pagina(numero):
+    with open(os.path.join(FIXTURES, f'pesquisa_publica_pagina_{numero}.html'), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _ids_go(html):
+    # Linhas de GO com os dois links (visualizar e baixar), na ordem da página
+    ids = []
+    for linha in re.findall(r'<tr>(.*?)</tr>', html.split('id="tbody"')[1], re.S):
+        celulas = re.findall(r'<td[^>]*>(.*?)</td>', linha, re.S)
+        if celulas[4] == 'GO' and celulas[6].count('<a ') == 2:
+            ids.append(celulas[0])
+    return ids
+
+
+@pytest.fixture
+def pesquisa_publica():
+    """Servidor que só devolve resultados para o formulário de GO, como o navegador envia."""
+    def responder(campos):
+        if campos.get('txtNatResponsavel') != 'GO' or not campos.get('pagina', '').isdigit():
+            return Resposta(400, 'formulário inválido', tipo='text/plain')
+        pagina = int(campos['pagina'])
+        if not 1 <= pagina <= TOTAL_PAGINAS:
+            return Resposta(404, 'página inexistente', tipo='text/plain')
+        return Resposta(200, _pagina(pagina), tipo='text/html; charset=utf-8')
+
+    with ServidorLocal() as servidor:
+        servidor.rotas[CAMINHO] = responder
+        yield servidor
+
+
+def test_parse_pagina_resultados():
+    notas, maior_pagina = parse_pagina_resultados(_pagina(1), 'https://www.pje.jus.br/e-natjus/pesquisaPublica.php')
+
+    assert maior_pagina == 3
+    assert [nota['ID'] for nota in notas] == _ids_go(_pagina(1))
+    assert len(notas) == 3
+    primeira = notas[0]
+    assert list(primeira) == COLUNAS_RESULTADO
+    assert primeira['NatJus Responsável'] == 'GO'
+    assert primeira['Status'] == 'Finalizado'
+    assert primeira['Link Visualização'] == f"https://www.pje.jus.br/e-natjus/notaTecnica-dados.php?idNotaTecnica={primeira['ID']}"
+    assert primeira['Link Download'].startswith('https://www.pje.jus.br/e-natjus/notaTecnica-dados.php?output=pdf&token=nt:')
+
+
+def test_links_numericos_dentro_da_tabela_nao_contam_como_paginas():
+    html = re.sub(r'<td>(\d{5})</td>', r'<td><a href="notaTecnica-dados.php?idNotaTecnica=\1">\1</a></td>', _pagina(1))
+    assert '>47381</a>' in html
+
+    notas, maior_pagina = parse_pagina_resultados(html)
+
+    assert maior_pagina == 3
+    assert [nota['ID'] for nota in notas] == _ids_go(_pagina(1))
+
+
+def test_parse_ignora_outros_natjus_e_linhas_sem_link_de_download():
+    notas, _ = parse_pagina_resultados(_pagina(2))
+    assert [nota['ID'] for nota in notas] == _ids_go(_pagina(2))
+    assert all(nota['NatJus Responsável'] == 'GO' for nota in notas)
+    assert len(notas) == 3
+
+
+def test_coleta_todas_as_paginas_pela_janela_de_paginacao(pesquisa_publica):
+    scraper = ENatjusHttpScraper(pesquisa_publica.url + CAMINHO, workers=2, por_segundo=0)
+
+    resultados = scraper.coletar_dados()
+
+    requisicoes = pesquisa_publica.requisicoes
+    assert all(metodo == 'POST' for metodo, _, _ in requisicoes)
+    assert all(campos['txtNatResponsavel'] == 'GO' for _, _, campos in requisicoes)
+    # A página 1 só mostra 1..3; as páginas 4..7 aparecem nas janelas das páginas seguintes, e cada uma é pedida uma vez
+    assert sorted(int(campos['pagina']) for _, _, campos in requisicoes) == list(range(1, TOTAL_PAGINAS + 1))
+
+    esperados = []
+    for numero in range(1, TOTAL_PAGINAS + 1):
+        esperados.extend(i for i in _ids_go(_pagina(numero)) if i not in esperados)
+    assert [nota['ID'] for nota in resultados] == esperados
+    assert resultados[0]['Link Download'].startswith(pesquisa_publica.url + '/e-natjus/notaTecnica-dados.php?output=pdf')
+
+
+def test_executar_em_modo_http_grava_o_csv(pesquisa_publica, tmp_path, monkeypatch):
+    monkeypatch.setattr(notas_scraper, 'ENatjusHttpScraper', lambda url: ENatjusHttpScraper(url, workers=2, por_segundo=0))
+    caminho = tmp_path / 'notas.csv'
+
+    resultados = notas_scraper.executar('http', pesquisa_publica.url + CAMINHO, str(caminho))
+
+    df = pd.read_csv(caminho, dtype=str)
+    assert list(df.columns) == COLUNAS_RESULTADO
+    assert list(df['ID']) == [nota['ID'] for nota in resultados]
@@ -0,0 +1,52 @@
+# tests/test_reranker.py
+import sys
+import types
+import numpy as np
+import pytest
+import config
+from reranker import CrossEncoderReranker
+
+
+class CrossEncoderFalso:
+    chamadas = []
+
+    def __init__(self, model_name, max_length=None, device=None):
+        pass
+
+    def predict(self, pares, batch_size=32, show_progress_bar=None):
+        CrossEncoderFalso.chamadas.append((len(pares), batch_size))
+        return np.array([len(passagem) for _, passagem in pares], dtype=np.float32)
+
+
+@pytest.fixture
+def reranker(monkeypatch):
+    CrossEncoderFalso.chamadas = []
+    monkeypatch.setitem(sys.modules, 'sentence_transformers', types.SimpleNamespace(CrossEncoder=CrossEncoderFalso))
+    return CrossEncoderReranker('modelo-falso', max_chars=50, batch_size=16)
+
+
+def test_um_predict_por_requisicao_com_lote_interno_limitado(reranker):
+    pares = [(f"consulta {i % 7}", 'x' * (i % 40)) for i in range(100)]
+
+    scores = reranker.scores(pares)
+
+    assert CrossEncoderFalso.chamadas == [(100, 16)]
+    np.testing.assert_array_equal(scores, [i % 40 for i in range(100)])
+    assert reranker.stats()['pairs'] == 100
+
+
+def test_lote_menor_que_o_limite_usa_o_proprio_tamanho(reranker):
+    reranker.scores([('consulta', 'y' * 80)] * 5)
+    assert CrossEncoderFalso.chamadas == [(5, 5)]
+
+
+def test_passagens_sao_cortadas_e_custo_estimado(reranker):
+    assert reranker.estimar_ms(10) == 0.0
+    scores = reranker.scores([('consulta', 'z' * 500)])
+    assert scores[0] == 50
+    assert reranker.estimar_ms(10) > 0.0
+
+
+def test_tamanho_do_lote_padrao_vem_da_configuracao(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'sentence_transformers', types.SimpleNamespace(CrossEncoder=CrossEncoderFalso))
+    assert CrossEncoderReranker('modelo-falso').batch_size == config.RERANK_BATCH_SIZE
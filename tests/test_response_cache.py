@@ -0,0 +1,64 @@
+# tests/test_response_cache.py
+import numpy as np
+from response_cache import ResponseCache, response_cache_key
+
+CONFIG = {'temperature': 0.6}
+
+
+def _unitario(*valores):
+    vetor = np.asarray(valores, dtype=np.float32)
+    return vetor / np.linalg.norm(vetor)
+
+
+def test_chave_muda_com_o_namespace_do_snapshot():
+    a = response_cache_key('Dipirona', [3, 1], 'gemini', CONFIG, 'modelo:torch:abc:1')
+    b = response_cache_key('dipirona ', [3, 1], 'gemini', CONFIG, 'modelo:torch:abc:1')
+    c = response_cache_key('dipirona', [3, 1], 'gemini', CONFIG, 'modelo:torch:def:0')
+    assert a == b
+    assert a != c
+
+
+def test_quase_duplicata_nao_atravessa_snapshots():
+    cache = ResponseCache(10, 60, near_threshold=0.9)
+    chave = response_cache_key('insulina glargina', [1, 2], 'gemini', CONFIG, 'ns1')
+    cache.set(chave, 'resposta', [1, 2], _unitario(1, 0), 'ns1')
+
+    outra = response_cache_key('insulina glargina?', [1, 2], 'gemini', CONFIG, 'ns1')
+    assert cache.get(outra, [1, 2], _unitario(1, 0.01), 'ns1') == ('resposta', 'near_hit')
+    outra = response_cache_key('insulina glargina?', [1, 2], 'gemini', CONFIG, 'ns2')
+    assert cache.get(outra, [1, 2], _unitario(1, 0.01), 'ns2') == (None, 'miss')
+
+
+def test_cada_consulta_conta_uma_unica_vez():
+    cache = ResponseCache(10, 60, near_threshold=0.9)
+    cache.set('k1', 'resposta', [1, 2], _unitario(1, 0), 'ns')
+
+    assert cache.get('k1', [1, 2], _unitario(1, 0), 'ns')[1] == 'hit'
+    assert cache.get('k2', [1, 2], _unitario(1, 0.01), 'ns')[1] == 'near_hit'
+    assert cache.get('k3', [1, 2], _unitario(0, 1), 'ns')[1] == 'miss'
+    assert cache.get('k4')[1] == 'miss'
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['near_hits'], stats['misses']) == (1, 1, 2)
+
+
+def test_indice_de_quase_duplicatas_limitado_mesmo_com_um_unico_conjunto():
+    cache = ResponseCache(3, 60, near_threshold=0.99)
+    for i in range(20):
+        chave = response_cache_key(f'consulta {i}', [7, 8], 'gemini', CONFIG, 'ns1')
+        cache.set(chave, f'resposta {i}', [7, 8], np.eye(20, dtype=np.float32)[i], 'ns1')
+
+    assert sum(len(conjunto) for conjunto in cache._por_conjunto.values()) == 3
+    # As mais recentes continuam alcançáveis como quase-duplicatas
+    outra = response_cache_key('consulta 19?', [7, 8], 'gemini', CONFIG, 'ns1')
+    assert cache.get(outra, [7, 8], np.eye(20, dtype=np.float32)[19], 'ns1') == ('resposta 19', 'near_hit')
+
+
+def test_resposta_despejada_sai_do_indice_de_quase_duplicatas():
+    cache = ResponseCache(1, 60, near_threshold=0.9)
+    primeira = response_cache_key('dipirona', [1], 'gemini', CONFIG, 'ns1')
+    cache.set(primeira, 'resposta', [1], _unitario(1, 0), 'ns1')
+    cache._cache.clear()
+
+    assert cache.get(response_cache_key('dipirona?', [1], 'gemini', CONFIG, 'ns1'), [1], _unitario(1, 0), 'ns1') == (None, 'miss')
+    assert cache._por_conjunto == {}
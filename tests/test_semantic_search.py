@@ -0,0 +1,78 @@
+# tests/test_semantic_search.py
+import sys
+import zlib
+import types
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+import config
+import ingest
+from field_store import FieldStore
+from embedding_store import write_embedding_store
+from query_cache import QueryCache
+
+DIM = 16
+
+
+class EncoderFalso:
+    """Vetor determinístico por texto: a consulta igual ao texto de uma nota a encontra em primeiro lugar."""
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, textos, normalize_embeddings=True, batch_size=32):
+        vetores = np.stack([np.random.default_rng(zlib.crc32(t.encode())).random(DIM) for t in textos]).astype(np.float32)
+        return vetores / np.linalg.norm(vetores, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def servico(monkeypatch):
+    # O encoder vem sempre pelo parâmetro `model`; encoder_backends (sentence_transformers) não é necessário
+    monkeypatch.setitem(sys.modules, 'encoder_backends', types.SimpleNamespace(carregar_encoder=lambda *a, **k: EncoderFalso()))
+    return importlib.import_module('semantic_search_service')
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch, servico):
+    notas = pd.DataFrame({'id': list(range(20)), 'texto': [f"Diagnóstico: doença {i}\nConclusão: favorável {i}" for i in range(20)]})
+    fields = FieldStore.from_dataframe(notas)
+    store_dir = str(tmp_path / 'store')
+    write_embedding_store(store_dir, EncoderFalso().encode(fields.columns['texto_original']), fields, config.MODEL_NAME_SEMANTIC)
+    monkeypatch.setattr(servico, 'EMBEDDING_STORE_DIR', store_dir)
+    monkeypatch.setattr(servico, 'FAISS_INDEX_SAVE_ON_REBUILD', False)
+    monkeypatch.setattr(servico, 'EMBEDDING_STORE_WATCH_SECONDS', 0)
+    monkeypatch.setattr(servico, 'BM25_ENABLED', False)
+    monkeypatch.setattr(servico, 'RERANK_ENABLED', False)
+    return store_dir
+
+
+def _searcher(servico, query_cache):
+    searcher = servico.SemanticSearcher(index_type='flat', query_cache=query_cache, model=EncoderFalso())
+    assert searcher.is_ready
+    return searcher
+
+
+def test_busca_no_snapshot_antigo_nao_grava_sob_a_revisao_nova(servico, store_dir, tmp_path):
+    cache = QueryCache(100, 60)
+    antigo = _searcher(servico, cache)
+    consulta = antigo.field_store.columns['texto_original'][3]
+    assert antigo.search(consulta, top_k=3, mode='dense')[0]['id_linha'] == 3
+
+    ingest.ingest(ids_removidos=[antigo.field_store.columns['id_nota'][3]], store_dir=store_dir,
+                  index_type='flat', index_dir=str(tmp_path / 'faiss'))
+    novo = _searcher(servico, antigo.query_cache)
+    # Uma requisição que ainda estava com o searcher antigo termina depois do reload e grava no cache
+    assert antigo.search(consulta, top_k=3, mode='dense')[0]['id_linha'] == 3
+
+    assert 3 not in [item['id_linha'] for item in novo.search(consulta, top_k=3, mode='dense')]
+
+
+def test_cache_devolve_o_top_k_do_mesmo_snapshot(servico, store_dir):
+    cache = QueryCache(100, 60)
+    searcher = _searcher(servico, cache)
+    consulta = searcher.field_store.columns['texto_original'][5]
+
+    primeira = searcher.search(consulta, top_k=3, mode='dense')
+    assert searcher.search(consulta, top_k=3, mode='dense') == primeira
+    assert cache.stats()['hits'] >= 1
@@ -1,13 +1,23 @@
 # utils.py
 import re
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _compile_field_pattern(field_label):
+    # Compilado uma única vez por rótulo; antes o padrão era reconstruído a cada chamada.
+    return re.compile(
+        rf"(?i){re.escape(field_label)}\s*:\s*(.*?)(?=\n\s*[A-ZÀ-Úa-zÀ-ÖØ-öø-ÿ][\w\sÀ-ÖØ-öø-ÿ()]*\s*:|\Z)",
+        re.DOTALL,
+    )
+
 
 def extract_field_from_text(text_block, field_label):
 
     if not isinstance(text_block, str) or not isinstance(field_label, str):
         return "N/A"
     
-    pattern = rf"(?i){re.escape(field_label)}\s*:\s*(.*?)(?=\n\s*[A-ZÀ-Úa-zÀ-ÖØ-öø-ÿ][\w\sÀ-ÖØ-öø-ÿ()]*\s*:|\Z)"
-    match = re.search(pattern, text_block, re.DOTALL)
+    match = _compile_field_pattern(field_label).search(text_block)
     
     if match:
         value = match.group(1).strip()
@@ -16,3 +26,22 @@ def extract_field_from_text(text_block, field_label):
         return value if value else "N/A"
     return "N/A"
 
+
+def montar_texto_nota(row):
+    """
+    Monta o bloco de texto de uma nota técnica no mesmo formato usado para gerar os embeddings
+    (notebooks/data_engeneer.ipynb), a partir das colunas do DATASET_FINAL_TRATADO.
+    """
+    bloco = f"""
+    Diagnóstico: {row['diagnóstico']}.
+    Conclusão: {row['conclusão']}.
+    Justificativa: {row['conclusão justificada']}.
+    CID: {row['cid']}.
+    Princípio Ativo: {row['princípio ativo']}.
+    Nome Comercial: {row['nome comercial']}.
+    Descrição: {row['descrição']}.
+    Tipo da Tecnologia: {row['tipo da tecnologia']}.
+    Órgão: {row['órgão']}.
+    Serventia: {row['serventia']}.
+    """
+    return bloco.strip()